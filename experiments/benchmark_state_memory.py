@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Compares the memory consumed by the legacy (dictionary-based) state layout
+against the fixed-layout, slotted state representation used by Houston.
+"""
+from typing import Any, Callable, Dict, List, Tuple
+import argparse
+import gc
+import random
+import tracemalloc
+from timeit import default_timer as timer
+
+from houston.ardu.copter.state import State
+
+DESCRIPTION = "Measures the memory consumed by recorded states."
+
+
+class LegacyState(object):
+    """
+    Mimics the layout of states prior to the introduction of slots: each
+    variable is stored under a mangled field in a per-instance dictionary.
+    """
+    def __init__(self, **kwargs) -> None:
+        self.__time_offset = kwargs['time_offset']
+        for name in State.variables:
+            setattr(self, '__{}'.format(name), kwargs[name])
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description=DESCRIPTION)
+    p.add_argument('--states', type=int, default=50000,
+                   help='number of states that should be built.')
+    p.add_argument('--seed', type=int, default=0,
+                   help='seed for the random number generator.')
+    return p.parse_args()
+
+
+def generate_values(rng: random.Random, num_states: int
+                    ) -> List[Dict[str, Any]]:
+    all_values = []
+    for i in range(num_states):
+        values = {'time_offset': i * 0.01}
+        for name, variable in State.variables.items():
+            if variable.typ is bool:
+                values[name] = rng.random() > 0.5
+            elif variable.typ is str:
+                values[name] = rng.choice(['GUIDED', 'AUTO', 'LOITER'])
+            else:
+                values[name] = rng.uniform(-100.0, 100.0)
+        all_values.append(values)
+    return all_values
+
+
+def measure(build: Callable[..., Any],
+            all_values: List[Dict[str, Any]]
+            ) -> Tuple[int, float]:
+    """
+    Returns the number of bytes allocated to hold a state for each of the
+    given sets of values, together with the time taken to build them.
+    """
+    gc.collect()
+    time_start = timer()
+    states = [build(**values) for values in all_values]
+    time_taken = timer() - time_start
+    del states
+
+    gc.collect()
+    tracemalloc.start()
+    snapshot_before = tracemalloc.take_snapshot()
+    states = [build(**values) for values in all_values]
+    snapshot_after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = snapshot_after.compare_to(snapshot_before, 'filename')
+    size = sum(s.size_diff for s in stats)
+    del states
+    return size, time_taken
+
+
+def main() -> None:
+    args = parse_args()
+    rng = random.Random(args.seed)
+    all_values = generate_values(rng, args.states)
+
+    size_legacy, time_legacy = measure(LegacyState, all_values)
+    size_slotted, time_slotted = measure(State, all_values)
+
+    num_states = len(all_values)
+    tpl = "{}: {:.1f} bytes/state; {:.2f} us/state"
+    print(tpl.format('legacy', size_legacy / num_states,
+                     1e6 * time_legacy / num_states))
+    print(tpl.format('slotted', size_slotted / num_states,
+                     1e6 * time_slotted / num_states))
+    print("memory saving: {:.1f}%".format(
+        100 * (1 - size_slotted / size_legacy)))
+
+
+if __name__ == '__main__':
+    main()
@@ -3,7 +3,7 @@
 This script is used to record execution traces for each mission within a
 provided mission suite file.
 """
-from typing import List, Iterator, Callable, Dict, Any
+from typing import List, Iterator, Callable, Dict, Any, Optional
 import os
 import argparse
 import concurrent.futures
@@ -16,15 +16,17 @@ import signal, psutil
 import bugzoo
 import bugzoo.server
 import houston
+from houston.coverage import CoverageBitmap
 from houston.exceptions import ConnectionLostError, NoConnectionError
+from houston.journal import CampaignJournal
 
 import settings
+from convert_traces import UNIVERSE_OUTPUT
 
 logger = logging.getLogger('houston')  # type: logging.Logger
 logger.setLevel(logging.DEBUG)
 
 DESCRIPTION = "Builds trace files for a given set of missions."
-
 SandboxFactory = Callable[[bugzoo.BugZoo, bugzoo.Bug, houston.Mission], Iterator[houston.Sandbox]]
 
 
@@ -65,16 +67,44 @@ def parse_args():
                    help='number of traces to generate for each mission.')
     p.add_argument('--threads', type=int, default=1,
                    help='number of threads to use when building trace files.')
+    p.add_argument('--journal', type=str, default=None,
+                   help='path to the campaign journal (defaults to journal.jsonl in the output directory).')
     return p.parse_args()
 
 
+def save_universe(traces: List[houston.MissionTrace], dir_output: str) -> None:
+    """
+    Writes the line universe over which the coverage of a given set of
+    traces was recorded to the output directory, unless it has already been
+    written. The universe is needed to store the coverage of JSON traces as
+    bitmaps when those traces are converted by convert_traces.py.
+    """
+    fn_universe = os.path.join(dir_output, UNIVERSE_OUTPUT)
+    if os.path.exists(fn_universe):
+        return
+    for t in traces:
+        for command_trace in t.commands:
+            coverage = command_trace.coverage
+            if isinstance(coverage, CoverageBitmap):
+                fn_tmp = '{}.{}.tmp'.format(fn_universe, os.getpid())
+                with open(fn_tmp, 'w') as f:
+                    json.dump(coverage.universe.to_dict(), f)
+                os.replace(fn_tmp, fn_universe)
+                logger.info("saved line universe to file: %s", fn_universe)
+                return
+
+
 def trace(index: int,
           sandbox_factory: SandboxFactory,
           jsn_mission: Dict[str, Any],
           num_repeats: int,
           dir_output: str,
           collect_coverage: bool
-          ) -> None:
+          ) -> Optional[str]:
+    """
+    Builds the traces for a given mission, and returns the name of the file
+    to which they were written, or None if they could not be built.
+    """
     mission = houston.Mission.from_dict(json.loads(jsn_mission))
 
     # generate a (very-likely-to-be) "unique" ID for the mission
@@ -84,7 +114,7 @@ def trace(index: int,
     filename = os.path.join(dir_output, filename)
     if os.path.exists(filename):
         logger.info("skipping trace: %d ('%s' already exists)", index, filename)
-        return
+        return filename
 
     try:
         traces = []  # List[MissionTrace]
@@ -93,12 +123,16 @@ def trace(index: int,
                 t = sandbox.run_and_trace(mission.commands, collect_coverage)
                 traces.append(t)
 
+        if collect_coverage:
+            save_universe(traces, dir_output)
+
         logger.debug("saving traces to file: %s", filename)
         with open(filename, 'w') as f:
             json.dump({'mission': mission.to_dict(),
                        'traces': [t.to_dict() for t in traces]},
                       f)
         logger.debug("saved trace to file: %s", filename)
+        return filename
     except (ConnectionLostError, NoConnectionError):
         logger.error("SITL crashed during trace %d: %s", index, uid)
     except (KeyboardInterrupt, SystemExit):
@@ -138,12 +172,26 @@ def build_traces(client_bugzoo: bugzoo.Client,
                  num_threads: int,
                  num_repeats: int,
                  dir_output: str,
-                 collect_coverage: bool
+                 collect_coverage: bool,
+                 journal: CampaignJournal
                  ) -> None:
     futures = []
+
+    # record each trace in the journal (from the parent process) once built
+    def on_done(i: int, mission: houston.Mission, future) -> None:
+        if future.cancelled() or future.exception() is not None:
+            return
+        filename = future.result()
+        if filename is not None:
+            journal.record(i, mission, trace=filename)
+
     with concurrent.futures.ProcessPoolExecutor(num_threads) as e:
         try:
             for i, jsn_mission in enumerate(jsn_missions):
+                mission = houston.Mission.from_dict(json.loads(jsn_mission))
+                if journal.is_complete(i, mission):
+                    logger.info("skipping mission %d: already completed", i)
+                    continue
                 logger.debug("submitting mission %d", i)
                 sandbox_factory = functools.partial(build_sandbox,
                                                     client_bugzoo,
@@ -156,6 +204,7 @@ def build_traces(client_bugzoo: bugzoo.Client,
                                   num_repeats,
                                   dir_output,
                                   collect_coverage)
+                future.add_done_callback(functools.partial(on_done, i, mission))
                 futures.append(future)
 
             logger.debug("submitted all missions")
@@ -193,6 +242,8 @@ if __name__ == '__main__':
         jsn = json.load(f)
     jsn_missions = [json.dumps(m) for m in jsn]
 
-    with bugzoo.server.ephemeral() as client_bugzoo:
+    fn_journal = args.journal or os.path.join(args.output, 'journal.jsonl')
+    with bugzoo.server.ephemeral() as client_bugzoo, \
+            CampaignJournal(fn_journal) as journal:
         snapshot = client_bugzoo.bugs[args.snapshot]
-        build_traces(client_bugzoo, snapshot, jsn_missions, num_threads, num_repeats, args.output, collect_coverage)
+        build_traces(client_bugzoo, snapshot, jsn_missions, num_threads, num_repeats, args.output, collect_coverage, journal)
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
-__all__ = ['compare_traces']
+__all__ = ['compare_traces', 'GroundTruthEnvelope']
 
-from typing import Tuple, List, Tuple, Set, Type
+from typing import Tuple, List, Tuple, Set, Type, Optional, Sequence
 import argparse
 import logging
 import json
@@ -15,6 +15,8 @@ from houston import System
 from houston.exceptions import HoustonException
 from houston import Mission, MissionTrace, State
 from houston.state import Variable
+from houston.tracefile import is_trace_file, read_traces, open_traces, \
+    LazyMissionTrace
 
 logger = logging.getLogger("houston")  # type: logging.Logger
 logger.setLevel(logging.DEBUG)
@@ -78,9 +80,122 @@ def obtain_var_names(cls_state: Type[State]) -> Tuple[Set[str], Set[str]]:
 # simplify each trace to a sequence of states, representing the state
 # of the system after the completion (or non-completion) of each command.
 def simplify_trace(t: MissionTrace) -> Tuple[State, ...]:
+    if isinstance(t, LazyMissionTrace):
+        return t.last_states()
     return tuple(ct.states[-1] for ct in t.commands)
  
 
+def final_values(trace: MissionTrace,
+                 names: Sequence[str]
+                 ) -> np.ndarray:
+    """
+    Returns a (commands x variables) array that holds the value of each of
+    the given variables at the end of each command within a trace. Values
+    for commands that have no states are NaN.
+    """
+    if isinstance(trace, LazyMissionTrace):
+        states = trace.last_states()
+    else:
+        states = tuple(ct.states[-1] if len(ct.states) else None
+                       for ct in trace.commands)
+    values = np.full((len(states), len(names)), np.nan)
+    for i, state in enumerate(states):
+        if state is not None:
+            values[i] = [float(state[var]) for var in names]
+    return values
+
+
+class GroundTruthEnvelope(object):
+    """
+    Describes the range of values taken by each continuous variable at the
+    end of each command across a set of ground truth traces. The final
+    states of all truth traces are stacked into a single
+    (traces x commands x variables) array, from which the envelope is
+    computed once, allowing any number of candidate traces to be compared
+    against the ground truth in a single broadcast operation.
+    """
+    def __init__(self,
+                 truth: List[MissionTrace],
+                 names: Optional[Sequence[str]] = None
+                 ) -> None:
+        """
+        Parameters:
+            truth: a non-empty set of ground truth traces that execute an
+                identical sequence of commands.
+            names: the names of the continuous variables that should be
+                compared. Defaults to all continuous variables of the system.
+        """
+        assert truth
+        if names is None:
+            _, names = obtain_var_names(SYSTEM.state)
+        self.names = tuple(sorted(names))
+        self.commands = [ct.command for ct in truth[0].commands]
+        all_vars = SYSTEM.state.variables
+        self.noise = np.array([all_vars[var].noise or 0.0
+                               for var in self.names])
+        self.values = np.stack([final_values(t, self.names) for t in truth])
+        self.lo = self.values.min(axis=0)
+        self.hi = self.values.max(axis=0)
+        self.spread = self.hi - self.lo
+        self.mid = self.hi - (self.spread / 2)
+
+    def is_consistent(self,
+                      tol: float = 2.0,
+                      names: Optional[Sequence[str]] = None
+                      ) -> bool:
+        """
+        Determines whether the spread of each of the given variables (or of
+        all variables) across the truth traces lies within a given multiple
+        of the noise of that variable.
+        """
+        columns = self.__columns(names)
+        tolerance = self.noise[columns] * tol
+        ok = self.spread[:, columns] <= tolerance
+        if ok.all():
+            return True
+        i, j = np.argwhere(~ok)[0]
+        logger.debug("difference for parameter [%s] exceeds threshold (+/-%f): |%f|",  # noqa: pycodestyle
+                     self.names[columns[j]], tolerance[j],
+                     self.spread[i, columns[j]])
+        return False
+
+    def __columns(self, names: Optional[Sequence[str]]) -> np.ndarray:
+        if names is None:
+            return np.arange(len(self.names))
+        return np.array([self.names.index(var) for var in names
+                         if var in self.names], dtype=np.intp)
+
+    def contains(self,
+                 candidates: Sequence[MissionTrace],
+                 tolerance_factor: float = 1.0
+                 ) -> np.ndarray:
+        """
+        Determines, for each of a given set of candidate traces, whether the
+        final value of each variable after each command lies within a given
+        multiple of the noise of that variable from the middle of the
+        envelope. Candidates that execute a different sequence of commands
+        to the ground truth are never contained.
+
+        Returns:
+            a boolean array with an entry for each candidate.
+        """
+        result = np.zeros(len(candidates), dtype=bool)
+        same = [i for i, c in enumerate(candidates)
+                if [ct.command for ct in c.commands] == self.commands]
+        if len(same) < len(candidates):
+            logger.debug("%d candidate traces don't have same commands as the truth",  # noqa: pycodestyle
+                         len(candidates) - len(same))
+        if not same:
+            return result
+        actual = np.stack([final_values(candidates[i], self.names)
+                           for i in same])
+        # equivalent to np.isclose(mid, actual, rtol=1e-05, atol=tolerance)
+        tolerance = self.noise * tolerance_factor
+        close = np.abs(self.mid - actual) <= tolerance + 1e-05 * np.abs(actual)
+        result[same] = close.reshape(len(same), -1).all(axis=1)
+        return result
+
+
 def is_truth_valid(truth: List[MissionTrace],
                    tol: float = 2.0) -> bool:
     """
@@ -95,14 +210,23 @@ def is_truth_valid(truth: List[MissionTrace],
     Returns:
         True if the ground truth is valid, False otherwise.
     """
+    return _is_truth_valid(truth, tol) is not None
 
+
+def _is_truth_valid(truth: List[MissionTrace],
+                    tol: float = 2.0
+                    ) -> Optional[GroundTruthEnvelope]:
+    """
+    Returns the envelope of a set of ground truth traces if those traces are
+    valid, or None if they are not.
+    """
     if not truth:
         logger.debug("ground truth set must not be empty.")
-        return False
+        return None
 
     if not truth[0].commands:
         logger.debug("ground truth execution must perform at least one command.")
-        return False
+        return None
 
     # ensure that all traces within the ground truth set execute an identical
     # sequence of commands
@@ -110,47 +234,12 @@ def is_truth_valid(truth: List[MissionTrace],
         for i, trace in enumerate(truth):
             logger.debug("trace %d: #%d commands", i, len(trace.commands))
         logger.debug("ground truth traces have inconsistent structure")
-        return False
+        return None
 
-    state_cls = truth[0].commands[0].states[0].__class__
-#    categorical, continuous = obtain_var_names(state_cls)
-    simple_truth = [simplify_trace(t) for t in truth]
-
-    # check that categorical variable values are consistent between ground
-    # truth traces
-    def categorical_eq(var: str,
-                       state_traces: List[Tuple[State]]) -> bool:
-        collapse = lambda st: tuple(s[var] for s in st)
-        expected = collapse(state_traces[0])
-        return all(collapse(st) == expected for st in state_traces)
-
-    def all_categoricals_eq(state_traces: List[Tuple[State]]) -> bool:
-        return all(categorical_eq(v, state_traces) for v in categorical)
-
-#    if not all_categoricals_eq(simple_truth):
-#        logger.debug("failed to compare traces: inconsistent categorical values within ground truth.")
-#        return False
-
-    num_commands = len(truth[0].commands)
-    size_truth = len(truth)
-    all_vars = SYSTEM.state.variables
-    for i in range(num_commands):
-        for var in continuous:
-            vals = np.array([float(simple_truth[j][i][var])
-                             for j in range(size_truth)])
-            max_diff = max(vals) - min(vals)
-            tolerance = (all_vars[var].noise or 0.0) * tol
-            is_nearly_eq = np.isclose(max_diff, 0.0,
-                                      rtol=1e-05, atol=tolerance, equal_nan=False)
-            # logger.debug("%d:%s (%.9f +/-%.9f)", i, var, mid, tolerance)
-            logger.debug("parameter [%s]: |%f|",
-                         var, max_diff)
-            if not is_nearly_eq:
-                logger.debug("difference for parameter [%s] exceeds threshold (+/-%f)",
-                             var, tolerance)
-                return False
-
-    return True
+    envelope = GroundTruthEnvelope(truth)
+    if not envelope.is_consistent(tol, continuous):
+        return None
+    return envelope
 
 
 def matches_ground_truth(
@@ -177,50 +266,26 @@ def matches_ground_truth(
         True if candidate trace is approximately equivalent to the ground
         truth.
     """
+    return matches_ground_truth_batch([candidate], truth, tolerance_factor)[0]
 
-    truth = [t for t in truth if t.commands]
-    if not is_truth_valid(truth):
-        return False
-
-    # determine the sets of categorical and continuous variables
-    state_cls = truth[0].commands[0].states[0].__class__
-    categorical, continuous = obtain_var_names(state_cls)
-
-    simple_candidate = simplify_trace(candidate)
-    simple_truth = [simplify_trace(t) for t in truth]
-
-    # check if the candidate trace executes a different sequence of commands
-    # to the ground truth
-    if not traces_contain_same_commands([candidate, truth[0]]):
-        logger.debug("candidate trace doesn't have same commands as the truth")
-        return False
 
-    # use the ground truth to build a distribution of expected values for
-    # each continuous variable after the completion of each command
-    num_commands = len(truth[0].commands)
-    size_truth = len(truth)
-    all_vars = SYSTEM.state.variables
-    for i in range(num_commands):
-        for var in continuous:
-            vals = np.array([float(simple_truth[j][i][var])
-                             for j in range(size_truth)])
-            actual = simple_candidate[i][var]
-            mid = max(vals) - ((max(vals) - min(vals)) / 2)
-#            tolerance = (max(vals) - min(vals)) / 2
-#            tolerance *= tolerance_factor
-            tolerance = (all_vars[var].noise or 0.0) * tolerance_factor
-            diff = abs(mid - actual)
-            is_nearly_eq = np.isclose(mid, actual,
-                                      rtol=1e-05, atol=tolerance, equal_nan=False)
-            # logger.debug("%d:%s (%.9f +/-%.9f)", i, var, mid, tolerance)
-            logger.debug("parameter [%s]: |%f - %f| = %f",
-                         var, mid, actual, diff)
-            if not is_nearly_eq:
-                logger.debug("difference for parameter [%s] exceeds threshold (+/-%f)",
-                             var, all_vars[var].noise)
-                return False
+def matches_ground_truth_batch(
+        candidates: Sequence[MissionTrace],
+        truth: List[MissionTrace],
+        tolerance_factor: float = 1.0
+        ) -> List[bool]:
+    """
+    Determines, for each of a given set of candidate traces, whether that
+    trace is approximately equivalent to a set of ground truth traces for the
+    same mission. The envelope of the ground truth is computed only once.
 
-    return True
+    See: `matches_ground_truth`
+    """
+    truth = [t for t in truth if t.commands]
+    envelope = _is_truth_valid(truth)
+    if envelope is None:
+        return [False] * len(candidates)
+    return envelope.contains(candidates, tolerance_factor).tolist()
 
 
 def setup_logging(verbose: bool = False) -> None:
@@ -240,9 +305,24 @@ def parse_args():
     return p.parse_args()
 
 
-def load_file(fn: str) -> Tuple[Mission, List[MissionTrace]]:
+def load_file(fn: str,
+              lazy: bool = False
+              ) -> Tuple[Mission, List[MissionTrace]]:
+    """
+    Loads the mission and traces stored in a given trace file. If lazy is
+    True and the file uses the binary trace format, the file is memory-mapped
+    and the states of each trace are only decoded upon access.
+    """
     system = System.get_by_name('arducopter')
     try:
+        if is_trace_file(fn):
+            if lazy:
+                reader = open_traces(fn, SYSTEM)
+                metadata, traces = reader.metadata, list(reader.traces)
+            else:
+                metadata, traces = read_traces(fn, SYSTEM)
+            mission = Mission.from_dict(metadata['mission'])
+            return (mission, traces)
         with open(fn, 'r') as f:
             jsn = json.load(f)
             mission = Mission.from_dict(jsn['mission'])
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Converts JSON trace files, produced by build_traces.py and ground_truth.py,
+into the compact binary columnar trace format.
+"""
+from typing import List, Optional
+import argparse
+import concurrent.futures
+import json
+import logging
+import os
+import sys
+
+import houston
+from houston import System
+from houston.coverage import LineUniverse
+from houston.tracefile import convert_json_traces
+
+logger = logging.getLogger('houston')  # type: logging.Logger
+logger.setLevel(logging.DEBUG)
+
+DESCRIPTION = "Converts JSON trace files into the binary trace format."
+
+# the file, within a trace directory, that describes the line universe of
+# the snapshot that produced its traces (written by build_traces.py)
+UNIVERSE_OUTPUT = "universe.json"
+
+
+def setup_logging(verbose: bool = False) -> None:
+    log_to_stdout = logging.StreamHandler()
+    log_to_stdout.setLevel(logging.DEBUG if verbose else logging.INFO)
+    logging.getLogger('houston').addHandler(log_to_stdout)
+    logging.getLogger('experiment').addHandler(log_to_stdout)
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description=DESCRIPTION)
+    p.add_argument('input', type=str,
+                   help='path to a directory of JSON trace files.')
+    p.add_argument('output', type=str,
+                   help='the directory to which the converted traces should be written.')  # noqa: pycodestyle
+    p.add_argument('--compress', action='store_true',
+                   help='compresses the columns of each trace.')
+    p.add_argument('--universe', type=str, default=None,
+                   help='path to a JSON description of the line universe of the snapshot (defaults to the universe.json written by build_traces.py to the input directory, if any); if given, coverage is stored as bitmaps over that universe.')  # noqa: pycodestyle
+    p.add_argument('--threads', type=int, default=1,
+                   help='number of processes to use for conversion.')
+    p.add_argument('--verbose', action='store_true',
+                   help='increases logging verbosity')
+    return p.parse_args()
+
+
+def convert(fn_json: str,
+            dir_output: str,
+            compress: bool,
+            fn_universe: Optional[str] = None
+            ) -> str:
+    system = System.get_by_name('arducopter')
+    name = os.path.splitext(os.path.basename(fn_json))[0]
+    fn_binary = os.path.join(dir_output, '{}.htrace'.format(name))
+    universe = None
+    if fn_universe:
+        with open(fn_universe, 'r') as f:
+            universe = LineUniverse.from_dict(json.load(f))
+    convert_json_traces(fn_json, fn_binary, system, compress, universe)
+    return fn_binary
+
+
+def main() -> None:
+    args = parse_args()
+    setup_logging(verbose=args.verbose)
+    dir_input = args.input
+    dir_output = args.output
+
+    if not os.path.exists(dir_input):
+        logger.error("trace directory not found: %s", dir_input)
+        sys.exit(1)
+    os.makedirs(dir_output, exist_ok=True)
+
+    fn_universe = args.universe
+    if fn_universe is None:
+        fn_universe = os.path.join(dir_input, UNIVERSE_OUTPUT)
+        if not os.path.exists(fn_universe):
+            fn_universe = None
+
+    filenames = [os.path.join(dir_input, fn) for fn in os.listdir(dir_input)
+                 if fn.endswith('.json') and fn != UNIVERSE_OUTPUT]
+    with concurrent.futures.ProcessPoolExecutor(args.threads) as e:
+        futures = {e.submit(convert, fn, dir_output, args.compress,
+                            fn_universe): fn
+                   for fn in filenames}
+        for future in concurrent.futures.as_completed(futures):
+            fn = futures[future]
+            try:
+                logger.info("converted %s to %s", fn, future.result())
+            except Exception:
+                logger.exception("failed to convert trace file: %s", fn)
+
+
+if __name__ == '__main__':
+    main()
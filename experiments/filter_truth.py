@@ -38,7 +38,8 @@ def parse_args():
 
 
 def validate_truth(dir_oracle: str, fn_trace: str) -> bool:
-    mission, oracle_traces = load_traces_file(os.path.join(dir_oracle, fn_trace))
+    mission, oracle_traces = load_traces_file(os.path.join(dir_oracle, fn_trace),
+                                              lazy=True)
     oracle_traces = [t for t in oracle_traces if t.commands]
     return is_truth_valid(oracle_traces, 3), fn_trace
 
@@ -46,7 +47,8 @@ def validate_truth(dir_oracle: str, fn_trace: str) -> bool:
 def filter_truth_traces(dir_oracle: str,
                         threads: int) -> List[str]:
     trace_filenames = \
-        [fn for fn in os.listdir(dir_oracle) if fn.endswith('.json')]
+        [fn for fn in os.listdir(dir_oracle)
+         if fn.endswith('.json') or fn.endswith('.htrace')]
     valid_traces = []
     futures = []
     with concurrent.futures.ProcessPoolExecutor(threads) as e:
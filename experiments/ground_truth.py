@@ -1,6 +1,5 @@
-from typing import Iterator, Tuple, Set, List, Dict, Any, Optional, Type
-from uuid import UUID, uuid4
-import concurrent.futures
+from typing import Iterator, Tuple, Set, List, Dict, Any, Optional
+from uuid import UUID
 import argparse
 import functools
 import contextlib
@@ -11,7 +10,6 @@ import sys
 import os
 import signal
 import psutil
-import time
 import hashlib
 
 from ruamel.yaml import YAML
@@ -22,14 +20,17 @@ import houston
 from bugzoo import Client as BugZooClient
 from bugzoo import BugZoo as BugZooDaemon
 from bugzoo.core import FileLineSet
-from houston import System
 from houston.mission import Mission
 from houston.trace import CommandTrace, MissionTrace
+from houston.coverage_index import CoverageIndex
+from houston.tracefile import is_trace_file, open_traces
 from houston.ardu.copter import ArduCopter
 
 from compare_traces import load_file as load_traces_file
 from compare_traces import matches_ground_truth
 from build_traces import build_sandbox
+from mutant_scheduler import MutantScheduler, SnapshotBuilder, \
+    translation_units
 from filter_truth import filter_truth_traces, VALID_LIST_OUTPUT
 from hash_mutants import mutation_to_uid
 
@@ -38,12 +39,7 @@ logger.setLevel(logging.DEBUG)
 
 DESCRIPTION = "Builds a ground truth dataset."
 
-
-class FailedToCreateMutantSnapshot(houston.exceptions.HoustonException):
-    """
-    Thrown when this script fails to create a BugZoo snapshot for a
-    mutant.
-    """
+COVERAGE_INDEX_OUTPUT = "coverage_index.npz"
 
 
 @attr.s
@@ -103,187 +99,139 @@ def parse_args():
     p.add_argument('--verbose', action='store_true',
                    help='increases logging verbosity')
     p.add_argument('--threads', type=int, default=1,
-                   help='number of threads to use when building trace files.')
+                   help='number of missions that may be executed in parallel.')
+    p.add_argument('--builds', type=int, default=1,
+                   help='number of mutant snapshots that may be built in parallel.')
     p.add_argument('--coverage', action='store_true', default=False,
                    help='collect coverage info')
     return p.parse_args()
 
 
-@contextlib.contextmanager
-def build_mutant_snapshot(bz: BugZooClient,
-                          snapshot: bugzoo.Bug,
-                          coverage: bool,
-                          diff: str
-                          ) -> Iterator[bugzoo.Bug]:
-    # generate a name for the snapshot and image
-    uuid = uuid4().hex[:64]
-    name_image = "houston-mutant:{}".format(uuid)
-
-    lines = diff.split('\n')
-
-    # create a description of the mutant snapshot
-    mutant = bugzoo.Bug(name=name_image,
-                        image=name_image,
-                        dataset='houston-mutants',
-                        program=snapshot.program,
-                        source=None,
-                        source_dir=snapshot.source_dir,
-                        languages=snapshot.languages,
-                        tests=snapshot.tests,
-                        compiler=snapshot.compiler,
-                        instructions_coverage=snapshot.instructions_coverage)
-
-    try:
-
-        # create and store the Docker image
-        patch = bugzoo.Patch.from_unidiff(diff)
-        container = None
-        try:
-            container = bz.containers.provision(snapshot)
-            if not bz.containers.patch(container, patch):
-                logger.error("Failed to patch %s", str(patch))
-                m = "failed to patch using diff: {}".format(diff)
-                raise FailedToCreateMutantSnapshot(m)
-
-            logger.debug("patched using diff: %s", diff)
-            if coverage:
-                build_attempt = bz.containers.instrument(container)
-            else:
-                build_attempt = bz.containers.build(container)
-            if build_attempt and not build_attempt.successful:
-                logger.error("build failure:\n%s",
-                             build_attempt.response.output)
-                m = "failed to build mutant: {}".format(diff)
-                raise FailedToCreateMutantSnapshot(m)
-            bz.containers.persist(container, name_image)
-        finally:
-            if container:
-                del bz.containers[container.uid]
-
-        # register the snapshot
-        bz.bugs.register(mutant)
-
-        yield mutant
-
-    # ensure that all resources are freed
-    finally:
-        if mutant.name in bz.bugs:
-            del bz.bugs[mutant.name]
-        if bz.docker.has_image(name_image):
-            bz.docker.delete_image(name_image)
-
-
-def touches_the_lines(patch: bugzoo.core.Patch,
-                      oracle_traces: List[MissionTrace]
-                      ) -> bool:
-    for oracle in oracle_traces:
-        if not oracle.commands:
-            continue
-        break
-    coverage_info = [command.coverage for command in oracle.commands if command.coverage]
-    if not coverage_info:
-        # trace doesn't have coverage info
-        raise Exception("Trace doesn't have coverage info")
-
-
-    modified_lines = {}
+def modified_lines(patch: bugzoo.core.Patch) -> FileLineSet:
+    """
+    Returns the set of lines that are inserted or deleted by a given patch.
+    """
+    lines = {}  # type: Dict[str, Set[int]]
     for fp in patch.file_patches:
         filename = fp.new_fn
-        lines = set([])
         for hunks in fp.hunks:
             for l in hunks.lines:
                 if isinstance(l, bugzoo.InsertedLine) or\
                     isinstance(l, bugzoo.DeletedLine):
-                    lines.add(l.number)
-        modified_lines[filename] = lines
-
-    fileline_set = FileLineSet(modified_lines)
-    for coverage in coverage_info:
-        if fileline_set.intersection(coverage).files:
-            # line is covered
-            return True
-    return False
-
-
-def process_mutation(system: Type[System],
-                     client_bugzoo: BugZooClient,
-                     snapshot_orig: bugzoo.Bug,
-                     trace_filenames: List[str],
-                     dir_mutant_traces: str,
-                     coverage: bool,
-                     diff: str
-                     ) -> Optional[DatabaseEntry]:
-    bz = client_bugzoo
-    sandbox_cls = system.sandbox
-    patch = bugzoo.Patch.from_unidiff(diff)
-
-    inconsistent_results = []
-    consistent_results = []
-
-    # build an ephemeral image for the mutant
-    try:
-        with build_mutant_snapshot(client_bugzoo, snapshot_orig, coverage, diff) as snapshot:
+                    lines.setdefault(filename, set()).add(l.number)
+    return FileLineSet(lines)
 
-            def obtain_trace(mission: houston.Mission) -> MissionTrace:
-                jsn_mission = json.dumps(mission.to_dict())  # FIXME hack
-                with build_sandbox(client_bugzoo, snapshot, jsn_mission, False) as sandbox:
-                    return sandbox.run_and_trace(mission.commands, coverage)
 
-            for fn_trace in trace_filenames:
-                logger.debug("evaluating oracle trace: %s", fn_trace)
-                mission, oracle_traces = load_traces_file(fn_trace)
-                try:
-                    if (coverage and not touches_the_lines(patch, oracle_traces)):
-                        logger.debug("This mission is not valid: %s", mission.commands)
-                        continue
-                except:
-                    logger.debug("NO COV: %s", fn_trace)
-                    continue
-
-                # write mutant trace to file
-                h = hashlib.sha256()
-                h.update(diff.encode())
-                h.update(fn_trace.encode())
-                identifier = h.hexdigest()
-                logger.debug("id %s", identifier)
-                fn_trace_mut_rel = "{}.json".format(identifier)
-                fn_trace_mut = os.path.join(dir_mutant_traces, fn_trace_mut_rel)
- 
-                try:
-                    if os.path.exists(fn_trace_mut):
-                        logger.info("Already evaluated! %s", fn_trace_mut_rel)
-                        _, trace_mutant = load_traces_file(fn_trace_mut)
-                    else:
-                        trace_mutant = obtain_trace(mission)
-                        jsn = {'mission': mission.to_dict(),
-                               'traces': [trace_mutant.to_dict()]}
-                        with open(fn_trace_mut, 'w') as f:
-                            json.dump(jsn, f)
-                except:
-                    logger.exception("failed to build trace %s for mutant: %s", fn_trace, diff)
-                    continue
+def load_coverage_index(dir_oracle: str,
+                        trace_filenames: List[str]
+                        ) -> CoverageIndex:
+    """
+    Loads the coverage index for a given set of oracle trace files from the
+    oracle directory, or builds (and saves) that index if it doesn't exist
+    or was built for a different set of trace files.
+    """
+    fn_index = os.path.join(dir_oracle, COVERAGE_INDEX_OUTPUT)
+    if os.path.exists(fn_index):
+        index = CoverageIndex.load(fn_index)
+        if set(index.missions) == set(trace_filenames):
+            logger.info("loaded coverage index: %s", fn_index)
+            return index
+        logger.info("coverage index is out of date: %s", fn_index)
+
+    def traces() -> Iterator[Tuple[str, List[MissionTrace]]]:
+        for fn_trace in trace_filenames:
+            fn = os.path.join(dir_oracle, fn_trace)
+            # binary trace files are unmapped as soon as they are indexed
+            with contextlib.ExitStack() as stack:
                 try:
-                    if not matches_ground_truth(trace_mutant, oracle_traces):
-                        logger.info("found an acceptable mutant!")
-                        inconsistent_results.append((fn_trace, fn_trace_mut))
+                    if is_trace_file(fn):
+                        reader = open_traces(fn, ArduCopter)
+                        stack.enter_context(reader)
+                        oracle_traces = list(reader.traces)
                     else:
-                        logger.debug("mutant is not sufficiently different for given mission.")
-                        consistent_results.append((fn_trace, fn_trace_mut))
-                except houston.exceptions.HoustonException as e:
-                    logger.exception("failed to check matching of traces %s", e)
+                        _, oracle_traces = load_traces_file(fn)
+                except Exception:
+                    logger.exception("failed to load oracle trace: %s",
+                                     fn_trace)
                     continue
+                yield (fn_trace, oracle_traces)
+
+    logger.info("building coverage index for %d oracle traces",
+                len(trace_filenames))
+    index = CoverageIndex.build(traces())
+    index.save(fn_index)
+    logger.info("saved coverage index: %s", fn_index)
+    return index
+
+
+def evaluate_trace(client_bugzoo: BugZooClient,
+                   dir_mutant_traces: str,
+                   coverage: bool,
+                   snapshot: bugzoo.Bug,
+                   diff: str,
+                   fn_trace: str
+                   ) -> Optional[Tuple[bool, str, str]]:
+    """
+    Evaluates the mission of a given oracle trace file against the snapshot
+    for a given mutant.
+
+    Returns:
+        a tuple of the form (inconsistent, fn_oracle, fn_mutant), where
+        inconsistent indicates whether the mutant trace is inconsistent with
+        the oracle traces, and fn_mutant is the file to which the mutant
+        trace was written, or None if the mission could not be evaluated.
+    """
+    logger.debug("evaluating oracle trace: %s", fn_trace)
+    mission, oracle_traces = load_traces_file(fn_trace)
+
+    # write mutant trace to file
+    h = hashlib.sha256()
+    h.update(diff.encode())
+    h.update(fn_trace.encode())
+    identifier = h.hexdigest()
+    logger.debug("id %s", identifier)
+    fn_trace_mut_rel = "{}.json".format(identifier)
+    fn_trace_mut = os.path.join(dir_mutant_traces, fn_trace_mut_rel)
 
-    except FailedToCreateMutantSnapshot:
-        logger.error("failed to build snapshot for mutant: %s", diff)
-    except Exception:
-        logger.exception("failed to obtain data for mutant: %s", diff)
+    try:
+        if os.path.exists(fn_trace_mut):
+            logger.info("Already evaluated! %s", fn_trace_mut_rel)
+            _, trace_mutant = load_traces_file(fn_trace_mut)
+        else:
+            jsn_mission = json.dumps(mission.to_dict())  # FIXME hack
+            with build_sandbox(client_bugzoo, snapshot, jsn_mission, False) as sandbox:
+                trace_mutant = sandbox.run_and_trace(mission.commands, coverage)
+            jsn = {'mission': mission.to_dict(),
+                   'traces': [trace_mutant.to_dict()]}
+            with open(fn_trace_mut, 'w') as f:
+                json.dump(jsn, f)
     except (houston.exceptions.NoConnectionError, houston.exceptions.ConnectionLostError):
         logger.error("mutant resulted in crash")
-    finally:
-        if inconsistent_results or consistent_results:
-            return DatabaseEntry(diff, tuple(inconsistent_results), tuple(consistent_results))
+        return None
+    except Exception:
+        logger.exception("failed to build trace %s for mutant: %s", fn_trace, diff)
+        return None
+    try:
+        if not matches_ground_truth(trace_mutant, oracle_traces):
+            logger.info("found an acceptable mutant!")
+            return (True, fn_trace, fn_trace_mut)
         else:
-            return None
+            logger.debug("mutant is not sufficiently different for given mission.")
+            return (False, fn_trace, fn_trace_mut)
+    except houston.exceptions.HoustonException as e:
+        logger.exception("failed to check matching of traces %s", e)
+        return None
+
+
+def to_database_entry(diff: str,
+                      results: List[Optional[Tuple[bool, str, str]]]
+                      ) -> Optional[DatabaseEntry]:
+    results = [r for r in results if r is not None]
+    if not results:
+        return None
+    inconsistent_results = tuple((o, t) for (i, o, t) in results if i)
+    consistent_results = tuple((o, t) for (i, o, t) in results if not i)
+    return DatabaseEntry(diff, inconsistent_results, consistent_results)
 
 
 def main():
@@ -295,9 +243,10 @@ def main():
     dir_oracle = args.oracle
     fn_output_database = os.path.join(dir_output, 'database.yml')
     num_threads = args.threads
-    system = ArduCopter
+    num_builds = args.builds
 
     assert num_threads >= 1
+    assert num_builds >= 1
 
     # ensure that the output directory exists
     os.makedirs(args.output, exist_ok=True)
@@ -327,53 +276,65 @@ def main():
         trace_filenames = filter_truth_traces(dir_oracle)
         with open(filtered_traces_fn, 'w') as f:
             YAML().dump(trace_filenames, f)
-    trace_filenames = [os.path.join(dir_oracle, fn) for fn in trace_filenames]
     logger.info("Total number of %d valid truth", len(trace_filenames))
 
+    # when collecting coverage, each mutant is only evaluated against those
+    # missions that cover at least one of its modified lines
+    index = None  # type: Optional[CoverageIndex]
+    if args.coverage:
+        index = load_coverage_index(dir_oracle, trace_filenames)
+
+    def relevant_traces(diff: str) -> List[str]:
+        filenames = trace_filenames
+        if index is not None:
+            patch = bugzoo.Patch.from_unidiff(diff)
+            filenames = index.missions_covering(modified_lines(patch))
+        return [os.path.join(dir_oracle, fn) for fn in filenames]
+
+    # mutants that modify the same translation units are built one after
+    # another, so that they may reuse the same builder container
+    mutants = []  # type: List[Tuple[str, List[str]]]
+    for diff in sorted(diffs, key=translation_units):
+        fns_trace = relevant_traces(diff)
+        if not fns_trace:
+            logger.debug("no missions cover mutant: %s", diff)
+            continue
+        mutants.append((diff, fns_trace))
+
     db_entries = []  # type: List[DatabaseEntry]
-    futures = []
     with bugzoo.server.ephemeral() as client_bugzoo:
-        with concurrent.futures.ProcessPoolExecutor(max_workers=num_threads) as executor:
-            try:
-                snapshot = client_bugzoo.bugs[name_snapshot]
-                process = functools.partial(process_mutation,
-                                            system,
-                                            client_bugzoo,
-                                            snapshot,
-                                            trace_filenames,
-                                            dir_output,
-                                            args.coverage)
-                for diff in diffs:
-                    future = executor.submit(process, diff)
-                    futures.append(future)
-
-                for future in concurrent.futures.as_completed(futures):
-                    entry = future.result()
-                    if entry:
-                        db_entries.append(entry)
-            except (KeyboardInterrupt, SystemExit):
-                logger.info("Received keyboard interrupt. Shutting down...")
-                for fut in futures:
-                    logger.debug("Cancelling: %s", fut)
-                    fut.cancel()
-                    logger.debug("Cancelled: %s", fut.cancelled())
-                logger.info("Shutting down the process pool")
-                executor.shutdown(wait=False)
-                kill_child_processes(os.getpid())
-                logger.info("Cancelled all jobs and shutdown executor.")
-                time.sleep(5)
-                client_bugzoo.containers.clear()
-                logger.info("Killed all containers")
-                logger.info("Removing all images")
-                bug_names = [b for b in client_bugzoo.bugs if 'houston-mutant' in b]
-                for b in bug_names:
-                    logger.debug("Removing image %s", b)
-                    del client_bugzoo.bugs[b]
-                    if client_bugzoo.docker.has_image(b):
-                        client_bugzoo.docker.delete_image(b)
-
-                logger.debug("Removed all images")
-
+        snapshot = client_bugzoo.bugs[name_snapshot]
+        builder = SnapshotBuilder(client_bugzoo,
+                                  snapshot,
+                                  args.coverage,
+                                  max_containers=num_builds)
+        scheduler = MutantScheduler(builder,
+                                    num_builds=num_builds,
+                                    num_sandboxes=num_threads)
+        evaluate = functools.partial(evaluate_trace,
+                                     client_bugzoo,
+                                     dir_output,
+                                     args.coverage)
+        try:
+            for diff, results in scheduler.run(mutants, evaluate):
+                entry = to_database_entry(diff, results or [])
+                if entry:
+                    db_entries.append(entry)
+        except (KeyboardInterrupt, SystemExit):
+            logger.info("Received keyboard interrupt. Shutting down...")
+            client_bugzoo.containers.clear()
+            logger.info("Killed all containers")
+            logger.info("Removing all images")
+            bug_names = [b for b in client_bugzoo.bugs if 'houston-mutant' in b]
+            for b in bug_names:
+                logger.debug("Removing image %s", b)
+                del client_bugzoo.bugs[b]
+                if client_bugzoo.docker.has_image(b):
+                    client_bugzoo.docker.delete_image(b)
+
+            logger.debug("Removed all images")
+        finally:
+            builder.close()
 
     # save to disk
     logger.info("finished constructing evaluation dataset.")
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Learns a model of command timeouts from the trace files produced by
+build_traces.py (either as JSON or in the binary trace format), and writes
+it to a file that can be passed to run_missions.py via --timeouts.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+from houston import System
+from houston.mission import Mission
+from houston.trace import MissionTrace
+from houston.timeouts import TimeoutModel
+from houston.tracefile import is_trace_file, read_traces
+
+logger = logging.getLogger('houston')  # type: logging.Logger
+logger.setLevel(logging.DEBUG)
+
+DESCRIPTION = "Learns command timeouts from a directory of trace files."
+
+
+def setup_logging(verbose: bool = False) -> None:
+    log_to_stdout = logging.StreamHandler()
+    log_to_stdout.setLevel(logging.DEBUG if verbose else logging.INFO)
+    logging.getLogger('houston').addHandler(log_to_stdout)
+    logging.getLogger('experiment').addHandler(log_to_stdout)
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description=DESCRIPTION)
+    p.add_argument('input', type=str,
+                   help='path to a directory of trace files.')
+    p.add_argument('output', type=str,
+                   help='the file to which the timeout model should be written.')  # noqa: pycodestyle
+    p.add_argument('--quantile', type=float, default=0.99,
+                   help='the quantile of observed durations at which timeouts are set.')  # noqa: pycodestyle
+    p.add_argument('--margin', type=float, default=1.5,
+                   help='the factor by which learned timeouts are scaled.')
+    p.add_argument('--min-samples', type=int, default=10,
+                   help='the number of executions that must be observed before a timeout is learned.')  # noqa: pycodestyle
+    p.add_argument('--verbose', action='store_true',
+                   help='increases logging verbosity')
+    return p.parse_args()
+
+
+def observe_file(model: TimeoutModel, filename: str) -> None:
+    system = model.system
+    if is_trace_file(filename):
+        metadata, traces = read_traces(filename, system)
+        jsn_mission = metadata['mission']
+    else:
+        with open(filename, 'r') as f:
+            jsn = json.load(f)
+        jsn_mission = jsn['mission']
+        traces = [MissionTrace.from_dict(t, system) for t in jsn['traces']]
+    mission = Mission.from_dict(jsn_mission)
+    for trace in traces:
+        model.observe_trace(mission, trace)
+
+
+def main() -> None:
+    args = parse_args()
+    setup_logging(verbose=args.verbose)
+    dir_input = args.input
+
+    if not os.path.exists(dir_input):
+        logger.error("trace directory not found: %s", dir_input)
+        sys.exit(1)
+
+    system = System.get_by_name('arducopter')
+    model = TimeoutModel(system,
+                         quantile=args.quantile,
+                         margin=args.margin,
+                         min_samples=args.min_samples)
+    filenames = [os.path.join(dir_input, fn) for fn in os.listdir(dir_input)
+                 if fn.endswith(('.json', '.htrace'))]
+    for fn in filenames:
+        try:
+            observe_file(model, fn)
+        except Exception:
+            logger.exception("failed to read trace file: %s", fn)
+    model.save(args.output)
+    logger.info("saved timeout model to file: %s", args.output)
+
+
+if __name__ == '__main__':
+    main()
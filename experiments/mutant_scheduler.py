@@ -0,0 +1,433 @@
+"""
+Schedules the evaluation of mutants such that the construction of snapshots
+for mutants is overlapped with the execution of missions against those
+snapshots.
+
+Mutant snapshots are built by a SnapshotBuilder inside long-lived builder
+containers, each of which is dedicated to the mutants that modify a given set
+of files (i.e., translation units). Rather than rebuilding (and, if coverage
+is being collected, reinstrumenting) the program from scratch for each
+mutant, each mutant is applied to a warm builder container and the program is
+incrementally rebuilt, reusing the object files from previous builds for all
+of the translation units that the mutant leaves untouched. The original
+sources are restored once the snapshot has been persisted.
+
+A MutantScheduler builds a bounded number of snapshots concurrently and, as
+soon as the snapshot for a mutant becomes available, runs each of the
+missions for that mutant in parallel across a bounded number of sandboxes.
+"""
+from typing import Any, Callable, Dict, FrozenSet, Iterable, Iterator, \
+    List, Optional, Sequence, Set, Tuple
+from uuid import uuid4
+import collections
+import concurrent.futures
+import logging
+import re
+import shlex
+import threading
+
+import bugzoo
+import houston
+from bugzoo import Client as BugZooClient
+from houston.ardu.coverage import NUM_INSTRUMENTATION_LINES
+
+logger = logging.getLogger('houston')  # type: logging.Logger
+logger.setLevel(logging.DEBUG)
+
+# the directory to which original sources are copied during a build
+DIR_ORIGINALS = '/tmp/houston-originals'
+
+_HUNK_HEADER = re.compile(r'^@@ -(\d+)(,\d+)? \+(\d+)(,\d+)? @@')
+
+
+class FailedToCreateMutantSnapshot(houston.exceptions.HoustonException):
+    """
+    Thrown when this script fails to create a BugZoo snapshot for a
+    mutant.
+    """
+
+
+def _filename(line: str) -> str:
+    """
+    Returns the name of the file given by a '+++' line of a unified diff,
+    without any trailing timestamp.
+    """
+    return line[4:].split('\t')[0].strip()
+
+
+def shift_diff(diff: str, filenames: Iterable[str], offset: int) -> str:
+    """
+    Shifts the line numbers of each hunk within a unified diff that modifies
+    any of the given files by a fixed offset. Used to apply a mutant, which
+    is described relative to the original sources, to sources to which
+    coverage instrumentation has been prepended.
+    """
+    filenames = frozenset(filenames)
+    shift = False
+    lines = diff.split('\n')
+    for i, line in enumerate(lines):
+        if line.startswith('+++ '):
+            shift = _filename(line) in filenames
+            continue
+        m = _HUNK_HEADER.match(line)
+        if shift and m:
+            old_start = int(m.group(1)) + offset
+            new_start = int(m.group(3)) + offset
+            header = '@@ -{}{} +{}{} @@'.format(old_start, m.group(2) or '',
+                                                new_start, m.group(4) or '')
+            lines[i] = header + line[m.end():]
+    return '\n'.join(lines)
+
+
+def translation_units(diff: str) -> Tuple[str, ...]:
+    """
+    Returns the (sorted) names of the source files that are modified by a
+    given diff.
+    """
+    return tuple(sorted(set(_filename(line) for line in diff.split('\n')
+                            if line.startswith('+++ '))))
+
+
+class _BuildContainer(object):
+    """
+    A warm container that is used to build the snapshots for the mutants of
+    a given set of translation units.
+    """
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.container = None  # type: Optional[bugzoo.Container]
+        self.retired = False
+
+
+class SnapshotBuilder(object):
+    """
+    Builds snapshots for mutants of a given snapshot in warm builder
+    containers, each of which is reserved for a given set of translation
+    units. Builds that modify the same translation units are serialised.
+    """
+    def __init__(self,
+                 client_bugzoo: BugZooClient,
+                 snapshot: bugzoo.Bug,
+                 coverage: bool,
+                 max_containers: int = 1
+                 ) -> None:
+        """
+        Parameters:
+            client_bugzoo: a client for the BugZoo server.
+            snapshot: the snapshot from which mutants should be built.
+            coverage: indicates whether the program inside each mutant
+                snapshot should be instrumented for coverage collection.
+            max_containers: the maximum number of builder containers that
+                may exist at any given time.
+        """
+        assert max_containers > 0
+        self.__bz = client_bugzoo
+        self.__snapshot = snapshot
+        self.__coverage = coverage
+        self.__max_containers = max_containers
+        self.__lock = threading.Lock()
+        self.__builders = \
+            collections.OrderedDict()  # type: Dict[Tuple[str, ...], _BuildContainer]  # noqa: pycodestyle
+        instructions = snapshot.instructions_coverage
+        files = getattr(instructions, 'files_to_instrument', ())
+        self.__instrumented = frozenset(files)  # type: FrozenSet[str]
+
+    def __builder(self, units: Tuple[str, ...]) -> _BuildContainer:
+        """
+        Returns the builder for a given set of translation units. If there is
+        no such builder, the least recently used idle builder is retired to
+        make room for a new one. If every builder is busy, this method blocks
+        until the least recently used builder becomes idle.
+        """
+        while True:
+            with self.__lock:
+                if units in self.__builders:
+                    self.__builders.move_to_end(units)
+                    return self.__builders[units]
+                if len(self.__builders) < self.__max_containers:
+                    builder = _BuildContainer()
+                    self.__builders[units] = builder
+                    return builder
+                for key, builder in list(self.__builders.items()):
+                    if builder.lock.acquire(blocking=False):
+                        try:
+                            del self.__builders[key]
+                            self.__retire(builder)
+                        finally:
+                            builder.lock.release()
+                        builder = _BuildContainer()
+                        self.__builders[units] = builder
+                        return builder
+                busy = next(iter(self.__builders.values()))
+            # wait for the least recently used builder to become idle
+            with busy.lock:
+                pass
+
+    def __retire(self, builder: _BuildContainer) -> None:
+        builder.retired = True
+        if builder.container is not None:
+            logger.debug("destroying builder container: %s",
+                         builder.container.uid)
+            del self.__bz.containers[builder.container.uid]
+            builder.container = None
+
+    def __provision(self) -> bugzoo.Container:
+        bzc = self.__bz.containers
+        container = bzc.provision(self.__snapshot)
+        try:
+            if self.__coverage:
+                bzc.instrument(container)
+        except Exception:
+            del bzc[container.uid]
+            raise
+        logger.debug("provisioned builder container: %s", container.uid)
+        return container
+
+    def __build(self,
+                container: bugzoo.Container,
+                diff: str,
+                units: Tuple[str, ...],
+                name_image: str
+                ) -> None:
+        bzc = self.__bz.containers
+        snapshot = self.__snapshot
+        compiler = snapshot.compiler
+        dir_source = snapshot.source_dir
+        # the builder container was configured (and, if necessary,
+        # instrumented) when it was provisioned, so the plain build command
+        # incrementally rebuilds the program with the same options
+        command = compiler.command
+        if self.__coverage:
+            diff = shift_diff(diff,
+                              self.__instrumented,
+                              NUM_INSTRUMENTATION_LINES)
+        files = ' '.join(shlex.quote(fn) for fn in units)
+        cmd = 'mkdir -p {0} && cp -p --parents {1} {0}/'
+        bzc.exec(container, cmd.format(DIR_ORIGINALS, files),
+                 context=dir_source)
+        try:
+            if not bzc.patch(container, bugzoo.Patch.from_unidiff(diff)):
+                m = "failed to patch using diff: {}".format(diff)
+                raise FailedToCreateMutantSnapshot(m)
+            logger.debug("patched using diff: %s", diff)
+            outcome = bzc.exec(container, command,
+                               context=compiler.context or dir_source,
+                               stderr=True,
+                               time_limit=int(compiler.time_limit))
+            if outcome.code != 0:
+                logger.error("build failure:\n%s", outcome.output)
+                m = "failed to build mutant: {}".format(diff)
+                raise FailedToCreateMutantSnapshot(m)
+            bzc.persist(container, name_image)
+        finally:
+            cmd = 'cp -p -r {0}/. . && rm -rf {0}'.format(DIR_ORIGINALS)
+            bzc.exec(container, cmd, context=dir_source)
+
+    def build(self, diff: str) -> bugzoo.Bug:
+        """
+        Builds and registers a snapshot for a given mutant. The snapshot
+        should be destroyed via :meth:`release` once it is no longer needed.
+
+        Raises:
+            FailedToCreateMutantSnapshot: if the mutant could not be applied
+                or failed to build.
+        """
+        snapshot = self.__snapshot
+        units = translation_units(diff)
+        name_image = "houston-mutant:{}".format(uuid4().hex[:64])
+        while True:
+            builder = self.__builder(units)
+            with builder.lock:
+                if builder.retired:
+                    continue
+                if builder.container is None:
+                    builder.container = self.__provision()
+                try:
+                    self.__build(builder.container, diff, units, name_image)
+                except FailedToCreateMutantSnapshot:
+                    raise
+                except Exception:
+                    # the state of the builder can no longer be trusted
+                    with self.__lock:
+                        if self.__builders.get(units) is builder:
+                            del self.__builders[units]
+                    self.__retire(builder)
+                    raise
+                break
+
+        mutant = bugzoo.Bug(name=name_image,
+                            image=name_image,
+                            dataset='houston-mutants',
+                            program=snapshot.program,
+                            source=None,
+                            source_dir=snapshot.source_dir,
+                            languages=snapshot.languages,
+                            tests=snapshot.tests,
+                            compiler=snapshot.compiler,
+                            instructions_coverage=snapshot.instructions_coverage)  # noqa: pycodestyle
+        self.__bz.bugs.register(mutant)
+        return mutant
+
+    def release(self, mutant: bugzoo.Bug) -> None:
+        """
+        Destroys a snapshot that was built by this builder.
+        """
+        bz = self.__bz
+        if mutant.name in bz.bugs:
+            del bz.bugs[mutant.name]
+        if bz.docker.has_image(mutant.image):
+            bz.docker.delete_image(mutant.image)
+
+    def close(self) -> None:
+        """
+        Destroys all of the builder containers.
+        """
+        with self.__lock:
+            builders = list(self.__builders.values())
+            self.__builders.clear()
+        for builder in builders:
+            with builder.lock:
+                self.__retire(builder)
+
+
+class MutantScheduler(object):
+    """
+    Evaluates a sequence of mutants, each against a given set of jobs (e.g.,
+    missions), by overlapping the construction of mutant snapshots with the
+    execution of jobs against previously built snapshots.
+    """
+    def __init__(self,
+                 builder: SnapshotBuilder,
+                 *,
+                 num_builds: int = 1,
+                 num_sandboxes: int = 1,
+                 max_snapshots: Optional[int] = None
+                 ) -> None:
+        """
+        Parameters:
+            builder: used to build and destroy mutant snapshots.
+            num_builds: the maximum number of snapshots that may be built
+                concurrently.
+            num_sandboxes: the maximum number of jobs that may be executed
+                concurrently (i.e., the sandbox budget).
+            max_snapshots: the maximum number of snapshots that may exist,
+                or be under construction, at any given time. Defaults to
+                twice the number of concurrent builds.
+        """
+        if max_snapshots is None:
+            max_snapshots = 2 * num_builds
+        assert num_builds > 0
+        assert num_sandboxes > 0
+        assert max_snapshots >= num_builds
+        self.__builder = builder
+        self.__num_builds = num_builds
+        self.__num_sandboxes = num_sandboxes
+        self.__max_snapshots = max_snapshots
+
+    def run(self,
+            mutants: Iterable[Tuple[str, Sequence[Any]]],
+            evaluate: Callable[[bugzoo.Bug, str, Any], Any]
+            ) -> Iterator[Tuple[str, Optional[List[Any]]]]:
+        """
+        Evaluates a sequence of mutants. Mutants are built in the given
+        order, and so mutants that modify the same translation units should
+        be adjacent.
+
+        Parameters:
+            mutants: an iterable of pairs, each containing the diff for a
+                mutant and the jobs that should be evaluated against it.
+            evaluate: a function that evaluates a given job against the
+                snapshot for a given mutant (and its diff). Any exception
+                raised by this function is logged and its result is
+                recorded as None.
+
+        Returns:
+            an iterator over the diff of each mutant, in order of completion,
+            together with the results of its jobs (in the order in which
+            those jobs were given), or None if the snapshot for that mutant
+            could not be built.
+        """
+        # mutants are identified by their position within the queue, since
+        # several mutants may share the same diff
+        queue = collections.deque(enumerate(mutants))
+        builds = {}  # type: Dict[concurrent.futures.Future, Tuple[int, str, Sequence[Any]]]  # noqa: pycodestyle
+        runs = {}  # type: Dict[concurrent.futures.Future, Tuple[int, int]]
+        snapshots = {}  # type: Dict[int, Tuple[str, bugzoo.Bug]]
+        results = {}  # type: Dict[int, List[Any]]
+        remaining = {}  # type: Dict[int, int]
+
+        def job(snapshot: bugzoo.Bug, diff: str, item: Any) -> Any:
+            try:
+                return evaluate(snapshot, diff, item)
+            except Exception:
+                logger.exception("failed to evaluate mutant: %s", diff)
+                return None
+
+        def release(snapshot: bugzoo.Bug) -> None:
+            try:
+                self.__builder.release(snapshot)
+            except Exception:
+                logger.exception("failed to release snapshot: %s",
+                                 snapshot.name)
+
+        def release_built(future: concurrent.futures.Future) -> None:
+            if not future.cancelled() and future.exception() is None:
+                release(future.result())
+
+        pool_build = concurrent.futures.ThreadPoolExecutor(self.__num_builds)
+        pool_run = concurrent.futures.ThreadPoolExecutor(self.__num_sandboxes)
+        try:
+            while queue or builds or runs:
+                while queue and \
+                        len(builds) + len(snapshots) < self.__max_snapshots:
+                    position, (diff, items) = queue.popleft()
+                    if not items:
+                        yield (diff, [])
+                        continue
+                    future = pool_build.submit(self.__builder.build, diff)
+                    builds[future] = (position, diff, items)
+                if not builds and not runs:
+                    continue
+
+                done, _ = concurrent.futures.wait(
+                    list(builds) + list(runs),
+                    return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    if future in builds:
+                        position, diff, items = builds.pop(future)
+                        try:
+                            snapshot = future.result()
+                        except FailedToCreateMutantSnapshot:
+                            logger.error("failed to build snapshot for mutant: %s", diff)  # noqa: pycodestyle
+                            yield (diff, None)
+                            continue
+                        except Exception:
+                            logger.exception("failed to build snapshot for mutant: %s", diff)  # noqa: pycodestyle
+                            yield (diff, None)
+                            continue
+                        snapshots[position] = (diff, snapshot)
+                        results[position] = [None] * len(items)
+                        remaining[position] = len(items)
+                        for i, item in enumerate(items):
+                            f = pool_run.submit(job, snapshot, diff, item)
+                            runs[f] = (position, i)
+                    else:
+                        position, i = runs.pop(future)
+                        results[position][i] = future.result()
+                        remaining[position] -= 1
+                        if remaining[position] == 0:
+                            del remaining[position]
+                            diff, snapshot = snapshots.pop(position)
+                            self.__builder.release(snapshot)
+                            yield (diff, results.pop(position))
+        finally:
+            for future in list(builds) + list(runs):
+                future.cancel()
+            # snapshots must outlive any jobs that are still running on them
+            pool_run.shutdown(wait=True)
+            for _, snapshot in snapshots.values():
+                release(snapshot)
+            # builds that are still in progress are released once complete
+            for future in builds:
+                future.add_done_callback(release_built)
+            pool_build.shutdown(wait=False)
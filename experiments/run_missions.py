@@ -2,6 +2,7 @@
 import copy
 import json
 import logging
+import threading
 
 import argparse
 import bugzoo
@@ -14,6 +15,10 @@ from houston.generator.rand import RandomMissionGenerator
 from houston.generator.resources import ResourceLimits
 from houston.mission import Mission
 from houston.runner import MissionRunnerPool
+from houston.missionfile import MissionSource, MissionResultWriter
+from houston.journal import CampaignJournal
+from houston.cache import ResultCache
+from houston.timeouts import TimeoutModel
 #from houston.ardu.common.goto import CircleBasedGotoGenerator
 from houston.root_cause.delta_debugging import DeltaDebugging
 from houston.root_cause.symex import SymbolicExecution
@@ -38,7 +43,19 @@ def setup_arg_parser():
     parser.add_argument('snapshot', type=str,
                         help='name of the snapshot to be used.')
     parser.add_argument('--input_file', default="missions.json", type=str,
-                        help='path to json file containing the missions')
+                        help='path to json (or json lines) file containing the missions')
+    parser.add_argument('--results_file', default="results.jsonl", type=str,
+                        help='path to the json lines file to which outcomes are appended')
+    parser.add_argument('--prefetch', default=16, type=int,
+                        help='maximum number of missions read ahead of execution.')
+    parser.add_argument('--journal', default=None, type=str,
+                        help='path to a campaign journal; if the journal exists, missions that it records as complete are skipped.')
+    parser.add_argument('--cache', default=None, type=str,
+                        help='path to a directory of cached mission results; missions whose outcomes are cached are not executed.')
+    parser.add_argument('--cache_size', default=None, type=int,
+                        help='maximum size of the result cache, in bytes.')
+    parser.add_argument('--timeouts', default=None, type=str,
+                        help='path to a timeout model learned from previous traces; if given, command timeouts are taken from the model.')
     parser.add_argument('--coverage', default=False, action="store_true",
                         help='if given fault localization will be done at the end.')
     parser.add_argument('--not_record', default=True, action="store_false",
@@ -58,32 +75,38 @@ def run_single_mission_with_coverage(sandbox, mission):
     print("Done")
     print(coverage)
 
-### Run all missions stored in a JSON file
-def run_all_missions(bz, snapshot_name, sut, mission_file, coverage=False, record=True, threads=5):
-    missions = []
-    with open(mission_file, "r") as f:
-        missions_json = json.load(f)
-        missions = list(map(Mission.from_dict, missions_json))
-    assert isinstance(missions, list)
-
-
-    outcomes = {}
+### Run all missions stored in a JSON (or JSON Lines) file
+def run_all_missions(bz, snapshot_name, sut, mission_file, coverage=False, record=True, threads=5, results_file="results.jsonl", prefetch=16, journal_file=None, cache_dir=None, cache_size=None, timeouts_file=None):
+    # missions are streamed from the file, and each outcome is appended to
+    # the results file as soon as it is reported
     coverages = {}
-    def record_outcome(mission, outcome, coverage=None):
-        outcomes[mission] = outcome
-        coverages[mission] = coverage
-
-    runner_pool = MissionRunnerPool(bz, snapshot_name, sut, threads, missions, record_outcome, coverage, record)
-    print("Started running")
-    runner_pool.run()
-    print("Done running")
-    print(outcomes)
-
-    with open("failed.json", "w") as f:
-        for m in outcomes:
-            if not outcomes[m].passed:
-                f.write(str(m.to_dict()))
-                f.write("\n")
+    failed_lock = threading.Lock()
+    journal = CampaignJournal(journal_file) if journal_file else None
+    cache = ResultCache(cache_dir, cache_size) if cache_dir else None
+    timeout_model = TimeoutModel.load(timeouts_file) if timeouts_file else None
+    # when resuming a campaign, results are appended to the existing files
+    mode_failed = "a" if journal else "w"
+    with MissionSource(mission_file, prefetch=prefetch) as missions, \
+            MissionResultWriter(results_file) as writer, \
+            open("failed.json", mode_failed) as failed:
+        def record_outcome(mission, outcome, coverage=None):
+            writer.write(mission, outcome, coverage)
+            if not outcome.passed:
+                with failed_lock:
+                    failed.write(json.dumps(mission.to_dict()))
+                    failed.write("\n")
+                    failed.flush()
+            if coverage is not None:
+                coverages[mission] = (outcome, coverage)
+
+        runner_pool = MissionRunnerPool(bz, snapshot_name, sut, threads, missions, record_outcome, coverage, record, journal=journal, cache=cache, timeout_model=timeout_model)
+        print("Started running")
+        runner_pool.run()
+        print("Done running")
+        print("{} missions run, {} failed; results written to {}".format(
+            writer.num_written, writer.num_failed, results_file))
+    if journal:
+        journal.close()
 
     if coverage:
         from bugzoo.core.coverage import TestSuiteCoverage
@@ -92,11 +115,11 @@ def run_all_missions(bz, snapshot_name, sut, mission_file, coverage=False, recor
         from bugzoo.localization.suspiciousness import tarantula
         test_suite_coverage_dict = {}
         counter = 0
-        for m in coverages:
+        for m, (outcome, cov) in coverages.items():
             test = {
                     'test': 't{}'.format(counter),
-                    'outcome': outcomes[m].to_test_outcome_json(0),
-                    'coverage': coverages[m].to_dict()
+                    'outcome': outcome.to_test_outcome_json(0),
+                    'coverage': cov.to_dict()
             }
             test_suite_coverage_dict['t{}'.format(counter)] = test
             counter += 1
@@ -113,4 +136,6 @@ if __name__ == "__main__":
     bz = BugZoo()
 
     run_all_missions(bz, args.snapshot, sut, args.input_file, args.coverage,
-                     args.not_record, args.threads)
+                     args.not_record, int(args.threads), args.results_file,
+                     args.prefetch, args.journal, args.cache, args.cache_size,
+                     args.timeouts)
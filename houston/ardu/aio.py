@@ -0,0 +1,450 @@
+"""
+Provides an asyncio-based MAVLink connection that reads frames directly from
+a TCP stream using pymavlink's parser, rather than relying on dronekit and its
+per-vehicle reader threads. A single event loop may use these connections to
+drive many vehicles at once.
+"""
+__all__ = ['VehicleView', 'AsyncMAVLinkConnection']
+
+from typing import Callable, Dict, Optional, Sequence
+from timeit import default_timer as timer
+import asyncio
+import logging
+
+import attr
+import dronekit
+from pymavlink import mavutil
+from pymavlink.mavutil import mavlink
+
+from .connection import CommandLong, MAVLinkMessage, MAVLinkGeneralMessage, \
+    HOOK_TYPE
+from ..connection import Connection
+
+logger = logging.getLogger(__name__)  # type: logging.Logger
+logger.setLevel(logging.DEBUG)
+
+# the maximum number of bytes that are read from the stream at once
+READ_SIZE = 4096
+# the number of seconds to wait before retrying a refused TCP connection
+RETRY_INTERVAL = 0.1
+# the rate, in Hz, at which telemetry streams are requested from the vehicle
+STREAM_RATE = 4
+# the messages that are sent by the vehicle during a mission upload
+MISSION_UPLOAD_MESSAGES = \
+    frozenset(['MISSION_REQUEST', 'MISSION_REQUEST_INT', 'MISSION_ACK'])
+
+
+@attr.s(frozen=True)
+class Locations(object):
+    global_relative_frame = attr.ib(type=dronekit.LocationGlobalRelative)
+
+
+class VehicleView(object):
+    """
+    Maintains the subset of the attributes of a dronekit vehicle that are used
+    by Houston's state variables, computed in the same way as dronekit from
+    the raw MAVLink messages received over a connection.
+    """
+    def __init__(self) -> None:
+        self.__lat = None  # type: Optional[float]
+        self.__lon = None  # type: Optional[float]
+        self.__alt = None  # type: Optional[float]
+        self.home_location = None  # type: Optional[dronekit.LocationGlobal]
+        self.velocity = [None, None, None]
+        self.attitude = dronekit.Attitude(None, None, None)
+        self.heading = None  # type: Optional[int]
+        self.airspeed = None  # type: Optional[float]
+        self.groundspeed = None  # type: Optional[float]
+        self.gps_0 = dronekit.GPSInfo(None, None, None, None)
+        self.armed = False
+        self.mode = dronekit.VehicleMode('AUTO')
+        self.vehicle_type = None  # type: Optional[int]
+        self.system_status = None  # type: Optional[int]
+        self.time_heartbeat = None  # type: Optional[float]
+        self.__ekf_poshorizabs = False
+        self.__ekf_constposmode = False
+        self.__ekf_predposhorizabs = False
+
+    @property
+    def location(self) -> Locations:
+        frame = dronekit.LocationGlobalRelative(self.__lat,
+                                                self.__lon,
+                                                self.__alt)
+        return Locations(frame)
+
+    @property
+    def ekf_ok(self) -> bool:
+        if self.armed:
+            return self.__ekf_poshorizabs and not self.__ekf_constposmode
+        return self.__ekf_poshorizabs or self.__ekf_predposhorizabs
+
+    @property
+    def is_armable(self) -> bool:
+        fix_type = self.gps_0.fix_type
+        return self.mode.name != 'INITIALISING' and \
+            fix_type is not None and fix_type > 1 and \
+            self.__ekf_predposhorizabs
+
+    @property
+    def last_heartbeat(self) -> Optional[float]:
+        """
+        The number of seconds since the last heartbeat was received, or None
+        if no heartbeat has been received.
+        """
+        if self.time_heartbeat is None:
+            return None
+        return timer() - self.time_heartbeat
+
+    def observe(self, message) -> None:
+        """
+        Updates the attributes of this vehicle using a given MAVLink message.
+        """
+        name = message.get_type()
+        if name == 'GLOBAL_POSITION_INT':
+            self.__lat = message.lat / 1.0e7
+            self.__lon = message.lon / 1.0e7
+            self.__alt = message.relative_alt / 1000.0
+            self.velocity = [message.vx / 100.0,
+                             message.vy / 100.0,
+                             message.vz / 100.0]
+        elif name == 'ATTITUDE':
+            self.attitude = dronekit.Attitude(message.pitch,
+                                              message.yaw,
+                                              message.roll)
+        elif name == 'VFR_HUD':
+            self.heading = message.heading
+            self.airspeed = message.airspeed
+            self.groundspeed = message.groundspeed
+        elif name == 'GPS_RAW_INT':
+            self.gps_0 = dronekit.GPSInfo(message.eph,
+                                          message.epv,
+                                          message.fix_type,
+                                          message.satellites_visible)
+        elif name == 'EKF_STATUS_REPORT':
+            flags = message.flags
+            self.__ekf_poshorizabs = (flags & mavlink.EKF_POS_HORIZ_ABS) > 0
+            self.__ekf_constposmode = (flags & mavlink.EKF_CONST_POS_MODE) > 0
+            self.__ekf_predposhorizabs = \
+                (flags & mavlink.EKF_PRED_POS_HORIZ_ABS) > 0
+        elif name == 'HOME_POSITION':
+            self.home_location = \
+                dronekit.LocationGlobal(message.latitude / 1.0e7,
+                                        message.longitude / 1.0e7,
+                                        message.altitude / 1000.0)
+        elif name == 'MISSION_ITEM':
+            # as with dronekit, waypoint 0 of a downloaded mission is home
+            if message.seq == 0 and \
+                    (message.x, message.y, message.z) != (0, 0, 0):
+                self.home_location = dronekit.LocationGlobal(message.x,
+                                                             message.y,
+                                                             message.z)
+        elif name == 'HEARTBEAT':
+            # ignore ground stations
+            if message.type == mavlink.MAV_TYPE_GCS:
+                return
+            self.time_heartbeat = timer()
+            self.armed = \
+                (message.base_mode & mavlink.MAV_MODE_FLAG_SAFETY_ARMED) != 0
+            self.vehicle_type = message.type
+            self.system_status = message.system_status
+            modes = mavutil.mode_mapping_bynumber(message.type) or {}
+            if message.custom_mode in modes:
+                self.mode = dronekit.VehicleMode(modes[message.custom_mode])
+
+
+class AsyncMAVLinkConnection(Connection[MAVLinkGeneralMessage]):
+    """
+    Uses the MAVLink protocol to provide a connection to a system under test,
+    whose messages are read and dispatched by a task running on an asyncio
+    event loop.
+
+    Hooks are called from within the event loop and must not block.
+    """
+    @classmethod
+    async def open(cls,
+                   host: str,
+                   port: int,
+                   hooks: HOOK_TYPE = None,
+                   *,
+                   timeout: float = 30
+                   ) -> 'AsyncMAVLinkConnection':
+        """
+        Opens a TCP connection to a given vehicle, and waits until its first
+        heartbeat has been received.
+
+        Raises:
+            asyncio.TimeoutError: if the vehicle failed to produce a
+                heartbeat before the timeout.
+            OSError: if the TCP connection could not be established.
+        """
+        loop = asyncio.get_event_loop()
+        time_start = timer()
+        time_end = loop.time() + timeout
+        # the vehicle may not be listening yet if it has only just launched
+        while True:
+            try:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(host, port),
+                    time_end - loop.time())
+                break
+            except OSError:
+                if loop.time() + RETRY_INTERVAL >= time_end:
+                    raise
+                await asyncio.sleep(RETRY_INTERVAL)
+        connection = cls(reader, writer, hooks)
+        connection._record_timing('tcp', timer() - time_start)
+        try:
+            time_left = timeout - (timer() - time_start)
+            if not await connection.wait_until(
+                    lambda: connection.conn.time_heartbeat is not None,
+                    time_left):
+                raise asyncio.TimeoutError
+        except BaseException:
+            connection.close()
+            raise
+        connection._record_timing('heartbeat', timer() - time_start)
+        return connection
+
+    def __init__(self,
+                 reader: asyncio.StreamReader,
+                 writer: asyncio.StreamWriter,
+                 hooks: HOOK_TYPE = None
+                 ) -> None:
+        super().__init__(hooks)
+        self.__reader = reader
+        self.__writer = writer
+        self.__mav = mavlink.MAVLink(None, srcSystem=255, srcComponent=0)
+        self.__mav.robust_parsing = True
+        self.__vehicle = VehicleView()
+        self.__target_system = 0
+        self.__target_component = 0
+        self.__timings = {}  # type: Dict[str, float]
+        # replaced each time that a batch of messages has been dispatched
+        self.__changed = asyncio.Event()
+        self.__closed = False
+        self.__task = asyncio.ensure_future(self._read())
+
+    @property
+    def conn(self) -> VehicleView:
+        return self.__vehicle
+
+    @property
+    def closed(self) -> bool:
+        return self.__closed
+
+    @property
+    def timings(self) -> Dict[str, float]:
+        """
+        The number of seconds, measured from the start of the connection
+        attempt, that it took to open the TCP connection ('tcp') and to
+        receive the first heartbeat ('heartbeat').
+        """
+        return dict(self.__timings)
+
+    def _record_timing(self, phase: str, time_taken: float) -> None:
+        self.__timings[phase] = time_taken
+
+    def _notify(self) -> None:
+        changed = self.__changed
+        self.__changed = asyncio.Event()
+        changed.set()
+
+    async def _read(self) -> None:
+        try:
+            while True:
+                data = await self.__reader.read(READ_SIZE)
+                if not data:
+                    logger.debug("connection closed by vehicle")
+                    break
+                for message in self.__mav.parse_buffer(data) or []:
+                    name = message.get_type()
+                    if name == 'BAD_DATA':
+                        continue
+                    if name == 'HEARTBEAT' and \
+                            message.type != mavlink.MAV_TYPE_GCS:
+                        self._on_heartbeat(message)
+                    self.__vehicle.observe(message)
+                    # messages are only wrapped if a hook is interested
+                    subscriptions = self.subscriptions
+                    if subscriptions is None or name in subscriptions:
+                        self.receive(MAVLinkMessage(name, message))
+                self._notify()
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            logger.exception("failed to read from MAVLink connection")
+        finally:
+            self.__closed = True
+            self._notify()
+
+    def _on_heartbeat(self, message) -> None:
+        """
+        Answers each heartbeat of the vehicle with a heartbeat of our own.
+        As with dronekit, the telemetry streams of the vehicle are requested
+        once its first heartbeat has identified it as the target system.
+        """
+        is_first = self.__vehicle.time_heartbeat is None
+        self.__target_system = message.get_srcSystem()
+        self.__target_component = message.get_srcComponent()
+        self._write(self.__mav.heartbeat_encode(
+            mavlink.MAV_TYPE_GCS, mavlink.MAV_AUTOPILOT_INVALID, 0, 0, 0))
+        if is_first:
+            self._write(self.__mav.request_data_stream_encode(
+                self.__target_system,
+                self.__target_component,
+                mavlink.MAV_DATA_STREAM_ALL,
+                STREAM_RATE,
+                1))
+
+    async def wait_until(self,
+                         predicate: Callable[[], bool],
+                         timeout: Optional[float] = None
+                         ) -> bool:
+        """
+        Waits until a given predicate holds, re-evaluating that predicate each
+        time that a batch of messages has been received.
+
+        Returns:
+            True if the predicate was satisfied, or False if a timeout
+            occurred or the connection was closed.
+        """
+        loop = asyncio.get_event_loop()
+        time_end = None if timeout is None else loop.time() + timeout
+        while not predicate():
+            if self.__closed:
+                return False
+            time_left = None
+            if time_end is not None:
+                time_left = time_end - loop.time()
+                if time_left <= 0:
+                    return False
+            try:
+                await asyncio.wait_for(self.__changed.wait(), time_left)
+            except asyncio.TimeoutError:
+                return predicate()
+        return True
+
+    def send(self, message: MAVLinkGeneralMessage) -> None:
+        if isinstance(message, CommandLong):
+            msg = self.__mav.command_long_encode(message.target_system,
+                                                 message.target_component,
+                                                 message.cmd_id,
+                                                 message.confirmation,
+                                                 message.param_1,
+                                                 message.param_2,
+                                                 message.param_3,
+                                                 message.param_4,
+                                                 message.param_5,
+                                                 message.param_6,
+                                                 message.param_7)
+            self._write(msg)
+
+    def _write(self, msg) -> None:
+        if self.__closed:
+            return
+        self.__writer.write(msg.pack(self.__mav))
+
+    async def arm(self, timeout: float) -> bool:
+        """
+        Repeatedly asks the vehicle to arm until it reports that it is armed.
+
+        Returns:
+            True if the vehicle was armed before the timeout.
+        """
+        loop = asyncio.get_event_loop()
+        time_end = loop.time() + timeout
+        while True:
+            self.send(CommandLong(self.__target_system,
+                                  self.__target_component,
+                                  mavlink.MAV_CMD_COMPONENT_ARM_DISARM,
+                                  param_1=1))
+            time_left = min(0.1, time_end - loop.time())
+            if await self.wait_until(lambda: self.__vehicle.armed, time_left):
+                return True
+            if loop.time() >= time_end or self.__closed:
+                return False
+            logger.debug("waiting for the vehicle to be armed...")
+
+    async def set_mode(self, name: str, timeout: float) -> bool:
+        """
+        Asks the vehicle to switch to a given mode (e.g., GUIDED).
+
+        Returns:
+            True if the vehicle reported that it was in the given mode before
+            the timeout.
+        """
+        vehicle = self.__vehicle
+        modes = mavutil.mode_mapping_byname(vehicle.vehicle_type) or {}
+        if name not in modes:
+            logger.error("mode not available for vehicle: %s", name)
+            return False
+        msg = self.__mav.set_mode_encode(
+            self.__target_system,
+            mavlink.MAV_MODE_FLAG_CUSTOM_MODE_ENABLED,
+            modes[name])
+        self._write(msg)
+        return await self.wait_until(lambda: vehicle.mode.name == name,
+                                     timeout)
+
+    async def upload_mission(self,
+                             items: Sequence[dronekit.Command],
+                             timeout: float
+                             ) -> bool:
+        """
+        Uploads a sequence of mission items to the vehicle using the MAVLink
+        mission protocol.
+
+        Returns:
+            True if the vehicle accepted the mission before the timeout.
+        """
+        acknowledgements = []
+
+        def on_message(m: MAVLinkGeneralMessage) -> None:
+            if not isinstance(m, MAVLinkMessage):
+                return
+            if m.name in ('MISSION_REQUEST', 'MISSION_REQUEST_INT'):
+                seq = m.message.seq
+                if seq >= len(items):
+                    return
+                item = items[seq]
+                msg = self.__mav.mission_item_encode(
+                    self.__target_system, self.__target_component, seq,
+                    item.frame, item.command, item.current, item.autocontinue,
+                    item.param1, item.param2, item.param3, item.param4,
+                    item.x, item.y, item.z)
+                self._write(msg)
+            elif m.name == 'MISSION_ACK':
+                acknowledgements.append(m.message.type)
+
+        self.add_hooks({'upload_mission': on_message},
+                       MISSION_UPLOAD_MESSAGES)
+        try:
+            msg = self.__mav.mission_count_encode(self.__target_system,
+                                                  self.__target_component,
+                                                  len(items))
+            self._write(msg)
+            if not await self.wait_until(lambda: bool(acknowledgements),
+                                         timeout):
+                logger.error("timeout occurred during mission upload")
+                return False
+        finally:
+            self.remove_hook('upload_mission')
+        if acknowledgements[0] != mavlink.MAV_MISSION_ACCEPTED:
+            logger.error("vehicle rejected mission: %s", acknowledgements[0])
+            return False
+        return True
+
+    def close(self) -> None:
+        self.__closed = True
+        self.__task.cancel()
+        self.__writer.close()
+
+    async def wait_closed(self) -> None:
+        """
+        Waits until the connection has been fully closed.
+        """
+        self.close()
+        try:
+            await self.__task
+        except asyncio.CancelledError:
+            pass
@@ -1,7 +1,9 @@
 __all__ = ['MAVLinkMessage', 'CommandLong', 'MAVLinkConnection']
 
 import logging
+import threading
 from typing import Any, List, Callable, Dict
+from timeit import default_timer as timer
 import pymavlink
 from pymavlink.mavutil import mavlink
 import attr
@@ -65,6 +67,11 @@ HOOK_TYPE = Dict[str, Callable[[MAVLinkGeneralMessage], None]]
 class MAVLinkConnection(Connection[MAVLinkGeneralMessage]):
     """
     Uses the MAVLink protocol to provide a connection to a system under test.
+
+    A dronekit message listener is attached for each of the messages that
+    hooks have subscribed to, so that messages of no interest to any hook
+    are never wrapped and forwarded. A catch-all listener is used only if
+    some hook subscribes to all messages.
     """
     def __init__(self,
                  url: str,
@@ -72,9 +79,16 @@ class MAVLinkConnection(Connection[MAVLinkGeneralMessage]):
                  timeout: int = 30
                  ) -> None:
         super().__init__(hooks)
+        time_start = timer()
+        self.__timings = {}  # type: Dict[str, float]
         self.__conn = dronekit.connect(url,
                                        wait_ready=False,
-                                       heartbeat_timeout=0)
+                                       heartbeat_timeout=0,
+                                       _initialize=False)
+        self.__timings['tcp'] = timer() - time_start
+        # blocks until the first heartbeat has been received
+        self.__conn.initialize(heartbeat_timeout=0)
+        self.__timings['heartbeat'] = timer() - time_start
         self.__conn.wait_ready(True,
                                timeout=timeout,
                                raise_exception=True)
@@ -84,17 +98,44 @@ class MAVLinkConnection(Connection[MAVLinkGeneralMessage]):
                                'home_location',
                                timeout=timeout,
                                raise_exception=True)
-
-        def recv(vehicle, name: str, message):  # FIXME external types
-            m = MAVLinkMessage(name, message)
-            self.receive(m)
-
-        self.__conn.add_message_listener('*', recv)
+        self.__timings['attributes'] = timer() - time_start
+
+        # maps the name of each message (or '*') to its dronekit listener
+        self.__listeners = {}  # type: Dict[str, Callable]
+        self.__listeners_lock = threading.Lock()
+        self._subscriptions_changed()
+
+    def _recv(self, vehicle, name: str, message) -> None:  # FIXME external types  # noqa: pycodestyle
+        self.receive(MAVLinkMessage(name, message))
+
+    def _subscriptions_changed(self) -> None:
+        # the subscriptions are read while holding the lock, so that the most
+        # recent set is always applied last when hooks change concurrently
+        with self.__listeners_lock:
+            subscriptions = self.subscriptions
+            wanted = {'*'} if subscriptions is None else set(subscriptions)
+            for name in set(self.__listeners) - wanted:
+                listener = self.__listeners.pop(name)
+                self.__conn.remove_message_listener(name, listener)
+            for name in wanted - set(self.__listeners):
+                listener = self._recv
+                self.__conn.add_message_listener(name, listener)
+                self.__listeners[name] = listener
 
     @property
     def conn(self):
         return self.__conn
 
+    @property
+    def timings(self) -> Dict[str, float]:
+        """
+        The number of seconds, measured from the start of the connection
+        attempt, that it took to open the TCP connection ('tcp'), to receive
+        the first heartbeat ('heartbeat'), and to obtain the initial vehicle
+        attributes, including its home location ('attributes').
+        """
+        return dict(self.__timings)
+
     def send(self, message: MAVLinkGeneralMessage) -> None:
         mav = self.__conn.message_factory
         if isinstance(message, CommandLong):
@@ -12,6 +12,12 @@ class Sandbox(ArduSandbox):
                       model_name='quad',
                       param_file=fn_param)
 
+    async def start_async(self) -> None:
+        fn_param = '/opt/ardupilot/copter.parm'
+        await super().start_async(binary_name='arducopter',
+                                  model_name='quad',
+                                  param_file=fn_param)
+
     def _on_connected(self) -> bool:
         if not self.connection:
             return False
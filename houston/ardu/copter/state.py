@@ -1,5 +1,7 @@
 __all__ = ['State']
 
+from typing import Dict, List, FrozenSet
+
 from ..connection import MAVLinkMessage, MAVLinkConnection
 from ...state import State as BaseState
 from ...state import var
@@ -13,10 +15,37 @@ IMPORTANT_MESSAGE_NAMES = [
     'EKF_STATUS_REPORT',
     'HEARTBEAT',
     'HOME_POSITION',
+    'MISSION_ITEM',
+    'GPS_RAW_INT',
 ]
 
+# maps the name of each important message to the names of the state
+# variables whose (dronekit) values may change upon receipt of that message
+MESSAGE_TO_VARIABLES = {
+    'GLOBAL_POSITION_INT': ['altitude', 'latitude', 'longitude',
+                            'vx', 'vy', 'vz'],
+    'ATTITUDE': ['pitch', 'yaw', 'roll'],
+    'VFR_HUD': ['heading', 'airspeed', 'groundspeed'],
+    'SYS_STATUS': [],
+    'EKF_STATUS_REPORT': ['armable', 'ekf_ok'],
+    'HEARTBEAT': ['armed', 'mode', 'armable', 'ekf_ok'],
+    'HOME_POSITION': ['home_latitude', 'home_longitude'],
+    # dronekit also takes the home location from waypoint 0 of a mission
+    'MISSION_ITEM': ['home_latitude', 'home_longitude'],
+    'GPS_RAW_INT': ['armable'],
+}  # type: Dict[str, List[str]]
+assert set(MESSAGE_TO_VARIABLES) == set(IMPORTANT_MESSAGE_NAMES)
+
+# only messages that affect at least one state variable are retained
+DEPENDENCIES = {
+    name: frozenset(names)
+    for (name, names) in MESSAGE_TO_VARIABLES.items() if names
+}  # type: Dict[str, FrozenSet[str]]
+
 
 class State(BaseState):
+    message_names = frozenset(IMPORTANT_MESSAGE_NAMES)
+
     home_latitude = var(float,
                         lambda c: c.conn.home_location.lat,
                         noise=0.0005)
@@ -53,8 +82,19 @@ class State(BaseState):
                time_offset: float,
                connection: MAVLinkConnection
                ) -> 'State':
-        values = {name: v.read(connection)
-                  for (name, v) in self.variables.items()}
+        """
+        Returns a copy of this state in which only those variables that
+        depend on the given message have been refreshed. If the message
+        does not affect any state variable, this state is returned as is.
+        """
+        try:
+            names = DEPENDENCIES[message.name]
+        except KeyError:
+            return self
+        values = self.to_dict()
+        variables = self.variables
+        for name in names:
+            values[name] = variables[name].read(connection)
         values['time_offset'] = time_offset
         state_new = self.__class__(**values)
         return state_new
@@ -0,0 +1,192 @@
+"""
+Provides batched collection of per-command coverage for ArduPilot SITL
+instances that have been instrumented by BugZoo.
+
+During a mission, the gcov data for each command is flushed by the SITL
+process and moved to its own directory in a single shell command. Once the
+mission is complete, a single script restores the data for each command in
+turn and runs gcovr over it, and the reports for all commands are parsed
+from the output of that script in one pass.
+"""
+__all__ = ['snapshot_command', 'extract_command', 'parse_coverage',
+           'universe_command', 'parse_universe']
+
+from typing import Dict, FrozenSet, Iterable, List, Optional, Sequence, Set
+import logging
+import xml.etree.ElementTree as ET
+
+from bugzoo.core.fileline import FileLineSet
+from bugzoo.mgr.coverage.gcov import INSTRUMENTATION
+
+from ..coverage import LineUniverse
+
+logger = logging.getLogger(__name__)  # type: logging.Logger
+logger.setLevel(logging.DEBUG)
+
+# the directory that holds the source code for ArduPilot
+SOURCE_DIR = '/opt/ardupilot'
+
+# the number of seconds given to SITL to flush its gcov data
+FLUSH_DELAY = 0.5
+
+# the number of lines added to the top of each instrumented file
+NUM_INSTRUMENTATION_LINES = INSTRUMENTATION.count('\n')
+
+_SOURCE_EXTENSIONS = ('.cpp', '.cc', '.c', '.h', '.hh', '.hpp', '.cxx')
+_MARKER = '### houston:'
+_MARKER_SOURCES = _MARKER + 'sources'
+_MARKER_COVERAGE = _MARKER + 'coverage '
+
+
+def snapshot_command(directory: str) -> str:
+    """
+    Returns a shell command that signals the SITL process to flush its gcov
+    data, and moves that data to /tmp/<directory>.
+    """
+    cmd = ('pkill -10 -o -f ^{source}; '
+           'sleep {delay}; '
+           'mkdir -p /tmp/{dir} && '
+           'find . -name "*.gcda" -exec cp --parents -t /tmp/{dir}/ {{}} + && '
+           'find . -name "*.gcda" -delete')
+    return cmd.format(source=SOURCE_DIR, delay=FLUSH_DELAY, dir=directory)
+
+
+def _find_sources() -> str:
+    names = ' -o '.join('-name "*{}"'.format(e) for e in _SOURCE_EXTENSIONS)
+    return 'find . -type f \\( {} \\)'.format(names)
+
+
+def universe_command() -> str:
+    """
+    Returns a shell command that counts the lines of each ArduPilot source
+    file. Its output may be parsed by :func:`parse_universe`.
+    """
+    return 'cd {} && {} -exec wc -l {{}} +'.format(SOURCE_DIR, _find_sources())
+
+
+def parse_universe(output: str,
+                   instrumented: Iterable[str] = ()
+                   ) -> LineUniverse:
+    """
+    Parses the output of :func:`universe_command` to obtain the universe of
+    ArduPilot source lines, relative to the ArduPilot source directory. The
+    lines added to each of the given instrumented files are discounted.
+    """
+    instrumented = frozenset(instrumented)
+    line_counts = {}  # type: Dict[str, int]
+    for line in output.splitlines():
+        parts = line.split(None, 1)
+        if len(parts) != 2 or not parts[1].startswith('./'):
+            continue
+        fn = parts[1][2:]
+        # wc doesn't count a final line that lacks a trailing newline
+        num_lines = int(parts[0]) + 1
+        if fn in instrumented:
+            num_lines = max(num_lines - NUM_INSTRUMENTATION_LINES, 0)
+        line_counts[fn] = num_lines
+    return LineUniverse(line_counts)
+
+
+def extract_command(directories: Sequence[str]) -> str:
+    """
+    Returns a shell command that lists the source files for ArduPilot, and,
+    for each of the given directories, restores the gcov data that was moved
+    to that directory and prints a gcovr report of the lines that it covers.
+    Each part of the output is preceded by a marker line.
+    """
+    parts = ['cd {}'.format(SOURCE_DIR),
+             'echo "{}"'.format(_MARKER_SOURCES),
+             _find_sources()]
+    for directory in directories:
+        tmp = '/tmp/{}'.format(directory)
+        parts += [
+            'find . -name "*.gcda" -delete',
+            '( cd {tmp}/ardupilot 2>/dev/null && find . -name "*.gcda" -exec cp --parents -t {source} {{}} + )'.format(tmp=tmp, source=SOURCE_DIR),  # noqa: pycodestyle
+            'echo "{}{}"'.format(_MARKER_COVERAGE, directory),
+            'gcovr -x -d -r . 2>/dev/null',
+            'rm -rf {}'.format(tmp)]
+    parts.append('find . -name "*.gcda" -delete')
+    return '; '.join(parts)
+
+
+def _read_report(report: str,
+                 sources: Set[str],
+                 instrumented: FrozenSet[str]
+                 ) -> FileLineSet:
+    """
+    Reads the set of covered lines from a gcovr XML report.
+    """
+    def resolve(fn: str) -> Optional[str]:
+        # gcovr may report paths that are prefixed by a build directory
+        parts = fn.split('/')
+        for i in range(len(parts)):
+            candidate = '/'.join(parts[i:])
+            if candidate in sources:
+                return candidate
+        return None
+
+    files_to_lines = {}  # type: Dict[str, Set[int]]
+    if not report.strip():
+        return FileLineSet(files_to_lines)
+    try:
+        root = ET.fromstring(report)
+    except ET.ParseError:
+        logger.exception("failed to parse gcovr report")
+        return FileLineSet(files_to_lines)
+    for cls in root.iter('class'):
+        lines = set(int(line.attrib['number'])
+                    for line in cls.iter('line')
+                    if int(line.attrib['hits']) > 0)
+        if not lines:
+            continue
+        fn = resolve(cls.attrib['filename'])
+        if fn is None:
+            logger.warning("failed to resolve file: %s",
+                           cls.attrib['filename'])
+            continue
+        # discount the lines that were added by the instrumentation
+        if fn in instrumented:
+            lines = set(line - NUM_INSTRUMENTATION_LINES for line in lines
+                        if line > NUM_INSTRUMENTATION_LINES)
+        files_to_lines.setdefault(fn, set()).update(lines)
+    return FileLineSet(files_to_lines)
+
+
+def parse_coverage(output: str,
+                   instrumented: Iterable[str] = ()
+                   ) -> Dict[str, FileLineSet]:
+    """
+    Parses the output of a command produced by :func:`extract_command`.
+
+    Parameters:
+        output: the output of the command.
+        instrumented: the source files, relative to the ArduPilot source
+            directory, to which instrumentation was added.
+
+    Returns:
+        a mapping from each directory to the lines that it covers.
+    """
+    instrumented = frozenset(instrumented)
+    sources = set()  # type: Set[str]
+    sections = []  # type: List[List[str]]
+    directories = []  # type: List[str]
+    current = None  # type: Optional[List[str]]
+    for line in output.splitlines():
+        if line == _MARKER_SOURCES:
+            current = None
+            continue
+        if line.startswith(_MARKER_COVERAGE):
+            directories.append(line[len(_MARKER_COVERAGE):])
+            current = []
+            sections.append(current)
+            continue
+        if current is None:
+            line = line.strip()
+            if line.startswith('./'):
+                line = line[2:]
+            if line:
+                sources.add(line)
+        else:
+            current.append(line)
+    return {directory: _read_report('\n'.join(lines), sources, instrumented)
+            for directory, lines in zip(directories, sections)}
@@ -1,4 +1,6 @@
-from typing import Optional, Sequence
+from typing import Dict, FrozenSet, List, Optional, Sequence, Tuple
+import asyncio
+import functools
 import time
 import shlex
 from timeit import default_timer as timer
@@ -10,15 +12,23 @@ import logging
 import docker
 import dronekit
 from bugzoo.client import Client as BugZooClient
+from bugzoo.core.container import Container
+from bugzoo.core.fileline import FileLineSet
 from pymavlink import mavutil
 
+from .aio import AsyncMAVLinkConnection
+from .coverage import snapshot_command, extract_command, parse_coverage, \
+    parse_universe, universe_command, SOURCE_DIR
 from .home import HomeLocation
-from .connection import CommandLong, MAVLinkConnection, MAVLinkMessage
+from .connection import CommandLong, MAVLinkConnection, MAVLinkMessage, \
+    MAVLinkGeneralMessage
+from ..coverage import CoverageBitmap, LineUniverse
 from ..util import Stopwatch
-from ..sandbox import Sandbox as BaseSandbox
+from ..sandbox import Sandbox as BaseSandbox, cached_trace
 from ..command import Command, CommandOutcome
 from ..connection import Message
 from ..mission import MissionOutcome
+from ..state import State
 from ..trace import MissionTrace, CommandTrace, TraceRecorder
 from ..exceptions import NoConnectionError, \
     ConnectionLostError, \
@@ -30,6 +40,20 @@ logger.setLevel(logging.DEBUG)
 
 TIME_LOST_CONNECTION = 5.0
 
+# the line universe of each snapshot, computed once per snapshot
+_UNIVERSES = {}  # type: Dict[str, LineUniverse]
+_UNIVERSES_LOCK = threading.Lock()
+
+# the messages that are used to track the progress of a mission
+MISSION_PROGRESS_MESSAGES = \
+    frozenset(['MISSION_ITEM_REACHED', 'MISSION_CURRENT', 'MISSION_ACK'])
+
+# the EKF must provide these estimates before the vehicle can be used
+EKF_FLAGS_REQUIRED = \
+    mavutil.mavlink.EKF_ATTITUDE | \
+    mavutil.mavlink.EKF_VELOCITY_HORIZ | \
+    mavutil.mavlink.EKF_POS_HORIZ_ABS
+
 
 def detect_lost_connection(f):
     """
@@ -45,6 +69,80 @@ def detect_lost_connection(f):
     return wrapped
 
 
+class _ReadinessMonitor(object):
+    """
+    Watches the MAVLink messages produced by a vehicle during startup to
+    determine when it has obtained a 3D GPS fix (GPS_RAW_INT), a usable EKF
+    solution (EKF_STATUS_REPORT), and a home position (HOME_POSITION).
+    """
+    MESSAGE_NAMES = \
+        frozenset(['GPS_RAW_INT', 'EKF_STATUS_REPORT', 'HOME_POSITION'])
+
+    def __init__(self, stopwatch: Stopwatch) -> None:
+        self.__stopwatch = stopwatch
+        self.__lock = threading.Lock()
+        self.__ready = threading.Condition(self.__lock)
+        self.__times = {}  # type: Dict[str, float]
+
+    @property
+    def times(self) -> Dict[str, float]:
+        """
+        The time, according to the startup stopwatch, at which each readiness
+        condition was first met.
+        """
+        with self.__lock:
+            return dict(self.__times)
+
+    def _mark(self, condition: str) -> None:
+        with self.__ready:
+            if condition not in self.__times:
+                self.__times[condition] = self.__stopwatch.duration
+                self.__ready.notify_all()
+
+    def seed(self, vehicle: dronekit.Vehicle) -> None:
+        """
+        Accounts for any messages that were processed by dronekit before the
+        monitor was attached to the connection.
+        """
+        fix_type = vehicle.gps_0.fix_type if vehicle.gps_0 else None
+        if fix_type is not None and \
+                fix_type >= mavutil.mavlink.GPS_FIX_TYPE_3D_FIX:
+            self._mark('fix')
+        if vehicle.ekf_ok:
+            self._mark('ekf')
+        if vehicle.home_location is not None:
+            self._mark('home')
+
+    def observe(self, m: MAVLinkGeneralMessage) -> None:
+        if not isinstance(m, MAVLinkMessage):
+            return
+        name = m.name
+        message = m.message
+        if name == 'GPS_RAW_INT':
+            if message.fix_type >= mavutil.mavlink.GPS_FIX_TYPE_3D_FIX:
+                self._mark('fix')
+        elif name == 'EKF_STATUS_REPORT':
+            flags = message.flags
+            const_pos_mode = flags & mavutil.mavlink.EKF_CONST_POS_MODE
+            if (flags & EKF_FLAGS_REQUIRED) == EKF_FLAGS_REQUIRED and \
+                    not const_pos_mode:
+                self._mark('ekf')
+        elif name == 'HOME_POSITION':
+            self._mark('home')
+
+    def wait(self, timeout: float) -> bool:
+        """
+        Blocks until all readiness conditions have been met, or until a
+        timeout occurs.
+
+        Returns:
+            True if the vehicle is ready, or False if a timeout occurred.
+        """
+        with self.__ready:
+            return self.__ready.wait_for(
+                lambda: len(self.__times) == 3, timeout)
+
+
 class Sandbox(BaseSandbox):
     def __init__(self,
                  *args,
@@ -55,6 +153,7 @@ class Sandbox(BaseSandbox):
         self.__connection = None
         self.__sitl_thread = None
         self.__fn_log = None  # type: Optional[str]
+        self.__instrumented = None  # type: Optional[FrozenSet[str]]
         if home:
             self.__home = home
         else:
@@ -63,6 +162,21 @@ class Sandbox(BaseSandbox):
                                        altitude=584,
                                        heading=270)
 
+    @classmethod
+    def reset_container(cls,
+                        client_bugzoo: BugZooClient,
+                        container: Container
+                        ) -> None:
+        """
+        Removes the virtual EEPROM written by the SITL, which would otherwise
+        carry parameters and waypoints over to the next sandbox. The SITL is
+        launched from the working directory of the image (i.e., the ArduPilot
+        source directory), and writes its EEPROM to that directory.
+        """
+        fn_eeprom = os.path.join(SOURCE_DIR, 'eeprom.bin')
+        cmd = 'rm -f {}'.format(shlex.quote(fn_eeprom))
+        client_bugzoo.containers.command(container, cmd, context=SOURCE_DIR)
+
     @property
     def home(self) -> HomeLocation:
         return self.__home
@@ -107,10 +221,15 @@ class Sandbox(BaseSandbox):
 
     def update(self, message: Message) -> None:
         with self.__state_lock:
-            state = self.__state.evolve(message,
-                                        self.running_time,
-                                        self.connection)
+            state_old = self.__state
+            state = state_old.evolve(message,
+                                     self.running_time,
+                                     self.connection)
+            # messages that do not affect the state are dropped
+            if state is state_old:
+                return
             self.__state = state
+            self.__state_changed.notify_all()
             if self.recorder:
                 self.recorder.record_state(state)
                 self.recorder.record_message(message)
@@ -119,11 +238,13 @@ class Sandbox(BaseSandbox):
                      name_bin: str = 'ardurover',
                      name_model: str = 'rover',
                      fn_param: str = '',  # FIXME what are the semantics of an empty string?  # noqa: pycodestyle
-                     verbose: bool = True
+                     verbose: bool = True,
+                     *,
+                     detach: bool = False
                      ) -> None:
         """
         Launches the SITL inside the sandbox and blocks until its execution
-        has finished.
+        has finished. If detached, returns as soon as the SITL is launched.
         """
         bzc = self._bugzoo.containers
 
@@ -156,6 +277,10 @@ class Sandbox(BaseSandbox):
                                       tty=True,
                                       stdout=True,
                                       stderr=True)
+        if detach:
+            docker_api.exec_start(resp['Id'], detach=True)
+            logger.debug("started SITL")
+            return
         output = docker_api.exec_start(resp['Id'], stream=verbose)
         logger.debug("started SITL")
         if verbose:
@@ -186,11 +311,13 @@ class Sandbox(BaseSandbox):
                 ready to accept commands.
         """
         stopwatch = Stopwatch()
+        stopwatch.start()
         speedup = self.configuration.speedup
         timeout_set_mode = (15 / speedup + 2) + 30
         timeout_3d_fix = (10 / speedup + 2) + 30
         timeout_state = (90 / speedup + 2) + 30
         timeout_mavlink = 60
+        readiness = _ReadinessMonitor(stopwatch)
 
         bzc = self._bugzoo.containers
         args = (binary_name, model_name, param_file, verbose)
@@ -205,53 +332,186 @@ class Sandbox(BaseSandbox):
         ip = str(bzc.ip_address(self.container))
         url = "{}:{}:{}".format(protocol, ip, port)
         logger.debug("connecting to SITL at %s", url)
+        time_connect = stopwatch.duration
         try:
             self.__connection = MAVLinkConnection(url,
-                                                  {'update': self.update},
                                                   timeout=timeout_mavlink)
         except dronekit.APIException:
             raise NoConnectionError
+        self._attach_startup_hooks(readiness)
+        for phase, t in self.__connection.timings.items():
+            self._record_startup_phase(phase, time_connect + t)
+
+        # wait for a 3D fix, a usable EKF solution, and a home position
+        readiness.seed(self.vehicle)
+        time_ready = stopwatch.duration + timeout_3d_fix + timeout_state
+        if not readiness.wait(time_ready - stopwatch.duration):
+            logger.error("vehicle failed to become ready: %s",
+                         readiness.times)
+            raise VehicleNotReadyError
+        for phase, t in readiness.times.items():
+            self._record_startup_phase(phase, t)
+
         # wait for longitude and latitude to match their expected values, and
         # for the system to match the expected `armable` state.
-        initial_lon = self.state_initial['longitude']
-        initial_lat = self.state_initial['latitude']
-        initial_armable = self.state_initial['armable']
-        v = self.state_initial.__class__.variables
-
-        # FIXME wait for 3D fix
-        time.sleep(timeout_3d_fix)
-
-        stopwatch.reset()
-        stopwatch.start()
-        while True:
-            ready_lon = v['longitude'].eq(initial_lon, self.state['longitude'])
-            ready_lat = v['latitude'].eq(initial_lat, self.state['latitude'])
-            ready_armable = self.state['armable'] == initial_armable
-            if ready_lon and ready_lat and ready_armable:
-                break
-            if stopwatch.duration > timeout_state:
-                logger.error("latitude should be [%f] but was [%f]",
-                             initial_lat, self.state['latitude'])
-                logger.error("longitude should be [%f] but was [%f]",
-                             initial_lon, self.state['longitude'])
-                logger.error("armable should be [%s] but was [%s]",
-                             initial_armable, self.state['armable'])
+        state = self.state
+        while not self._matches_initial_state(state):
+            time_left = time_ready - stopwatch.duration
+            if time_left <= 0:
+                self._log_initial_state_mismatch(state)
                 raise VehicleNotReadyError
-            time.sleep(0.05)
+            state = self.wait_for_state(state, time_left)
+        self._record_startup_phase('state', stopwatch.duration)
 
         if not self._on_connected():
             raise PostConnectionSetupFailed
 
         # wait until the vehicle is in GUIDED mode
         guided_mode = dronekit.VehicleMode('GUIDED')
-        self.vehicle.mode = guided_mode
-        stopwatch.reset()
-        stopwatch.start()
-        while self.vehicle.mode != guided_mode:
-            if stopwatch.duration > timeout_set_mode:
+        mode_changed = threading.Event()
+
+        def mode_listener(_, __, mode):
+            if mode == guided_mode:
+                mode_changed.set()
+
+        self.vehicle.add_attribute_listener('mode', mode_listener)
+        try:
+            self.vehicle.mode = guided_mode
+            if self.vehicle.mode == guided_mode:
+                mode_changed.set()
+            if not mode_changed.wait(timeout_set_mode):
                 logger.error('vehicle is not in guided mode')
                 raise VehicleNotReadyError
-            time.sleep(0.05)
+        finally:
+            self.vehicle.remove_attribute_listener('mode', mode_listener)
+        self._record_startup_phase('guided', stopwatch.duration)
+        logger.info("sandbox startup timings: %s", self.startup_timings)
+
+    def _attach_startup_hooks(self, readiness: _ReadinessMonitor) -> None:
+        """
+        Subscribes the state of this sandbox and a given readiness monitor to
+        the messages that they depend upon.
+        """
+        state_class = self.state_initial.__class__
+        self.connection.add_hooks({'update': self.update},
+                                  state_class.message_names)
+        self.connection.add_hooks({'readiness': readiness.observe},
+                                  _ReadinessMonitor.MESSAGE_NAMES)
+
+    def _matches_initial_state(self, state: State) -> bool:
+        """
+        Determines whether the longitude, latitude, and `armable` state of the
+        vehicle match those of the initial state of this sandbox.
+        """
+        initial = self.state_initial
+        v = initial.__class__.variables
+        return v['longitude'].eq(initial['longitude'], state['longitude']) \
+            and v['latitude'].eq(initial['latitude'], state['latitude']) \
+            and state['armable'] == initial['armable']
+
+    def _log_initial_state_mismatch(self, state: State) -> None:
+        initial = self.state_initial
+        logger.error("latitude should be [%f] but was [%f]",
+                     initial['latitude'], state['latitude'])
+        logger.error("longitude should be [%f] but was [%f]",
+                     initial['longitude'], state['longitude'])
+        logger.error("armable should be [%s] but was [%s]",
+                     initial['armable'], state['armable'])
+
+    async def start_async(self,
+                          binary_name: str,
+                          model_name: str,
+                          param_file: str
+                          ) -> None:
+        """
+        Launches the SITL inside this sandbox, and establishes an asyncio
+        connection to the vehicle running inside the simulation. Unlike
+        :meth:`start`, no thread is dedicated to either the SITL or the
+        connection.
+
+        Raises:
+            NoConnectionError: if a connection cannot be established.
+            ConnectionLostError: if the connecton is lost before the vehicle
+                is ready to receive commands.
+            PostConnectionSetupFailed: if the post-connection setup phase
+                failed.
+            VehicleNotReadyError: if a timeout occurred before the vehicle was
+                ready to accept commands.
+        """
+        loop = asyncio.get_event_loop()
+        stopwatch = Stopwatch()
+        stopwatch.start()
+        speedup = self.configuration.speedup
+        timeout_set_mode = (15 / speedup + 2) + 30
+        timeout_3d_fix = (10 / speedup + 2) + 30
+        timeout_state = (90 / speedup + 2) + 30
+        timeout_mavlink = 60
+        readiness = _ReadinessMonitor(stopwatch)
+
+        # calls to BugZoo and Docker are blocking, but short-lived
+        bzc = self._bugzoo.containers
+        launch = functools.partial(self._launch_sitl,
+                                   binary_name,
+                                   model_name,
+                                   param_file,
+                                   detach=True)
+        await loop.run_in_executor(None, launch)
+        ip = await loop.run_in_executor(None, bzc.ip_address, self.container)
+
+        # establish connection
+        port = 5760
+        logger.debug("connecting to SITL at %s:%d", ip, port)
+        time_connect = stopwatch.duration
+        try:
+            connection = await AsyncMAVLinkConnection.open(
+                str(ip), port, timeout=timeout_mavlink)
+        except (OSError, asyncio.TimeoutError):
+            raise NoConnectionError
+        self.__connection = connection
+        self._attach_startup_hooks(readiness)
+        for phase, t in connection.timings.items():
+            self._record_startup_phase(phase, time_connect + t)
+
+        # wait for a 3D fix, a usable EKF solution, and a home position
+        readiness.seed(connection.conn)
+        time_ready = stopwatch.duration + timeout_3d_fix + timeout_state
+        is_ready = lambda: len(readiness.times) == 3
+        if not await connection.wait_until(is_ready,
+                                           time_ready - stopwatch.duration):
+            if connection.closed:
+                raise ConnectionLostError
+            logger.error("vehicle failed to become ready: %s",
+                         readiness.times)
+            raise VehicleNotReadyError
+        for phase, t in readiness.times.items():
+            self._record_startup_phase(phase, t)
+
+        # wait for the state of the vehicle to match the initial state
+        is_initial = lambda: self._matches_initial_state(self.state)
+        if not await connection.wait_until(is_initial,
+                                           time_ready - stopwatch.duration):
+            self._log_initial_state_mismatch(self.state)
+            raise VehicleNotReadyError
+        self._record_startup_phase('state', stopwatch.duration)
+
+        if not self._on_connected():
+            raise PostConnectionSetupFailed
+
+        if not await connection.set_mode('GUIDED', timeout_set_mode):
+            logger.error('vehicle is not in guided mode')
+            raise VehicleNotReadyError
+        self._record_startup_phase('guided', stopwatch.duration)
+        logger.info("sandbox startup timings: %s", self.startup_timings)
+
+    async def stop_async(self) -> None:
+        """
+        Closes the asyncio connection to the vehicle and stops the SITL.
+        """
+        connection = self.__connection
+        if connection:
+            self.__connection = None
+            await connection.wait_closed()
+        await asyncio.get_event_loop().run_in_executor(None, self.stop)
 
     def stop(self) -> None:
         logger.debug("Stopping SITL")
@@ -277,9 +537,10 @@ class Sandbox(BaseSandbox):
                 logger.debug("killed process: %s", pid)
                 break
         logger.debug("Killed it")
-        logger.debug("Joining thread")
-        self.__sitl_thread.join()
-        logger.debug("Joined")
+        if self.__sitl_thread:
+            logger.debug("Joining thread")
+            self.__sitl_thread.join()
+            logger.debug("Joined")
 #       cmd = 'ps aux | grep -i sitl | awk {\'"\'"\'print $2\'"\'"\'} | xargs kill -2'  # noqa: pycodestyle
 #       bzc.command(self.container, cmd, stdout=False, stderr=False)
 
@@ -290,9 +551,12 @@ class Sandbox(BaseSandbox):
         return True
 
     @detect_lost_connection
+    @cached_trace
     def run_and_trace(self,
                       commands: Sequence[Command],
-                      collect_coverage: bool = False
+                      collect_coverage: bool = False,
+                      *,
+                      columnar: bool = False
                       ) -> 'MissionTrace':
         """
         Executes a mission, represented as a sequence of commands, and
@@ -305,6 +569,8 @@ class Sandbox(BaseSandbox):
                 should be incorporated into the trace. If True (i.e., coverage
                 collection is enabled), this function expects the sandbox to be
                 properly instrumented.
+            columnar: indicates whether states should be recorded into typed
+                columns, rather than as individual state objects.
 
         Returns:
             a trace describing the execution of a sequence of commands.
@@ -315,37 +581,11 @@ class Sandbox(BaseSandbox):
         timeout_command = 300 / speedup + 5
         timeout_arm = 10 / speedup + 5
         timeout_mission_upload = 20
-        # the number of seconds for the delay added after DO commands
-        do_delay = max(4, int(20 / speedup))
         with self.__lock:
             outcomes = []  # type: List[CommandOutcome]
             passed = True
             connection_lost = threading.Event()
-
-            # FIXME The initial command should be based on initial state
-            initial = dronekit.Command(0, 0, 0,
-                                       0, 16, 0, 0,
-                                       0.0, 0.0, 0.0, 0.0,
-                                       -35.3632607, 149.1652351, 584)
-            # delay to allow the robot to reach its stable state
-            delay = dronekit.Command(0, 0, 0,
-                                     3, 93, 0, 0,
-                                     do_delay, -1, -1, -1,
-                                     0, 0, 0)
-
-            # converting from Houston commands to dronekit commands
-            dronekitcmd_to_cmd_mapping = {}
-            cmds = [initial]
-            for i, cmd in enumerate(commands):
-                dronekitcmd_to_cmd_mapping[len(cmds)] = i
-                cmds.append(cmd.to_message().to_dronekit_command())
-                # DO commands trigger some action and return.
-                # we add a delay after them to see how they affect the state.
-                if 'MAV_CMD_DO_' in cmd.__class__.uid:
-                    dronekitcmd_to_cmd_mapping[len(cmds)] = i
-                    cmds.append(delay)
-            logger.debug("Final mission commands len: %d, mapping: %s",
-                         len(cmds), dronekitcmd_to_cmd_mapping)
+            cmds, dronekitcmd_to_cmd_mapping = self._build_mission(commands)
 
             # uploading the mission to the vehicle
             vcmds = self.vehicle.commands
@@ -395,7 +635,8 @@ class Sandbox(BaseSandbox):
                 elif name == 'MISSION_ACK':
                     logger.debug("**MISSION_ACK: %s", message.type)
 
-            self.connection.add_hooks({'check_for_reached': check_for_reached})
+            self.connection.add_hooks({'check_for_reached': check_for_reached},
+                                      MISSION_PROGRESS_MESSAGES)
 
             stopwatch = Stopwatch()
             stopwatch.start()
@@ -417,10 +658,13 @@ class Sandbox(BaseSandbox):
             time_start = timer()
 
             wp_to_traces = {}
-            with self.record() as recorder:
+            with self.record(columnar) as recorder:
                 while last_wp[0] <= len(cmds) - 1:
                     logger.debug("waiting for command")
-                    not_reached_timeout = wp_event.wait(timeout_command)
+                    timeout = self._mission_item_timeout(
+                        commands, dronekitcmd_to_cmd_mapping, last_wp[0],
+                        timeout_command)
+                    not_reached_timeout = wp_event.wait(timeout)
                     logger.debug("Event set %s", last_wp)
                     if not not_reached_timeout:
                         logger.error("Timeout occured %d", last_wp[0])
@@ -457,54 +701,243 @@ class Sandbox(BaseSandbox):
             logger.debug("Removed hook")
 
             if collect_coverage:
-                for cmd_index, command in enumerate(commands):
-                    if cmd_index in wp_to_traces:
-                        directory = 'command{}'.format(cmd_index)
-                        coverage = self.__get_coverage(directory=directory)
-                        wp_to_traces[cmd_index].add_coverage(coverage)
+                self.__add_coverage(wp_to_traces)
 
             traces = [wp_to_traces[k] for k in sorted(wp_to_traces.keys())]
             return MissionTrace(tuple(traces))
 
-    def __get_coverage(self, directory: str) -> "FileLineSet":
+    def _mission_item_timeout(self,
+                              commands: Sequence[Command],
+                              mapping: Dict[int, int],
+                              item: int,
+                              default: float
+                              ) -> float:
         """
-        Copies gcda files from /tmp/<directory> to /opt/ardupilot
-        (where the source code is) and collects coverage results.
+        Determines the maximum length of time to wait for the vehicle to
+        move beyond a given item of the mission, based on the command that
+        the item belongs to.
         """
-        bzc = self._bugzoo.containers
-        rm_cmd = 'cd /opt/ardupilot/ && find . -name *.gcda | xargs rm'
-        cp_cmd = 'cd /tmp/{}/ardupilot && find . -name *.gcda -exec cp --parents \\{{\\}} /opt/ardupilot \\;'  # noqa: pycodestyle
-        cp_cmd = cp_cmd.format(directory)
+        if item not in mapping:
+            return default
+        command = commands[mapping[item]]
+        return self._command_timeout(command, self.state, default)
+
+    def _build_mission(self,
+                       commands: Sequence[Command]
+                       ) -> Tuple[List[dronekit.Command], Dict[int, int]]:
+        """
+        Converts a sequence of Houston commands into the dronekit commands
+        that make up the corresponding mission.
+
+        Returns:
+            a tuple of the dronekit commands for the mission, and a mapping
+            from the index of each mission item to the index of the Houston
+            command that it belongs to.
+        """
+        # the number of seconds for the delay added after DO commands
+        do_delay = max(4, int(20 / self.configuration.speedup))
+
+        # FIXME The initial command should be based on initial state
+        initial = dronekit.Command(0, 0, 0,
+                                   0, 16, 0, 0,
+                                   0.0, 0.0, 0.0, 0.0,
+                                   -35.3632607, 149.1652351, 584)
+        # delay to allow the robot to reach its stable state
+        delay = dronekit.Command(0, 0, 0,
+                                 3, 93, 0, 0,
+                                 do_delay, -1, -1, -1,
+                                 0, 0, 0)
+
+        # converting from Houston commands to dronekit commands
+        dronekitcmd_to_cmd_mapping = {}  # type: Dict[int, int]
+        cmds = [initial]
+        for i, cmd in enumerate(commands):
+            dronekitcmd_to_cmd_mapping[len(cmds)] = i
+            cmds.append(cmd.to_message().to_dronekit_command())
+            # DO commands trigger some action and return.
+            # we add a delay after them to see how they affect the state.
+            if 'MAV_CMD_DO_' in cmd.__class__.uid:
+                dronekitcmd_to_cmd_mapping[len(cmds)] = i
+                cmds.append(delay)
+        logger.debug("Final mission commands len: %d, mapping: %s",
+                     len(cmds), dronekitcmd_to_cmd_mapping)
+        return cmds, dronekitcmd_to_cmd_mapping
+
+    @cached_trace
+    async def run_and_trace_async(self,
+                                  commands: Sequence[Command],
+                                  collect_coverage: bool = False,
+                                  *,
+                                  columnar: bool = False
+                                  ) -> MissionTrace:
+        """
+        Executes a mission via the asyncio connection established by
+        :meth:`start_async`, and returns its trace. Behaves identically to
+        :meth:`run_and_trace`, but allows many sandboxes to be driven by a
+        single event loop.
+        """
+        loop = asyncio.get_event_loop()
+        speedup = self.configuration.speedup
+        timeout_command = 300 / speedup + 5
+        timeout_arm = 10 / speedup + 5
+        timeout_mission_upload = 20
+        connection = self.connection
+        vehicle = connection.conn
+
+        cmds, dronekitcmd_to_cmd_mapping = self._build_mission(commands)
+        if not await connection.upload_mission(cmds, timeout_mission_upload):
+            if connection.closed:
+                raise ConnectionLostError
+            raise PostConnectionSetupFailed("failed to upload mission.")
+        logger.debug("Mission uploaded")
+
+        # [wp that has last been reached, wp running at the moment]
+        last_wp = [0, 0]
+        # is set whenever a command in mission is done
+        wp_event = asyncio.Event()
+
+        def check_for_reached(m):
+            name = m.name
+            message = m.message
+            if name == 'MISSION_ITEM_REACHED':
+                logger.debug("**MISSION_ITEM_REACHED: %d", message.seq)
+                if message.seq == len(cmds) - 1:
+                    logger.info("Last item reached")
+                    last_wp[1] = int(message.seq) + 1
+                    wp_event.set()
+            elif name == 'MISSION_CURRENT':
+                logger.debug("**MISSION_CURRENT: %d", message.seq)
+                if message.seq > last_wp[1] and message.seq > last_wp[0]:
+                    last_wp[1] = message.seq
+                    wp_event.set()
 
-        bzc.command(self.container, rm_cmd)
-        bzc.command(self.container, cp_cmd)
-        coverage = bzc.extract_coverage(self.container)
-        bzc.command(self.container, rm_cmd)
-        return coverage
+        def is_connection_lost() -> bool:
+            if connection.closed:
+                return True
+            time_since_heartbeat = vehicle.last_heartbeat
+            if time_since_heartbeat is None:
+                return False
+            return time_since_heartbeat > TIME_LOST_CONNECTION
+
+        connection.add_hooks({'check_for_reached': check_for_reached},
+                             MISSION_PROGRESS_MESSAGES)
+        try:
+            if not await connection.arm(timeout_arm):
+                raise VehicleNotReadyError
+
+            # starting the mission
+            if not await connection.set_mode('AUTO', timeout_arm):
+                raise VehicleNotReadyError
+            start_message = CommandLong(
+                0, 0, 300, 0, 1, len(cmds) + 1, 0, 0, 0, 0, 4)
+            connection.send(start_message)
+            logger.debug("sent mission start message to vehicle")
+
+            wp_to_traces = {}  # type: Dict[int, CommandTrace]
+            with self.record(columnar) as recorder:
+                while last_wp[0] <= len(cmds) - 1:
+                    logger.debug("waiting for command")
+                    # wake up periodically to check for a lost connection
+                    timeout = self._mission_item_timeout(
+                        commands, dronekitcmd_to_cmd_mapping, last_wp[0],
+                        timeout_command)
+                    time_end = loop.time() + timeout
+                    while not wp_event.is_set():
+                        if is_connection_lost():
+                            logger.error("Connection to vehicle was lost.")
+                            raise ConnectionLostError
+                        time_left = time_end - loop.time()
+                        if time_left <= 0:
+                            break
+                        await connection.wait_until(
+                            wp_event.is_set,
+                            min(time_left, TIME_LOST_CONNECTION))
+                    if not wp_event.is_set():
+                        logger.error("Timeout occured %d", last_wp[0])
+                        break
+                    logger.info("last_wp: %s len: %d",
+                                str(last_wp), len(cmds))
+                    states, messages = recorder.flush()
+                    if last_wp[0] > 0:
+                        cmd_index = dronekitcmd_to_cmd_mapping[last_wp[0]]
+                        cmd = commands[cmd_index]
+                        wp_to_traces[cmd_index] = CommandTrace(cmd, states)
+
+                        # if appropriate, store coverage files
+                        if collect_coverage:
+                            cm_directory = "command{}".format(cmd_index)
+                            await loop.run_in_executor(
+                                None,
+                                self.__copy_coverage_files,
+                                cm_directory)
+                    last_wp[0] = last_wp[1]
+                    wp_event.clear()
+        finally:
+            connection.remove_hook('check_for_reached')
+
+        if collect_coverage:
+            await loop.run_in_executor(None,
+                                       self.__add_coverage,
+                                       wp_to_traces)
+
+        traces = [wp_to_traces[k] for k in sorted(wp_to_traces.keys())]
+        return MissionTrace(tuple(traces))
+
+    def __add_coverage(self, traces: Dict[int, CommandTrace]) -> None:
+        """
+        Collects the coverage for each of a given set of command traces,
+        indexed by the position of their command within the mission, from
+        the gcov data that was stored by :meth:`__copy_coverage_files`.
+        Coverage for all commands is extracted by a single script.
+        """
+        directories = {i: 'command{}'.format(i) for i in traces}
+        cmd = extract_command([directories[i] for i in sorted(traces)])
+        out = self._bugzoo.containers.command(self.container, cmd)
+        coverage = parse_coverage(out.output, self.__instrumented_files())
+        universe = self.line_universe()
+        for i, trace in traces.items():
+            lines = coverage.get(directories[i], FileLineSet({}))
+            bitmap = CoverageBitmap.from_filelines(universe, lines)
+            if len(bitmap) < len(lines):
+                logger.warning("command %d covers lines outside of the universe of snapshot: %s",  # noqa: pycodestyle
+                               i, self.container.bug)
+            trace.add_coverage(bitmap)
+
+    def line_universe(self) -> LineUniverse:
+        """
+        The universe of ArduPilot source lines within the snapshot used by
+        this sandbox, over which coverage is recorded as bitmaps. The
+        universe is computed once for each snapshot.
+        """
+        name = self.container.bug
+        with _UNIVERSES_LOCK:
+            universe = _UNIVERSES.get(name)
+        if universe is None:
+            out = self._bugzoo.containers.command(self.container,
+                                                  universe_command())
+            universe = parse_universe(out.output,
+                                      self.__instrumented_files())
+            with _UNIVERSES_LOCK:
+                universe = _UNIVERSES.setdefault(name, universe)
+        return universe
+
+    def __instrumented_files(self) -> FrozenSet[str]:
+        """
+        The source files to which BugZoo added coverage instrumentation.
+        """
+        if self.__instrumented is None:
+            bug = self._bugzoo.bugs[self.container.bug]
+            instructions = bug.instructions_coverage
+            files = getattr(instructions, 'files_to_instrument', ())
+            self.__instrumented = frozenset(files)
+        return self.__instrumented
 
     def __copy_coverage_files(self, directory: str) -> None:
         """
-        Sends a SIGUSR1 signal to ardupilot processes running in the
-        container. They will flush gcov data into gcda files that
-        will be copied to /tmp/<directory> for later use.
+        Sends a SIGUSR1 signal to the ardupilot process running in the
+        container, which will flush its gcov data into gcda files. Those
+        files are then moved to /tmp/<directory> for later use by a single
+        in-container command.
         """
         bzc = self._bugzoo.containers
-        ps_cmd = 'ps aux | grep -i sitl | awk {\'"\'"\'print $2,$11\'"\'"\'}'
-        mv_cmd = 'find . -name *.gcda -exec cp --parents \\{{\\}} /tmp/{}/ \\;'
-        mv_cmd = mv_cmd.format(directory)
-        rm_cmd = 'find . -name *.gcda | xargs rm'
-
-        out = bzc.command(self.container, ps_cmd)
-        all_processes = out.output.splitlines()
-        logger.debug("checking list of processes: %s", str(all_processes))
-        for p in all_processes:
-            if not p:
-                continue
-            pid, cmd = p.split(' ')
-            if cmd.startswith('/opt/ardupilot'):
-                bzc.command(self.container, "kill -10 {}".format(pid))
-                break
-        # coverage = self._bugzoo.coverage.extract(self.container)
-        bzc.command(self.container, "mkdir /tmp/{}".format(directory))
-        bzc.command(self.container, mv_cmd)
-        bzc.command(self.container, rm_cmd)
+        bzc.command(self.container, snapshot_command(directory))
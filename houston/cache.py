@@ -0,0 +1,355 @@
+"""
+Provides a persistent, content-addressed cache of mission outcomes and
+traces, allowing the results of missions that have already been executed
+against a given snapshot to be reused without launching the system under
+test.
+
+Each result is identified by the name of the snapshot, a description of the
+mission, the speedup of the simulation, and whether or not coverage was
+collected. Results are stored as individual files within the cache
+directory: outcomes as JSON, and traces using the binary trace format.
+Files are written atomically, so the cache may safely be shared by several
+processes. If a size limit is given, the least recently used results are
+evicted from disk once the total size of the cache exceeds that limit. The
+total size of the cache is shared by all processes via a small file that
+is updated while holding a lock on the cache directory. Since other
+processes may have added, used, or evicted results, the cache is only
+re-indexed from disk once that total exceeds the limit.
+"""
+__all__ = ['ResultCache']
+
+from typing import Any, Iterator, List, Optional, Tuple
+from collections import OrderedDict
+from contextlib import contextmanager
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+from .mission import Mission, MissionOutcome
+from .trace import CommandTrace, MissionTrace
+from .tracefile import dump_traces, load_traces
+
+logger = logging.getLogger(__name__)  # type: logging.Logger
+logger.setLevel(logging.DEBUG)
+
+_EXT_OUTCOME = '.json'
+_EXT_TRACE = '.trace'
+_LOCK_FILE = '.lock'
+_SIZE_FILE = '.size'
+
+
+def _speedup(mission: Mission) -> Optional[Any]:
+    return getattr(mission.configuration, 'speedup', None)
+
+
+@contextmanager
+def _locked(filename: str) -> Iterator[None]:
+    """
+    Holds an exclusive lock on a given file, which is shared with any other
+    processes that lock the same file.
+    """
+    with open(filename, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class ResultCache(object):
+    """
+    A persistent cache of mission outcomes and traces, stored within a given
+    directory. If the directory already contains results, those results are
+    loaded into the cache.
+    """
+    def __init__(self,
+                 directory: str,
+                 max_size: Optional[int] = None
+                 ) -> None:
+        """
+        Parameters:
+            directory: the directory in which results should be stored.
+            max_size: the maximum total size, in bytes, of the results within
+                the cache. If None, the size of the cache is unbounded.
+        """
+        assert max_size is None or max_size >= 0
+        self.__directory = directory
+        self.__max_size = max_size
+        self.__lock = threading.Lock()
+        # maps the path of each result to its size, from least to most
+        # recently used
+        self.__entries = OrderedDict()  # type: OrderedDict
+        self.__size = 0
+        self.__hits = 0
+        self.__misses = 0
+        self.__fn_lock = os.path.join(directory, _LOCK_FILE)
+        self.__fn_size = os.path.join(directory, _SIZE_FILE)
+        os.makedirs(directory, exist_ok=True)
+        with _locked(self.__fn_lock):
+            self._load()
+            self._write_total_size(self.__size)
+        logger.info("loaded %d results from cache: %s",
+                    len(self.__entries), directory)
+
+    def _load(self) -> None:
+        """
+        Indexes the results that are stored within the cache directory,
+        ordered by the time at which they were last used, replacing any
+        existing index. Results that were last used at the same time, within
+        the resolution of the file system, retain their existing order.
+        """
+        rank = {path: i for (i, path) in enumerate(self.__entries)}
+        found = []  # type: List[Tuple[int, int, str, int]]
+        for dirpath, _, filenames in os.walk(self.__directory):
+            for fn in filenames:
+                if not fn.endswith((_EXT_OUTCOME, _EXT_TRACE)):
+                    continue
+                path = os.path.join(dirpath, fn)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                found.append((stat.st_mtime_ns, rank.get(path, -1), path,
+                              stat.st_size))
+        self.__entries = OrderedDict()
+        self.__size = 0
+        for _, _, path, size in sorted(found):
+            self.__entries[path] = size
+            self.__size += size
+
+    @property
+    def directory(self) -> str:
+        return self.__directory
+
+    @property
+    def max_size(self) -> Optional[int]:
+        return self.__max_size
+
+    @property
+    def size(self) -> int:
+        """
+        The total size, in bytes, of the results within this cache.
+        """
+        return self.__size
+
+    @property
+    def hits(self) -> int:
+        """
+        The number of lookups that were answered by this cache.
+        """
+        return self.__hits
+
+    @property
+    def misses(self) -> int:
+        """
+        The number of lookups that could not be answered by this cache.
+        """
+        return self.__misses
+
+    def __len__(self) -> int:
+        """
+        The number of results within this cache.
+        """
+        return len(self.__entries)
+
+    def _path(self,
+              kind: str,
+              snapshot: str,
+              mission: Mission,
+              coverage: bool
+              ) -> str:
+        """
+        Computes the location of a given result within the cache.
+        """
+        jsn = {'kind': kind,
+               'snapshot': snapshot,
+               'mission': mission.to_dict(),
+               'speedup': _speedup(mission),
+               'coverage': coverage}
+        jsn = json.dumps(jsn, sort_keys=True)
+        key = hashlib.sha1(jsn.encode('utf-8')).hexdigest()
+        ext = _EXT_TRACE if kind == 'trace' else _EXT_OUTCOME
+        return os.path.join(self.__directory, key[:2], key + ext)
+
+    def _read(self, path: str) -> Optional[bytes]:
+        """
+        Reads the contents of a given result, marking it as the most recently
+        used result, or returns None if the result isn't in the cache.
+        """
+        try:
+            with open(path, 'rb') as f:
+                contents = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            with self.__lock:
+                self.__misses += 1
+                size = self.__entries.pop(path, 0)
+                self.__size -= size
+            return None
+        with self.__lock:
+            self.__hits += 1
+            # the result may have been written by another process
+            if path not in self.__entries:
+                self.__entries[path] = len(contents)
+                self.__size += len(contents)
+            self.__entries.move_to_end(path)
+        return contents
+
+    def _read_total_size(self) -> int:
+        """
+        Returns the total size of the results within the cache directory,
+        as recorded by all processes that share this cache. If no valid
+        total has been recorded, the cache is re-indexed to compute it. Must
+        be called while holding the lock on the cache directory.
+        """
+        try:
+            with open(self.__fn_size, 'r') as f:
+                return int(f.read())
+        except (FileNotFoundError, ValueError):
+            self._load()
+            return self.__size
+
+    def _write_total_size(self, size: int) -> None:
+        """
+        Records the total size of the results within the cache directory.
+        Must be called while holding the lock on the cache directory.
+        """
+        with open(self.__fn_size, 'w') as f:
+            f.write(str(size))
+
+    def _write(self, path: str, contents: bytes) -> None:
+        """
+        Atomically writes a given result to the cache, before evicting the
+        least recently used results if the cache has grown too large.
+        """
+        dirname = os.path.dirname(path)
+        os.makedirs(dirname, exist_ok=True)
+        fd, fn_temp = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(contents)
+        except Exception:
+            os.remove(fn_temp)
+            raise
+        with self.__lock, _locked(self.__fn_lock):
+            total = self._read_total_size()
+            try:
+                total -= os.stat(path).st_size
+            except FileNotFoundError:
+                pass
+            try:
+                os.replace(fn_temp, path)
+            except Exception:
+                os.remove(fn_temp)
+                raise
+            total += len(contents)
+            self.__size -= self.__entries.pop(path, 0)
+            self.__entries[path] = len(contents)
+            self.__size += len(contents)
+
+            # other processes may have changed the contents of the cache
+            if self.__max_size is not None and total > self.__max_size:
+                self._load()
+                # the result that was just written is never evicted
+                if path in self.__entries:
+                    self.__entries.move_to_end(path)
+                for path_evicted in self._evict():
+                    logger.debug("evicting result from cache: %s",
+                                 path_evicted)
+                    try:
+                        os.remove(path_evicted)
+                    except FileNotFoundError:
+                        pass
+                total = self.__size
+            self._write_total_size(total)
+
+    def _evict(self) -> List[str]:
+        """
+        Removes the least recently used results from the index until the
+        cache is within its size limit, and returns the paths of those
+        results. The most recently used result is never evicted.
+        """
+        evicted = []  # type: List[str]
+        if self.__max_size is None:
+            return evicted
+        while self.__size > self.__max_size and len(self.__entries) > 1:
+            path, size = self.__entries.popitem(last=False)
+            self.__size -= size
+            evicted.append(path)
+        return evicted
+
+    def get_outcome(self,
+                    snapshot: str,
+                    mission: Mission,
+                    *,
+                    coverage: bool = False
+                    ) -> Optional[MissionOutcome]:
+        """
+        Returns the cached outcome of a given mission on a given snapshot,
+        or None if there is no such outcome in the cache.
+        """
+        path = self._path('outcome', snapshot, mission, coverage)
+        contents = self._read(path)
+        if contents is None:
+            return None
+        jsn = json.loads(contents.decode('utf-8'))
+        return MissionOutcome.from_dict(jsn, mission.system)
+
+    def put_outcome(self,
+                    snapshot: str,
+                    mission: Mission,
+                    outcome: MissionOutcome,
+                    *,
+                    coverage: bool = False
+                    ) -> None:
+        """
+        Stores the outcome of a given mission on a given snapshot.
+        """
+        path = self._path('outcome', snapshot, mission, coverage)
+        contents = json.dumps(outcome.to_dict()).encode('utf-8')
+        self._write(path, contents)
+
+    def get_trace(self,
+                  snapshot: str,
+                  mission: Mission,
+                  *,
+                  coverage: bool = False,
+                  columnar: bool = False
+                  ) -> Optional[MissionTrace]:
+        """
+        Returns the cached trace of a given mission on a given snapshot, or
+        None if there is no such trace in the cache.
+
+        Parameters:
+            columnar: if True, the states of each command trace are provided
+                as a columnar view rather than as individual state objects.
+        """
+        path = self._path('trace', snapshot, mission, coverage)
+        contents = self._read(path)
+        if contents is None:
+            return None
+        _, traces = load_traces(contents, mission.system)
+        trace = traces[0]
+        if not columnar:
+            trace = MissionTrace(tuple(CommandTrace(t.command,
+                                                    tuple(t.states),
+                                                    t.coverage)
+                                       for t in trace.commands))
+        return trace
+
+    def put_trace(self,
+                  snapshot: str,
+                  mission: Mission,
+                  trace: MissionTrace,
+                  *,
+                  coverage: bool = False
+                  ) -> None:
+        """
+        Stores the trace of a given mission on a given snapshot.
+        """
+        path = self._path('trace', snapshot, mission, coverage)
+        self._write(path, dump_traces([trace], mission.system, compress=True))
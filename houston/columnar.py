@@ -0,0 +1,199 @@
+__all__ = ['ColumnBuffer', 'StateColumns', 'dtype_for']
+
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, \
+    Type, Union
+import logging
+
+import numpy as np
+
+from .state import State
+
+logger = logging.getLogger(__name__)  # type: logging.Logger
+logger.setLevel(logging.DEBUG)
+
+
+# the NumPy type used to store the values of variables of a given Python type
+_PY_TO_DTYPE = {
+    float: np.float64,
+    int: np.int64,
+    bool: np.uint8,
+    str: np.int32
+}  # type: Dict[Type, Any]
+
+
+def dtype_for(typ: Type) -> np.dtype:
+    """
+    Returns the NumPy type used to store values of a given Python type.
+    String values are dictionary-encoded as integer codes.
+    """
+    try:
+        return np.dtype(_PY_TO_DTYPE[typ])
+    except KeyError:
+        msg = "no columnar representation for variables of type: {}"
+        msg = msg.format(typ.__name__)
+        raise TypeError(msg)
+
+
+class ColumnBuffer(object):
+    """
+    A growable, typed buffer of values. Slices of the buffer are handed out
+    as views and remain valid after the buffer has grown, since growing the
+    buffer moves its contents to a fresh array rather than resizing the
+    existing array in place.
+    """
+    def __init__(self, dtype: np.dtype, capacity: int = 1024) -> None:
+        assert capacity > 0
+        self.__data = np.empty(capacity, dtype=dtype)
+        self.__size = 0
+
+    def __len__(self) -> int:
+        return self.__size
+
+    def append(self, value: Any) -> None:
+        if self.__size == len(self.__data):
+            data = np.empty(2 * len(self.__data), dtype=self.__data.dtype)
+            data[:self.__size] = self.__data
+            self.__data = data
+        self.__data[self.__size] = value
+        self.__size += 1
+
+    def view(self, start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        """
+        Returns a read-only view of the values between two positions.
+        """
+        stop = self.__size if stop is None else stop
+        assert 0 <= start <= stop <= self.__size
+        view = self.__data[start:stop]
+        view.flags.writeable = False
+        return view
+
+
+class StateColumns(object):
+    """
+    Provides a columnar view of a sequence of states, in which the values of
+    each variable are stored in a separate NumPy array. Floats are stored as
+    float64, ints as int64, bools as uint8, and strings (e.g., mode) are
+    dictionary-encoded as int32 codes into a tuple of categories.
+
+    Columns also act as a read-only sequence of states, allowing them to be
+    used wherever a tuple of states is expected; individual states are only
+    constructed upon access.
+    """
+    def __init__(self,
+                 state_class: Type[State],
+                 time_offset: np.ndarray,
+                 columns: Dict[str, np.ndarray],
+                 categories: Optional[Dict[str, Sequence[str]]] = None
+                 ) -> None:
+        self.__state_class = state_class
+        self.__time_offset = time_offset
+        self.__columns = columns
+        self.__categories = {
+            n: tuple(c) for (n, c) in (categories or {}).items()
+        }  # type: Dict[str, Tuple[str, ...]]
+        assert all(len(c) == len(time_offset) for c in columns.values())
+
+    @staticmethod
+    def from_states(state_class: Type[State],
+                    states: Sequence[State]
+                    ) -> 'StateColumns':
+        """
+        Builds a columnar representation of a given sequence of states.
+        """
+        variables = state_class.variables
+        time_offset = np.array([s.time_offset for s in states],
+                               dtype=np.float64)
+        columns = {}  # type: Dict[str, np.ndarray]
+        categories = {}  # type: Dict[str, List[str]]
+        for name, variable in variables.items():
+            values = [s[name] for s in states]
+            if variable.typ is str:
+                codes = {}  # type: Dict[str, int]
+                for v in values:
+                    codes.setdefault(v, len(codes))
+                categories[name] = list(codes)
+                values = [codes[v] for v in values]
+            columns[name] = np.array(values, dtype=dtype_for(variable.typ))
+        return StateColumns(state_class, time_offset, columns, categories)
+
+    @property
+    def state_class(self) -> Type[State]:
+        """
+        The class of the states described by these columns.
+        """
+        return self.__state_class
+
+    @property
+    def time_offset(self) -> np.ndarray:
+        """
+        The time offset of each state.
+        """
+        return self.__time_offset
+
+    def column(self, name: str) -> np.ndarray:
+        """
+        Returns the raw column of values for a given variable. Columns for
+        string variables contain codes into the categories for that
+        variable.
+
+        Raises:
+            KeyError: if there is no variable with the given name.
+        """
+        if name == 'time_offset':
+            return self.__time_offset
+        return self.__columns[name]
+
+    def categories(self, name: str) -> Tuple[str, ...]:
+        """
+        Returns the categories for a given dictionary-encoded variable.
+        """
+        return self.__categories.get(name, ())
+
+    def encode(self, name: str, value: str) -> int:
+        """
+        Returns the code for a given value of a dictionary-encoded variable,
+        or -1 if that value does not appear in the column.
+        """
+        try:
+            return self.categories(name).index(value)
+        except ValueError:
+            return -1
+
+    def values(self, name: str) -> List[Any]:
+        """
+        Returns the decoded values of a given variable as Python objects.
+        """
+        column = self.column(name)
+        if name in self.__categories:
+            categories = self.__categories[name]
+            return [categories[c] for c in column.tolist()]
+        if column.dtype == np.uint8:
+            return [bool(v) for v in column.tolist()]
+        return column.tolist()
+
+    def __len__(self) -> int:
+        return len(self.__time_offset)
+
+    def __getitem__(self, index: Union[int, slice]
+                    ) -> Union[State, 'StateColumns']:
+        if isinstance(index, slice):
+            columns = {n: c[index] for (n, c) in self.__columns.items()}
+            return StateColumns(self.__state_class,
+                                self.__time_offset[index],
+                                columns,
+                                self.__categories)
+
+        values = {}  # type: Dict[str, Any]
+        values['time_offset'] = float(self.__time_offset[index])
+        for name, variable in self.__state_class.variables.items():
+            value = self.__columns[name][index].item()
+            if name in self.__categories:
+                value = self.__categories[name][value]
+            elif variable.typ is bool:
+                value = bool(value)
+            values[name] = value
+        return self.__state_class(**values)
+
+    def __iter__(self) -> Iterator[State]:
+        for i in range(len(self)):
+            yield self[i]
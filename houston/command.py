@@ -1,11 +1,15 @@
-__all__ = ['Command', 'Parameter', 'CommandOutcome']
+__all__ = ['Command', 'Parameter', 'CommandOutcome', 'ResolutionCache']
 
 from typing import List, Dict, Any, Optional, Type, Generic, \
-    TypeVar, Iterator
+    TypeVar, Iterator, Tuple, Hashable
+from collections import OrderedDict
+import math
 import random
 import logging
+import threading
 
 import attr
+import sexpdata
 
 from .connection import Message
 from .specification import Specification
@@ -20,6 +24,8 @@ logger.setLevel(logging.DEBUG)
 
 T = TypeVar('T')
 
+_COMPARISONS = frozenset(['=', '<', '<=', '>', '>='])
+
 # contains all command types, indexed by their unique identifiers
 _UID_TO_COMMAND_TYPE = {}  # type: Dict[str, Type[Command]]
 
@@ -50,6 +56,203 @@ class Parameter(Generic[T]):
         return "__{}".format(self.name)
 
 
+class ResolutionCache(object):
+    """
+    A bounded, least-recently-used cache of the specifications that commands
+    resolve to in a given state.
+
+    Entries are keyed on the type and parameters of the command, together
+    with a quantized view of those state variables that are referenced by
+    the preconditions of the command. The value of each noisy variable is
+    quantized into buckets whose width is given by the noise of that
+    variable; other variables are used as-is. States whose relevant
+    variables fall into the same buckets are treated as indistinguishable
+    and resolve to the same specification. Preconditions do not depend on
+    the environment or configuration, so neither is part of the key.
+
+    A noisy variable is only quantized if the preconditions solely compare
+    it against constants, and the exact value of the variable is used
+    whenever its bucket contains one of the thresholds of those comparisons,
+    since the outcome of a precondition may differ within that bucket.
+    """
+    def __init__(self, max_size: int = 4096) -> None:
+        assert max_size > 0
+        self.__max_size = max_size
+        self.__entries = \
+            OrderedDict()  # type: OrderedDict[Hashable, Specification]
+        self.__variables = {}  # type: Dict[Tuple[Type[Command], Type[State]], Tuple[Tuple[str, Optional[float], Tuple[float, ...]], ...]]  # noqa: pycodestyle
+        self.__lock = threading.Lock()
+        self.__hits = 0
+        self.__misses = 0
+
+    @property
+    def max_size(self) -> int:
+        return self.__max_size
+
+    @property
+    def hits(self) -> int:
+        """
+        The number of lookups that were answered by the cache.
+        """
+        return self.__hits
+
+    @property
+    def misses(self) -> int:
+        """
+        The number of lookups that were not answered by the cache.
+        """
+        return self.__misses
+
+    @property
+    def hit_rate(self) -> float:
+        """
+        The fraction of lookups that were answered by the cache.
+        """
+        lookups = self.__hits + self.__misses
+        return self.__hits / lookups if lookups else 0.0
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def clear(self) -> None:
+        """
+        Removes all entries from the cache and resets its counters.
+        """
+        with self.__lock:
+            self.__entries.clear()
+            self.__hits = 0
+            self.__misses = 0
+
+    @staticmethod
+    def _thresholds(tree: Any,
+                    symbol: str,
+                    noise: float
+                    ) -> Optional[List[float]]:
+        """
+        Returns the values of a given noisy variable at which the outcome of
+        an s-expression tree may change, or None if the variable is used in
+        anything other than a comparison against a numeric constant.
+        Equalities are noise-tolerant, and so change their outcome at either
+        side of the noise interval around their constant.
+        """
+        if isinstance(tree, sexpdata.Symbol):
+            return None if tree.value() == symbol else []
+        if not isinstance(tree, list) or not tree:
+            return []
+        op = tree[0].value() if isinstance(tree[0], sexpdata.Symbol) else None
+        if op in _COMPARISONS and len(tree) == 3:
+            operands = [t for t in tree[1:] if t != sexpdata.Symbol(symbol)]
+            constant = operands[0] if len(operands) == 1 else None
+            if isinstance(constant, (int, float)) and \
+                    not isinstance(constant, bool):
+                if op == '=':
+                    return [constant - noise, constant + noise]
+                return [constant]
+        thresholds = []  # type: List[float]
+        for child in tree[1:]:
+            found = ResolutionCache._thresholds(child, symbol, noise)
+            if found is None:
+                return None
+            thresholds += found
+        return thresholds
+
+    def _relevant_variables(self,
+                            command: 'Command',
+                            state: State
+                            ) -> Tuple[Tuple[str, Optional[float], Tuple[float, ...]], ...]:  # noqa: pycodestyle
+        """
+        Returns the name and quantization width of each state variable that
+        is referenced by the preconditions of a given command, together with
+        the thresholds at which those preconditions may change their outcome
+        for that variable.
+        """
+        key = (command.__class__, state.__class__)
+        try:
+            return self.__variables[key]
+        except KeyError:
+            pass
+        preconditions = [spec.precondition
+                         for spec in command.__class__.specifications]
+        names = set()
+        for precondition in preconditions:
+            for symbol in precondition.symbols:
+                if symbol.startswith('_') and not symbol.startswith('__'):
+                    names.add(symbol[1:])
+        trees = [sexpdata.loads(p.expression, true=None, nil=None)
+                 for p in preconditions]
+        relevant = []
+        for name in sorted(names & set(state.variables)):
+            variable = state.variables[name]
+            width = None  # type: Optional[float]
+            thresholds = []  # type: List[float]
+            if variable.is_noisy and variable.noise > 0 \
+                    and variable.typ in (int, float):
+                width = float(variable.noise)
+                for tree in trees:
+                    found = self._thresholds(tree, '_' + name, width)
+                    if found is None:
+                        width = None
+                        thresholds = []
+                        break
+                    thresholds += found
+            relevant.append((name, width, tuple(sorted(thresholds))))
+        self.__variables[key] = tuple(relevant)
+        return self.__variables[key]
+
+    def key(self, command: 'Command', state: State) -> Hashable:
+        """
+        Computes the cache key for a given command and state.
+        """
+        params = tuple(command[p.name] for p in
+                       sorted(command.__class__.parameters,
+                              key=lambda p: p.name))
+        view = []
+        for name, width, thresholds in \
+                self._relevant_variables(command, state):
+            val = state[name]
+            if width is not None:
+                bucket = math.floor(val / width)
+                lo = bucket * width
+                hi = lo + width
+                # buckets that straddle a threshold are keyed on the exact
+                # value, which is distinguished from a bucket by a tuple
+                if any(lo <= t <= hi for t in thresholds):
+                    val = (bucket, val)
+                else:
+                    val = bucket
+            view.append(val)
+        return (command.__class__, params, state.__class__, tuple(view))
+
+    def resolve(self,
+                command: 'Command',
+                state: State,
+                environment: Environment,
+                config: Configuration
+                ) -> Specification:
+        """
+        Returns the specification that a given command resolves to in a
+        given state, using a cached resolution whenever possible.
+        """
+        key = self.key(command, state)
+        with self.__lock:
+            try:
+                spec = self.__entries[key]
+            except KeyError:
+                self.__misses += 1
+            else:
+                self.__hits += 1
+                self.__entries.move_to_end(key)
+                return spec
+
+        spec = command._resolve(state, environment, config)
+        with self.__lock:
+            self.__entries[key] = spec
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.__max_size:
+                self.__entries.popitem(last=False)
+        return spec
+
+
 class CommandMeta(type):
     def __new__(mcl,
                 cls_name: str,
@@ -184,6 +387,9 @@ class CommandMeta(type):
 
 
 class Command(object, metaclass=CommandMeta):
+    # shared by all commands to memoize the results of resolve
+    resolution_cache = ResolutionCache()
+
     def __init__(self, *args, **kwargs) -> None:
         cls_name = self.__class__.__name__
         params = self.__class__.parameters  # type: FrozenSet[Parameter]
@@ -347,6 +553,20 @@ class Command(object, metaclass=CommandMeta):
         completing this command in a given state, environment, and
         configuration.
         """
+        return Command.resolution_cache.resolve(self,
+                                                state,
+                                                environment,
+                                                config)
+
+    def _resolve(self,
+                 state: State,
+                 environment: Environment,
+                 config: Configuration
+                 ) -> Specification:
+        """
+        Resolves the specification for this command without consulting the
+        resolution cache.
+        """
         for spec in self.__class__.specifications:
             if spec.precondition.is_satisfied(self,
                                               state,
@@ -386,16 +606,18 @@ class CommandOutcome(object):
     time_elapsed = attr.ib(type=float)  # FIXME use time delta
 
     @staticmethod
-    def from_json(jsn: Dict[str, Any]) -> 'CommandOutcome':
-        return CommandOutcome(Command.from_json(jsn['command']),
+    def from_json(jsn: Dict[str, Any],
+                  state_class: Type[State]
+                  ) -> 'CommandOutcome':
+        return CommandOutcome(Command.from_dict(jsn['command']),
                               jsn['successful'],
-                              State.from_json(jsn['start_state']),
-                              State.from_json(jsn['end_state']),
+                              state_class.from_dict(jsn['start_state']),
+                              state_class.from_dict(jsn['end_state']),
                               jsn['time_elapsed'])
 
     def to_json(self) -> Dict[str, Any]:
-        return {'command': self.__command.to_json(),
-                'successful': self.__successful,
-                'start_state': self.start_state.to_json(),
-                'end_state': self.end_state.to_json(),
-                'time_elapsed': self.__time_elapsed}
+        return {'command': self.command.to_dict(),
+                'successful': self.successful,
+                'start_state': self.start_state.to_dict(),
+                'end_state': self.end_state.to_dict(),
+                'time_elapsed': self.time_elapsed}
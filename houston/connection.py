@@ -1,6 +1,8 @@
 __all__ = ['Message', 'Connection']
 
-from typing import Generic, TypeVar, List, Callable, Dict
+from typing import Generic, TypeVar, List, Callable, Dict, Optional, \
+    Iterable, FrozenSet, Set, Tuple
+from collections import OrderedDict
 import threading
 
 T = TypeVar('T')
@@ -15,6 +17,11 @@ class Message(object):
 class Connection(Generic[T]):
     """
     Provides a connection to the system under test using a given protocol.
+
+    Hooks are stored in an immutable table that is replaced, rather than
+    modified, whenever a hook is added or removed. Messages can therefore be
+    delivered without holding a lock, and hooks are free to add or remove
+    hooks themselves.
     """
     def __init__(self, hooks: Dict[str, Callable[[T], None]]) -> None:
         """
@@ -26,16 +33,57 @@ class Connection(Generic[T]):
                 connection.
         """
         self.__lock = threading.Lock()
-        self.__hooks = hooks if hooks else {}
+        # maps the name of each hook to the hook and the names of the
+        # messages that it should receive (or None if it receives all)
+        self.__hooks = OrderedDict()  # type: Dict[str, Tuple[Callable[[T], None], Optional[FrozenSet[str]]]]  # noqa: pycodestyle
+        for name, hook in (hooks or {}).items():
+            self.__hooks[name] = (hook, None)
+        self.__rebuild()
+
+    def __rebuild(self) -> None:
+        """
+        Computes a new dispatch table from the current set of hooks. Must be
+        called while holding the lock.
+        """
+        hooks = list(self.__hooks.values())
+        names = set()  # type: Set[str]
+        for _, interest in hooks:
+            names.update(interest or ())
+        by_name = {
+            name: tuple(h for h, i in hooks if i is None or name in i)
+            for name in names
+        }  # type: Dict[str, Tuple[Callable[[T], None], ...]]
+        wildcard = tuple(h for h, i in hooks if i is None)
+        # replaced in a single assignment so that readers never observe a
+        # partially updated table
+        self.__table = (by_name, wildcard)
+        self.__subscriptions = None if wildcard else frozenset(names)
+
+    @property
+    def subscriptions(self) -> Optional[FrozenSet[str]]:
+        """
+        The names of the messages that are forwarded to at least one hook,
+        or None if there is a hook that receives all messages.
+        """
+        return self.__subscriptions
+
+    def _subscriptions_changed(self) -> None:
+        """
+        Called whenever the set of subscribed messages may have changed.
+        Connections may override this method to avoid receiving (and
+        decoding) messages that no hook is interested in.
+        """
+        pass
 
     def receive(self, message: T) -> None:
         """
         Forwards any received messages using the hooks attached to this
         connection.
         """
-        with self.__lock:
-            for hook in self.__hooks.values():
-                hook(message)
+        by_name, wildcard = self.__table
+        name = getattr(message, 'name', None)
+        for hook in by_name.get(name, wildcard):
+            hook(message)
 
     def send(self, message: T) -> None:
         """
@@ -49,18 +97,33 @@ class Connection(Generic[T]):
         """
         raise NotImplementedError
 
-    def add_hooks(self, hooks: Dict[str, Callable[[T], None]]) -> None:
+    def add_hooks(self,
+                  hooks: Dict[str, Callable[[T], None]],
+                  messages: Optional[Iterable[str]] = None
+                  ) -> None:
         """
         Adds a dictionary of hooks to the set of hooks to be called
         when messages are received.
+
+        Parameters:
+            hooks: A dictionary of string (name of the hook) to callables.
+            messages: The names of the messages that should be forwarded to
+                these hooks. If None, all messages are forwarded.
         """
+        interest = None if messages is None else frozenset(messages)
         with self.__lock:
-            self.__hooks.update(hooks)
+            for name, hook in hooks.items():
+                self.__hooks[name] = (hook, interest)
+            self.__rebuild()
+        self._subscriptions_changed()
 
     def remove_hook(self, hook_name: str) -> None:
         """
         Removes a hook from hooks based on its name.
         """
         with self.__lock:
-            if hook_name in self.__hooks:
-                self.__hooks.pop(hook_name)
+            if hook_name not in self.__hooks:
+                return
+            self.__hooks.pop(hook_name)
+            self.__rebuild()
+        self._subscriptions_changed()
@@ -0,0 +1,287 @@
+"""
+Provides a compact representation of line coverage as a bitmap over an
+indexed universe of source lines.
+
+A line universe assigns a consecutive range of indices to the lines of each
+source file, such that any set of covered lines within the universe can be
+represented as a fixed-size bitmap. Intersections and unions of coverage
+are computed as bitwise operations over the words of those bitmaps, and the
+coverage of consecutive commands within a mission, which tends to be very
+similar, can be stored compactly as a sequence of deltas.
+"""
+__all__ = ['LineUniverse', 'CoverageBitmap', 'encode_deltas',
+           'decode_deltas']
+
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, \
+    Tuple, Union
+import hashlib
+import json
+import zlib
+
+import numpy as np
+from bugzoo.core.fileline import FileLine, FileLineSet
+
+# the (little-endian) type of each word within a bitmap
+_WORD = np.dtype('<u8')
+_WORD_BITS = 64
+
+
+class LineUniverse(object):
+    """
+    An indexed universe of source lines, described by the number of lines
+    in each of its files.
+    """
+    def __init__(self, line_counts: Dict[str, int]) -> None:
+        self.__files = tuple(sorted(line_counts))
+        self.__line_counts = {fn: line_counts[fn] for fn in self.__files}
+        offsets = [0]
+        for fn in self.__files:
+            offsets.append(offsets[-1] + self.__line_counts[fn])
+        self.__offsets = np.array(offsets, dtype=np.int64)
+        self.__file_to_offset = {fn: offsets[i]
+                                 for (i, fn) in enumerate(self.__files)}
+        jsn = json.dumps(self.__line_counts, sort_keys=True)
+        self.__digest = hashlib.sha1(jsn.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def from_coverage(coverage: Iterable[FileLineSet]) -> 'LineUniverse':
+        """
+        Constructs the smallest universe that contains all of the lines
+        within a given collection of coverage reports.
+        """
+        line_counts = {}  # type: Dict[str, int]
+        for lines in coverage:
+            for fn, nums in lines.to_dict().items():
+                if nums:
+                    num_lines = max(line_counts.get(fn, 0), max(nums))
+                    line_counts[fn] = num_lines
+        return LineUniverse(line_counts)
+
+    @staticmethod
+    def from_dict(dkt: Dict[str, Any]) -> 'LineUniverse':
+        return LineUniverse(dkt['files'])
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'files': dict(self.__line_counts)}
+
+    @property
+    def files(self) -> Tuple[str, ...]:
+        return self.__files
+
+    @property
+    def size(self) -> int:
+        """
+        The number of lines within this universe.
+        """
+        return int(self.__offsets[-1])
+
+    @property
+    def num_words(self) -> int:
+        """
+        The number of words within a bitmap over this universe.
+        """
+        return -(-self.size // _WORD_BITS)
+
+    @property
+    def digest(self) -> str:
+        """
+        A stable digest that identifies this universe.
+        """
+        return self.__digest
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, LineUniverse) and \
+            self.__digest == other.digest
+
+    def __hash__(self) -> int:
+        return hash(self.__digest)
+
+    def num_lines(self, filename: str) -> int:
+        """
+        Returns the number of lines of a given file within this universe.
+        """
+        return self.__line_counts.get(filename, 0)
+
+    def index(self, filename: str, line: int) -> Optional[int]:
+        """
+        Returns the index of a given line within this universe, or None if
+        that line does not belong to this universe.
+        """
+        offset = self.__file_to_offset.get(filename)
+        if offset is None or not 1 <= line <= self.__line_counts[filename]:
+            return None
+        return offset + line - 1
+
+    def lines(self, indices: np.ndarray) -> Iterator[FileLine]:
+        """
+        Returns an iterator over the lines at the given indices.
+        """
+        positions = np.searchsorted(self.__offsets, indices, side='right') - 1
+        for index, position in zip(indices.tolist(), positions.tolist()):
+            offset = int(self.__offsets[position])
+            yield FileLine(self.__files[position], index - offset + 1)
+
+
+class CoverageBitmap(object):
+    """
+    Describes a set of covered lines as a bitmap over a line universe.
+    """
+    __slots__ = ('__universe', '__words')
+
+    def __init__(self, universe: LineUniverse, words: np.ndarray) -> None:
+        assert len(words) == universe.num_words
+        self.__universe = universe
+        self.__words = words
+
+    @staticmethod
+    def empty(universe: LineUniverse) -> 'CoverageBitmap':
+        return CoverageBitmap(universe, np.zeros(universe.num_words, _WORD))
+
+    @staticmethod
+    def from_filelines(universe: LineUniverse,
+                       lines: Union[FileLineSet, Iterable[FileLine]]
+                       ) -> 'CoverageBitmap':
+        """
+        Constructs a bitmap for a given set of lines. Any lines that do not
+        belong to the universe are ignored.
+        """
+        indices = [universe.index(fl.filename, fl.num) for fl in lines]
+        indices = np.array([i for i in indices if i is not None],
+                           dtype=np.uint64)
+        words = np.zeros(universe.num_words, _WORD)
+        np.bitwise_or.at(words,
+                         (indices // _WORD_BITS).astype(np.intp),
+                         np.left_shift(np.uint64(1),
+                                       indices % np.uint64(_WORD_BITS)))
+        return CoverageBitmap(universe, words)
+
+    @staticmethod
+    def from_bytes(universe: LineUniverse, data: bytes) -> 'CoverageBitmap':
+        """
+        Decodes a bitmap that was encoded by :meth:`to_bytes`.
+
+        Raises:
+            ValueError: if the bitmap does not belong to the given universe.
+        """
+        words = np.frombuffer(zlib.decompress(data), dtype=_WORD)
+        if len(words) != universe.num_words:
+            raise ValueError("bitmap does not belong to universe.")
+        return CoverageBitmap(universe, words)
+
+    def to_bytes(self) -> bytes:
+        """
+        Encodes this bitmap as a compressed sequence of bytes.
+        """
+        return zlib.compress(self.__words.tobytes())
+
+    @property
+    def universe(self) -> LineUniverse:
+        return self.__universe
+
+    @property
+    def words(self) -> np.ndarray:
+        return self.__words
+
+    def indices(self) -> np.ndarray:
+        """
+        Returns the indices of the covered lines within the universe.
+        """
+        bits = np.unpackbits(self.__words.view(np.uint8), bitorder='little')
+        return np.flatnonzero(bits)
+
+    def __iter__(self) -> Iterator[FileLine]:
+        yield from self.__universe.lines(self.indices())
+
+    def __len__(self) -> int:
+        return int(np.unpackbits(self.__words.view(np.uint8)).sum())
+
+    def __bool__(self) -> bool:
+        return bool(self.__words.any())
+
+    def _check(self, other: 'CoverageBitmap') -> None:
+        if self.__universe is not other.universe and \
+           self.__universe != other.universe:
+            raise ValueError("bitmaps belong to different universes.")
+
+    def __or__(self, other: 'CoverageBitmap') -> 'CoverageBitmap':
+        self._check(other)
+        return CoverageBitmap(self.__universe, self.__words | other.words)
+
+    def __and__(self, other: 'CoverageBitmap') -> 'CoverageBitmap':
+        self._check(other)
+        return CoverageBitmap(self.__universe, self.__words & other.words)
+
+    def __xor__(self, other: 'CoverageBitmap') -> 'CoverageBitmap':
+        self._check(other)
+        return CoverageBitmap(self.__universe, self.__words ^ other.words)
+
+    def __sub__(self, other: 'CoverageBitmap') -> 'CoverageBitmap':
+        self._check(other)
+        return CoverageBitmap(self.__universe, self.__words & ~other.words)
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, CoverageBitmap):
+            return False
+        return self.__universe == other.universe and \
+            np.array_equal(self.__words, other.words)
+
+    union = __or__
+    intersection = __and__
+
+    def intersects(self, other: 'CoverageBitmap') -> bool:
+        """
+        Determines whether this bitmap shares any lines with another.
+        """
+        self._check(other)
+        return bool(np.bitwise_and(self.__words, other.words).any())
+
+    def to_filelineset(self) -> FileLineSet:
+        return FileLineSet.from_list(list(self))
+
+    def to_dict(self) -> Dict[str, List[int]]:
+        """
+        Returns a description of the covered lines in the same form as
+        :meth:`FileLineSet.to_dict`.
+        """
+        return self.to_filelineset().to_dict()
+
+
+def encode_deltas(coverage: Sequence[Optional[CoverageBitmap]]
+                  ) -> List[Optional[bytes]]:
+    """
+    Encodes the coverage of a sequence of commands, given as bitmaps over the
+    same universe, as the bitwise difference between the coverage of each
+    command and that of the command before it (or the empty bitmap, for the
+    first command with coverage). Commands without coverage are skipped.
+    """
+    deltas = []  # type: List[Optional[bytes]]
+    previous = None  # type: Optional[CoverageBitmap]
+    for bitmap in coverage:
+        if bitmap is None:
+            deltas.append(None)
+            continue
+        delta = bitmap if previous is None else bitmap ^ previous
+        deltas.append(delta.to_bytes())
+        previous = bitmap
+    return deltas
+
+
+def decode_deltas(universe: LineUniverse,
+                  deltas: Sequence[Optional[bytes]]
+                  ) -> List[Optional[CoverageBitmap]]:
+    """
+    Decodes the coverage of a sequence of commands that was encoded by
+    :func:`encode_deltas`.
+    """
+    coverage = []  # type: List[Optional[CoverageBitmap]]
+    previous = None  # type: Optional[CoverageBitmap]
+    for data in deltas:
+        if data is None:
+            coverage.append(None)
+            continue
+        bitmap = CoverageBitmap.from_bytes(universe, data)
+        if previous is not None:
+            bitmap = bitmap ^ previous
+        coverage.append(bitmap)
+        previous = bitmap
+    return coverage
@@ -0,0 +1,201 @@
+"""
+Provides an inverted index from source lines to the missions, and the
+commands within those missions, whose traces cover them.
+
+The index is built once from a collection of trace files. It can then be
+used to determine, with a single lookup, which of those missions execute
+any of a given set of lines (e.g., the lines that are modified by a mutant),
+without loading any of the trace files themselves.
+"""
+__all__ = ['CoverageIndex']
+
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple, \
+    Union
+import json
+import logging
+import os
+
+import numpy as np
+from bugzoo.core.fileline import FileLine, FileLineSet
+
+from .coverage import CoverageBitmap, LineUniverse
+from .trace import MissionTrace
+
+logger = logging.getLogger(__name__)  # type: logging.Logger
+logger.setLevel(logging.DEBUG)
+
+
+class CoverageIndex(object):
+    """
+    An inverted index from each line within a universe of source lines to
+    the (mission, command) pairs that cover that line. The postings for all
+    lines are stored in a compressed sparse row layout: the postings for the
+    line with index i occupy the range offsets[i]:offsets[i+1] of the
+    missions and commands arrays.
+    """
+    def __init__(self,
+                 universe: LineUniverse,
+                 missions: Sequence[str],
+                 offsets: np.ndarray,
+                 mission_ids: np.ndarray,
+                 command_ids: np.ndarray
+                 ) -> None:
+        assert len(offsets) == universe.size + 1
+        assert len(mission_ids) == len(command_ids) == offsets[-1]
+        self.__universe = universe
+        self.__missions = tuple(missions)
+        self.__offsets = offsets
+        self.__mission_ids = mission_ids
+        self.__command_ids = command_ids
+
+    @staticmethod
+    def build(traces: Iterable[Tuple[str, Sequence[MissionTrace]]],
+              universe: Optional[LineUniverse] = None
+              ) -> 'CoverageIndex':
+        """
+        Builds an index from the traces of a collection of missions.
+
+        Parameters:
+            traces: an iterable of pairs, each containing the name of a
+                mission (e.g., the name of its trace file) and its traces.
+                The coverage of each command is taken to be the union of its
+                coverage across all of the traces for its mission.
+            universe: the universe of lines over which the index should be
+                built. If no universe is given, the universe of the first
+                trace that stores its coverage as bitmaps is used, or else
+                the smallest universe that contains all covered lines.
+        """
+        missions = []  # type: List[str]
+        postings = {}  # type: Dict[Tuple[str, int], Set[Tuple[int, int]]]
+        for name, mission_traces in traces:
+            mission_id = len(missions)
+            missions.append(name)
+            for trace in mission_traces:
+                for command_id, cmd in enumerate(trace.commands):
+                    coverage = cmd.coverage
+                    if coverage is None:
+                        continue
+                    if isinstance(coverage, CoverageBitmap) and \
+                       universe is None:
+                        universe = coverage.universe
+                    posting = (mission_id, command_id)
+                    for line in coverage:
+                        key = (line.filename, line.num)
+                        postings.setdefault(key, set()).add(posting)
+
+        if universe is None:
+            line_counts = {}  # type: Dict[str, int]
+            for (filename, num) in postings:
+                line_counts[filename] = max(line_counts.get(filename, 0), num)
+            universe = LineUniverse(line_counts)
+
+        entries = []  # type: List[Tuple[int, int, int]]
+        for (filename, num), pairs in postings.items():
+            index = universe.index(filename, num)
+            if index is None:
+                continue
+            entries.extend((index, m, c) for (m, c) in pairs)
+        entries.sort()
+        table = np.array(entries, dtype=np.int64).reshape(-1, 3)
+        counts = np.bincount(table[:, 0], minlength=universe.size)
+        offsets = np.zeros(universe.size + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        index = CoverageIndex(universe,
+                              missions,
+                              offsets,
+                              table[:, 1].astype(np.int32),
+                              table[:, 2].astype(np.int32))
+        logger.debug("built coverage index over %d missions and %d lines",
+                     len(missions), universe.size)
+        return index
+
+    @property
+    def universe(self) -> LineUniverse:
+        return self.__universe
+
+    @property
+    def missions(self) -> Tuple[str, ...]:
+        """
+        The names of the missions within this index.
+        """
+        return self.__missions
+
+    def __len__(self) -> int:
+        """
+        Returns the number of (line, mission, command) postings within this
+        index.
+        """
+        return len(self.__mission_ids)
+
+    def _postings(self,
+                  lines: Union[FileLineSet, Iterable[FileLine]]
+                  ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the mission and command IDs of the postings for a given set
+        of lines. Lines that do not belong to the universe of this index are
+        ignored.
+        """
+        indices = [self.__universe.index(fl.filename, fl.num) for fl in lines]
+        indices = [i for i in indices if i is not None]
+        if not indices:
+            empty = np.zeros(0, dtype=np.int32)
+            return (empty, empty)
+        starts = self.__offsets[indices]
+        ends = self.__offsets[np.array(indices) + 1]
+        positions = np.concatenate([np.arange(s, e)
+                                    for (s, e) in zip(starts, ends)])
+        positions = positions.astype(np.int64)
+        return (self.__mission_ids[positions], self.__command_ids[positions])
+
+    def missions_covering(self,
+                          lines: Union[FileLineSet, Iterable[FileLine]]
+                          ) -> List[str]:
+        """
+        Returns the names of the missions that cover any of a given set of
+        lines, in the order in which those missions were added to the index.
+        """
+        mission_ids, _ = self._postings(lines)
+        return [self.__missions[i] for i in np.unique(mission_ids).tolist()]
+
+    def commands_covering(self,
+                          lines: Union[FileLineSet, Iterable[FileLine]]
+                          ) -> Dict[str, List[int]]:
+        """
+        Returns a mapping from the name of each mission that covers any of a
+        given set of lines to the (sorted) indices of the commands within
+        that mission that cover those lines.
+        """
+        mission_ids, command_ids = self._postings(lines)
+        covering = {}  # type: Dict[str, Set[int]]
+        for m, c in zip(mission_ids.tolist(), command_ids.tolist()):
+            covering.setdefault(self.__missions[m], set()).add(c)
+        return {m: sorted(cs) for m, cs in covering.items()}
+
+    def save(self, filename: str) -> None:
+        """
+        Writes this index to a given (compressed) NumPy archive.
+        """
+        header = {'universe': self.__universe.to_dict(),
+                  'missions': list(self.__missions)}
+        # write to a temporary file so that the index is never left partial
+        fn_tmp = '{}.tmp'.format(filename)
+        with open(fn_tmp, 'wb') as f:
+            np.savez_compressed(f,
+                                header=np.array(json.dumps(header)),
+                                offsets=self.__offsets,
+                                missions=self.__mission_ids,
+                                commands=self.__command_ids)
+        os.replace(fn_tmp, filename)
+
+    @staticmethod
+    def load(filename: str) -> 'CoverageIndex':
+        """
+        Reads an index from a file that was written by :meth:`save`.
+        """
+        with np.load(filename, allow_pickle=False) as archive:
+            header = json.loads(str(archive['header']))
+            return CoverageIndex(LineUniverse.from_dict(header['universe']),
+                                 header['missions'],
+                                 archive['offsets'],
+                                 archive['missions'],
+                                 archive['commands'])
@@ -0,0 +1,321 @@
+"""
+Compiles specification expressions into Python closures that can be used to
+cheaply evaluate those expressions once all of their symbols are bound to
+concrete values (i.e., when there are no free variables left to solve for).
+
+The compiled closures follow the same noise-tolerant semantics as
+:meth:`houston.specification.Expression.recreate_with_noise`: an equality
+between two arithmetic terms holds if the absolute difference between them
+is no greater than the (propagated) noise of its operands.
+
+Expressions may also be compiled into a vectorized form, in which symbols
+that refer to the state after execution are bound to the columns of a
+sequence of recorded states, allowing an expression to be evaluated over
+an entire trace using NumPy.
+"""
+__all__ = ['CompiledExpression']
+
+from typing import Any, Callable, Optional, Tuple, Type
+from operator import attrgetter
+import functools
+import logging
+import math
+
+import numpy as np
+import sexpdata
+
+from .columnar import StateColumns
+from .exceptions import UnsupportedExpression
+from .state import State
+
+logger = logging.getLogger(__name__)  # type: logging.Logger
+logger.setLevel(logging.DEBUG)
+
+# a compiled term, which accepts a command and the states before and after
+# its execution, and returns the value of that term
+Term = Callable[[Any, State, Optional[State]], Any]
+
+_NUMERIC_TYPES = (int, float)
+# the arity and NumPy implementation of each logical connective
+_VECTORIZED_CONNECTIVES = {
+    'and': (None, lambda *xs: functools.reduce(np.logical_and, xs, True)),
+    'or': (None, lambda *xs: functools.reduce(np.logical_or, xs, False)),
+    'not': (1, np.logical_not),
+    '=>': (2, lambda x, y: np.logical_or(np.logical_not(x), y)),
+    'ite': (3, np.where)
+}
+_COMPARISONS = {
+    '<': lambda x, y: x < y,
+    '<=': lambda x, y: x <= y,
+    '>': lambda x, y: x > y,
+    '>=': lambda x, y: x >= y
+}
+
+
+class CompiledExpression(object):
+    """
+    A specification expression that has been compiled into a Python closure
+    for a given type of command and state.
+    """
+    def __init__(self,
+                 s_expression: str,
+                 command_class: Type['Command'],
+                 state_class: Type[State]
+                 ) -> None:
+        """
+        Raises:
+            UnsupportedExpression: if the expression cannot be compiled.
+        """
+        self.__command_class = command_class
+        self.__state_class = state_class
+        self.__uses_command = False
+        self.__uses_state_after = False
+        try:
+            tree = sexpdata.loads(s_expression, true=None, nil=None)
+        except Exception as e:
+            raise UnsupportedExpression(str(e))
+        evaluate, typ, _ = self._compile(tree, False)
+        if typ is not bool:
+            raise UnsupportedExpression("expression is not a predicate.")
+        self.__evaluate = evaluate
+        self.__evaluate_columns, _, _ = self._compile(tree, True)
+
+    @property
+    def uses_command(self) -> bool:
+        """
+        Indicates whether the expression refers to any command parameters.
+        """
+        return self.__uses_command
+
+    @property
+    def uses_state_after(self) -> bool:
+        """
+        Indicates whether the expression refers to the state after the
+        execution of the command.
+        """
+        return self.__uses_state_after
+
+    def is_ground(self,
+                  command: Optional['Command'],
+                  state_after: Optional[State]
+                  ) -> bool:
+        """
+        Determines whether every symbol within this expression is bound when
+        given a (possibly missing) command and state after execution.
+        """
+        if self.__uses_command and command is None:
+            return False
+        if self.__uses_state_after and state_after is None:
+            return False
+        return True
+
+    def __call__(self,
+                 command: Optional['Command'],
+                 state_before: State,
+                 state_after: Optional[State]
+                 ) -> bool:
+        return bool(self.__evaluate(command, state_before, state_after))
+
+    def evaluate_columns(self,
+                         command: Optional['Command'],
+                         state_before: State,
+                         states_after: StateColumns
+                         ) -> np.ndarray:
+        """
+        Evaluates this expression against each of a sequence of states after
+        the execution of a given command.
+
+        Returns:
+            a boolean mask that indicates whether the expression holds for
+            each of the given states.
+        """
+        result = self.__evaluate_columns(command, state_before, states_after)
+        result = np.asarray(result, dtype=bool)
+        return np.broadcast_to(result, (len(states_after),))
+
+    def _compile(self, tree: Any, vectorized: bool
+                 ) -> Tuple[Term, Type, float]:
+        """
+        Compiles a node of the s-expression tree, returning its closure,
+        its type, and its noise. If vectorized, symbols for the state after
+        execution are bound to columns of a StateColumns object, and the
+        closure computes an array of values.
+        """
+        if isinstance(tree, list):
+            return self._compile_application(tree, vectorized)
+        if isinstance(tree, sexpdata.Symbol):
+            return self._compile_symbol(tree.value(), vectorized)
+        # literals
+        if isinstance(tree, bool) or \
+                not isinstance(tree, (str,) + _NUMERIC_TYPES):
+            msg = "unexpected literal: {}".format(tree)
+            raise UnsupportedExpression(msg)
+        return (lambda c, b, a, v=tree: v), type(tree), 0.0
+
+    def _compile_symbol(self, name: str, vectorized: bool
+                        ) -> Tuple[Term, Type, float]:
+        if name in ('true', 'false'):
+            val = name == 'true'
+            return (lambda c, b, a: val), bool, 0.0
+
+        variables = self.__state_class.variables
+        if name.startswith('__') and name[2:] in variables:
+            self.__uses_state_after = True
+            variable = variables[name[2:]]
+            if vectorized:
+                term = self._compile_column(name[2:], variable.typ)
+            else:
+                getter = attrgetter(name[2:])
+                term = lambda c, b, a: getter(a)
+        elif name.startswith('_') and name[1:] in variables:
+            variable = variables[name[1:]]
+            getter = attrgetter(name[1:])
+            term = lambda c, b, a: getter(b)
+        elif name.startswith('$'):
+            params = self.__command_class.parameters
+            try:
+                param = next(p for p in params if p.name == name[1:])
+            except StopIteration:
+                msg = "no parameter [{}] in command [{}]"
+                msg = msg.format(name[1:], self.__command_class.__name__)
+                raise UnsupportedExpression(msg)
+            self.__uses_command = True
+            getter = attrgetter(param._field)
+            return (lambda c, b, a: getter(c)), param.type, 0.0
+        else:
+            raise UnsupportedExpression("unknown symbol: {}".format(name))
+
+        # only arithmetic variables contribute noise
+        typ = variable.typ
+        noise = 0.0
+        if variable.is_noisy and typ in _NUMERIC_TYPES:
+            noise = float(variable.noise)
+        return term, typ, noise
+
+    @staticmethod
+    def _compile_column(name: str, typ: Type) -> Term:
+        """
+        Returns a closure that reads the values of a given variable from a
+        set of state columns.
+        """
+        if typ is str:
+            def term(c, b, a):
+                categories = np.array(a.categories(name) or [''], dtype=object)
+                return categories[a.column(name)]
+            return term
+        if typ is bool:
+            return lambda c, b, a: a.column(name).astype(bool)
+        return lambda c, b, a: a.column(name)
+
+    def _compile_application(self, tree: list, vectorized: bool
+                             ) -> Tuple[Term, Type, float]:
+        if not tree or not isinstance(tree[0], sexpdata.Symbol):
+            msg = "expected operator: {}".format(sexpdata.dumps(tree))
+            raise UnsupportedExpression(msg)
+        op = tree[0].value()
+        args = [self._compile(t, vectorized) for t in tree[1:]]
+        terms = tuple(t for (t, _, _) in args)
+        types = [typ for (_, typ, _) in args]
+        noise = math.fsum(n for (_, _, n) in args)
+
+        def arity(n: int) -> None:
+            if len(args) != n:
+                msg = "operator [{}] expects {} arguments but was given {}"
+                msg = msg.format(op, n, len(args))
+                raise UnsupportedExpression(msg)
+
+        if vectorized and op in _VECTORIZED_CONNECTIVES:
+            arity(_VECTORIZED_CONNECTIVES[op][0] or len(args))
+            connective = _VECTORIZED_CONNECTIVES[op][1]
+            term = lambda c, b, a: connective(*(t(c, b, a) for t in terms))
+            typ = bool
+            if op == 'ite':
+                typ = float if all(t in _NUMERIC_TYPES for t in types[1:]) \
+                    else types[1]
+            return term, typ, noise
+
+        if op == 'and':
+            def term(c, b, a):
+                for t in terms:
+                    if not t(c, b, a):
+                        return False
+                return True
+            return term, bool, noise
+
+        if op == 'or':
+            def term(c, b, a):
+                for t in terms:
+                    if t(c, b, a):
+                        return True
+                return False
+            return term, bool, noise
+
+        if op == 'not':
+            arity(1)
+            x = terms[0]
+            return (lambda c, b, a: not x(c, b, a)), bool, noise
+
+        if op == '=>':
+            arity(2)
+            x, y = terms
+            return (lambda c, b, a: not x(c, b, a) or y(c, b, a)), bool, noise
+
+        if op == 'ite':
+            arity(3)
+            cond, x, y = terms
+            typ = float if all(t in _NUMERIC_TYPES for t in types[1:]) \
+                else types[1]
+            term = lambda c, b, a: x(c, b, a) if cond(c, b, a) \
+                else y(c, b, a)
+            return term, typ, noise
+
+        if op == '=':
+            arity(2)
+            x, y = terms
+            if all(t in _NUMERIC_TYPES for t in types):
+                # noise-tolerant equality
+                term = lambda c, b, a: \
+                    abs(x(c, b, a) - y(c, b, a)) <= noise
+            else:
+                term = lambda c, b, a: x(c, b, a) == y(c, b, a)
+            return term, bool, noise
+
+        if op in _COMPARISONS:
+            arity(2)
+            x, y = terms
+            cmp = _COMPARISONS[op]
+            return (lambda c, b, a: cmp(x(c, b, a), y(c, b, a))), bool, noise
+
+        # arithmetic
+        if not all(t in _NUMERIC_TYPES for t in types):
+            msg = "unsupported operator [{}] for argument types: {}"
+            msg = msg.format(op, ', '.join(t.__name__ for t in types))
+            raise UnsupportedExpression(msg)
+        typ = int if all(t is int for t in types) else float
+
+        if op == '+':
+            return (lambda c, b, a: sum(t(c, b, a) for t in terms)), \
+                typ, noise
+
+        if op == '-' and len(terms) == 1:
+            x = terms[0]
+            return (lambda c, b, a: -x(c, b, a)), typ, noise
+
+        if op == '-' and len(terms) > 1:
+            head, tail = terms[0], terms[1:]
+            term = lambda c, b, a: \
+                head(c, b, a) - sum(t(c, b, a) for t in tail)
+            return term, typ, noise
+
+        if op == '*':
+            def term(c, b, a):
+                product = 1
+                for t in terms:
+                    product *= t(c, b, a)
+                return product
+            noise = 1.0
+            for (_, _, n) in args:
+                noise *= n
+            return term, typ, noise
+
+        raise UnsupportedExpression("unsupported operator: {}".format(op))
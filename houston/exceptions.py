@@ -72,3 +72,31 @@ class UnsupportedVariableType(HoustonException):
         msg = "Houston and/or Z3 does not support variable type: {}"
         msg = msg.format(type_py.__name__)
         super().__init__(msg)
+
+
+class InvalidTraceFile(HoustonException):
+    """
+    The contents of a trace file could not be read.
+    """
+    def __init__(self, reason: str) -> None:
+        msg = "Invalid trace file: {}".format(reason)
+        super().__init__(msg)
+
+
+class UnsupportedExpression(HoustonException):
+    """
+    An expression uses a construct that cannot be compiled into a Python
+    closure and must instead be evaluated by Z3.
+    """
+    def __init__(self, reason: str) -> None:
+        msg = "Unable to compile expression: {}".format(reason)
+        super().__init__(msg)
+
+
+class InvalidMissionFile(HoustonException):
+    """
+    The contents of a mission file could not be read.
+    """
+    def __init__(self, reason: str) -> None:
+        msg = "Invalid mission file: {}".format(reason)
+        super().__init__(msg)
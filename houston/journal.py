@@ -0,0 +1,207 @@
+"""
+Provides a durable journal of the missions that have been completed as part
+of a campaign, allowing an interrupted campaign to be resumed without
+repeating any completed missions.
+
+The journal is an append-only JSON Lines file. Each line describes a single
+completed mission: its index within the campaign, a stable hash of its
+description, its outcome (if any), and the location of its trace (if any).
+Each entry is flushed and synced to disk before the next is written, so at
+most the final (partially written) entry can be lost if the process dies.
+"""
+__all__ = ['CampaignJournal', 'JournalEntry', 'mission_hash']
+
+from typing import Any, Dict, Iterator, Optional, Tuple, Type
+import hashlib
+import json
+import logging
+import os
+import threading
+
+import attr
+
+from .mission import Mission, MissionOutcome
+from .system import System
+
+logger = logging.getLogger(__name__)  # type: logging.Logger
+logger.setLevel(logging.DEBUG)
+
+
+def mission_hash(mission: Mission) -> str:
+    """
+    Computes a hash of a given mission that, unlike the built-in hash of the
+    mission, is stable across processes and Python sessions.
+    """
+    jsn = json.dumps(mission.to_dict(), sort_keys=True)
+    return hashlib.sha1(jsn.encode('utf-8')).hexdigest()
+
+
+@attr.s(frozen=True)
+class JournalEntry(object):
+    index = attr.ib(type=int)
+    hash = attr.ib(type=str)
+    outcome = attr.ib(type=Optional[Dict[str, Any]], default=None)
+    trace = attr.ib(type=Optional[str], default=None)
+
+    @staticmethod
+    def from_dict(dkt: Dict[str, Any]) -> 'JournalEntry':
+        return JournalEntry(dkt['index'],
+                            dkt['hash'],
+                            dkt.get('outcome'),
+                            dkt.get('trace'))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'index': self.index,
+                'hash': self.hash,
+                'outcome': self.outcome,
+                'trace': self.trace}
+
+    def decode_outcome(self, system: Type[System]) -> Optional[MissionOutcome]:
+        """
+        Returns the outcome of the mission described by this entry, or None
+        if no outcome was recorded.
+        """
+        if self.outcome is None:
+            return None
+        return MissionOutcome.from_dict(self.outcome, system)
+
+
+class CampaignJournal(object):
+    """
+    A journal of the missions that have been completed by a campaign. If the
+    journal file already exists, its entries are loaded, and those missions
+    are considered to be complete.
+    """
+    def __init__(self, filename: str) -> None:
+        self.__filename = filename
+        self.__lock = threading.Lock()
+        self.__entries = {}  # type: Dict[Tuple[int, str], JournalEntry]
+        size = self._load()
+        self.__file = open(filename, 'a')
+        # discard any partially written entry at the end of the journal
+        if size is not None:
+            self.__file.truncate(size)
+        logger.info("loaded %d completed missions from journal: %s",
+                    len(self.__entries), filename)
+
+    def _load(self) -> Optional[int]:
+        """
+        Loads the entries from the journal file, if it exists.
+
+        Entries that cannot be parsed are skipped, unless they are at the
+        end of the journal, in which case they are assumed to have been
+        partially written and are discarded.
+
+        Returns:
+            the size, in bytes, of the journal without any partially written
+            entry at its end, or None if the journal file does not exist.
+        """
+        if not os.path.exists(self.__filename):
+            return None
+        size = 0
+        corrupt = None  # type: Optional[int]
+        corrupt_size = 0
+        with open(self.__filename, 'rb') as f:
+            for num, line in enumerate(f, 1):
+                if corrupt is not None:
+                    msg = "skipping corrupt entry on line %d of journal: %s"
+                    logger.warning(msg, corrupt, self.__filename)
+                    size += corrupt_size
+                    corrupt = None
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError("incomplete entry")
+                    dkt = json.loads(line.decode('utf-8'))
+                    entry = JournalEntry.from_dict(dkt)
+                except (ValueError, KeyError):
+                    corrupt = num
+                    corrupt_size = len(line)
+                    continue
+                self.__entries[(entry.index, entry.hash)] = entry
+                size += len(line)
+        if corrupt is not None:
+            msg = "ignoring incomplete entry at end of journal: %s"
+            logger.warning(msg, self.__filename)
+        return size
+
+    @property
+    def filename(self) -> str:
+        return self.__filename
+
+    def __len__(self) -> int:
+        """
+        The number of completed missions within this journal.
+        """
+        return len(self.__entries)
+
+    def __iter__(self) -> Iterator[JournalEntry]:
+        """
+        Returns an iterator over the entries within this journal.
+        """
+        with self.__lock:
+            entries = list(self.__entries.values())
+        yield from entries
+
+    def find(self, index: int, mission: Mission) -> Optional[JournalEntry]:
+        """
+        Returns the entry for a given mission at a given index within the
+        campaign, or None if that mission has not been completed.
+        """
+        key = (index, mission_hash(mission))
+        with self.__lock:
+            return self.__entries.get(key)
+
+    def is_complete(self, index: int, mission: Mission) -> bool:
+        """
+        Determines whether a given mission at a given index within the
+        campaign has been completed.
+        """
+        return self.find(index, mission) is not None
+
+    def record(self,
+               index: int,
+               mission: Mission,
+               outcome: Optional[MissionOutcome] = None,
+               trace: Optional[str] = None
+               ) -> JournalEntry:
+        """
+        Durably records the completion of a given mission.
+
+        Parameters:
+            index: the index of the mission within the campaign.
+            mission: the mission that was completed.
+            outcome: the outcome of the mission, if any.
+            trace: the location of the trace for the mission, if any.
+        """
+        jsn_outcome = outcome.to_dict() if outcome is not None else None
+        entry = JournalEntry(index, mission_hash(mission), jsn_outcome, trace)
+        line = json.dumps(entry.to_dict()) + '\n'
+        with self.__lock:
+            self.__file.write(line)
+            self.__file.flush()
+            os.fsync(self.__file.fileno())
+            self.__entries[(entry.index, entry.hash)] = entry
+        return entry
+
+    def pending(self,
+                missions: Iterator[Mission]
+                ) -> Iterator[Tuple[int, Mission]]:
+        """
+        Lazily filters a stream of missions, yielding the index and contents
+        of each mission that has not yet been completed.
+        """
+        for index, mission in enumerate(missions):
+            if self.is_complete(index, mission):
+                logger.debug("skipping completed mission: %d", index)
+                continue
+            yield index, mission
+
+    def close(self) -> None:
+        with self.__lock:
+            self.__file.close()
+
+    def __enter__(self) -> 'CampaignJournal':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
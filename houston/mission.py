@@ -14,6 +14,7 @@ from .command import Command, CommandOutcome
 from .state import State
 from .environment import Environment
 from .system import System
+from .pool import SandboxPool
 
 
 @attr.s(frozen=True)
@@ -74,18 +75,49 @@ class Mission(object):
 
     def run(self,
             bz: BugZooClient,
-            snapshot_or_name: Union[str, Snapshot]
+            snapshot_or_name: Union[str, Snapshot],
+            *,
+            pool: Optional[SandboxPool] = None,
+            cache: 'Optional[ResultCache]' = None,
+            timeout_model: 'Optional[TimeoutModel]' = None
             ) -> 'MissionOutcome':
         """
         Creates a sandbox and runs the commands and returns the outcome.
-        """
-        with self.system.sandbox.for_snapshot(bz,
-                                              snapshot_or_name,
-                                              self.initial_state,
-                                              self.environment,
-                                              self.configuration) as sandbox:
+        If a sandbox pool is provided, the sandbox is launched within one of
+        its warm containers rather than in a freshly provisioned container.
+        If a result cache is provided, the outcome is taken from the cache
+        (without launching a sandbox) whenever possible, and the outcome of
+        the mission is otherwise added to the cache. If a timeout model is
+        provided, it is used to determine the timeout for each command.
+        """
+        if isinstance(snapshot_or_name, str):
+            snapshot_name = snapshot_or_name
+        else:
+            snapshot_name = snapshot_or_name.name
+        if cache is not None:
+            outcome = cache.get_outcome(snapshot_name, self)
+            if outcome is not None:
+                return outcome
+
+        if pool is not None:
+            sandbox_context = pool.sandbox(self.system.sandbox,
+                                           self.initial_state,
+                                           self.environment,
+                                           self.configuration,
+                                           timeout_model=timeout_model)
+        else:
+            sandbox_context = \
+                self.system.sandbox.for_snapshot(bz,
+                                                 snapshot_or_name,
+                                                 self.initial_state,
+                                                 self.environment,
+                                                 self.configuration,
+                                                 timeout_model=timeout_model)
+        with sandbox_context as sandbox:
             outcome = sandbox.run(self.commands)
-            return outcome
+        if cache is not None:
+            cache.put_outcome(snapshot_name, self, outcome)
+        return outcome
 
 
 @attr.s(frozen=True)
@@ -99,8 +131,13 @@ class MissionOutcome(object):
     time_total = attr.ib(type=float)
 
     @staticmethod
-    def from_dict(dkt: Dict[str, Any]) -> 'CommandOutcome':
-        cmds = tuple(CommandOutcome.from_json(a) for a in jsn['commands'])
+    def from_dict(dkt: Dict[str, Any],
+                  system: Type[System]
+                  ) -> 'MissionOutcome':
+        if dkt.get('crashed', False):
+            return CrashedMissionOutcome(dkt['time_total'])
+        cmds = tuple(CommandOutcome.from_json(a, system.state)
+                     for a in dkt['commands'])
         return MissionOutcome(dkt['passed'],
                               cmds,
                               dkt['time_total'])
@@ -151,7 +188,7 @@ class MissionOutcome(object):
 
 class CrashedMissionOutcome(MissionOutcome):
     def __init__(self, total_time: float) -> None:
-        super().__init__(False, (), 0.0, total_time)
+        super().__init__(False, (), total_time)
 
     def to_dict(self):
         dkt = super().to_dict()
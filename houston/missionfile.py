@@ -0,0 +1,361 @@
+"""
+Provides streaming access to files of missions and their outcomes, allowing
+large suites of missions to be executed without holding every mission (or
+every outcome) in memory.
+
+Missions may be read either from a JSON Lines file, containing one mission
+per line, or from a JSON file containing an array of missions, which is
+parsed incrementally. Outcomes are appended to a JSON Lines results file as
+soon as they are reported.
+"""
+__all__ = ['MissionSource', 'MissionResultWriter', 'iter_mission_dicts',
+           'iter_results']
+
+from typing import Any, Dict, Iterator, Optional, TextIO, Tuple, Type
+import json
+import logging
+import queue
+import threading
+
+from .exceptions import InvalidMissionFile
+from .mission import Mission, MissionOutcome
+from .system import System
+
+logger = logging.getLogger(__name__)  # type: logging.Logger
+logger.setLevel(logging.DEBUG)
+
+# the number of characters read from a file at a time
+_CHUNK_SIZE = 1 << 16
+_WHITESPACE = ' \t\n\r'
+
+# the number of characters before the end of the buffer within which a decode
+# error may be caused by a truncated literal, number, or escape sequence
+_TRUNCATION_WINDOW = 6
+
+# marks the end of the missions within a source
+_END = object()
+
+
+def _iter_json_array(f: TextIO) -> Iterator[Any]:
+    """
+    Incrementally parses a JSON array from a given file, yielding each of its
+    elements in turn.
+    """
+    decoder = json.JSONDecoder()
+    buff = ''
+    pos = 0
+    eof = False
+    started = False
+
+    def fill() -> bool:
+        nonlocal buff, pos, eof
+        chunk = f.read(_CHUNK_SIZE)
+        buff = buff[pos:] + chunk
+        pos = 0
+        eof = not chunk
+        return not eof
+
+    def skip(chars: str) -> Optional[str]:
+        """
+        Skips whitespace and any of a given set of separators, returning the
+        next significant character, or None at the end of the file.
+        """
+        nonlocal pos
+        while True:
+            while pos < len(buff) and buff[pos] in chars:
+                pos += 1
+            if pos < len(buff):
+                return buff[pos]
+            if not fill():
+                return None
+
+    if skip(_WHITESPACE) != '[':
+        raise InvalidMissionFile("expected a JSON array.")
+    pos += 1
+    while True:
+        c = skip(_WHITESPACE + (',' if started else ''))
+        if c is None:
+            raise InvalidMissionFile("unexpected end of JSON array.")
+        if c == ']':
+            return
+        while True:
+            try:
+                value, end = decoder.raw_decode(buff, pos)
+            except json.JSONDecodeError as err:
+                # only errors at the end of the buffer may be due to the value
+                # being truncated; anything else is a genuine syntax error
+                truncated = err.msg.startswith('Unterminated string') or \
+                    err.pos >= len(buff) - _TRUNCATION_WINDOW
+                if truncated and fill():
+                    continue
+                raise InvalidMissionFile(str(err))
+            # a value that ends with the buffer may have been truncated
+            if end == len(buff) and fill():
+                continue
+            break
+        pos = end
+        started = True
+        yield value
+
+
+def iter_mission_dicts(f: TextIO) -> Iterator[Dict[str, Any]]:
+    """
+    Lazily reads the JSON description of each mission within a given file,
+    which may either contain a JSON array of missions or one mission per line
+    (i.e., JSON Lines).
+    """
+    first = f.read(1)
+    while first and first in _WHITESPACE:
+        first = f.read(1)
+    if not first:
+        return
+    if first == '[':
+        yield from _iter_json_array(_Prefixed(first, f))
+        return
+    for i, line in enumerate(_Prefixed(first, f)):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as err:
+            msg = "failed to parse line {}: {}".format(i + 1, err)
+            raise InvalidMissionFile(msg)
+
+
+class _Prefixed(object):
+    """
+    Wraps a file from which a prefix has already been read.
+    """
+    def __init__(self, prefix: str, f: TextIO) -> None:
+        self.__prefix = prefix
+        self.__file = f
+
+    def read(self, size: int = -1) -> str:
+        prefix, self.__prefix = self.__prefix, ''
+        if size < 0:
+            return prefix + self.__file.read()
+        return prefix + self.__file.read(max(size - len(prefix), 0))
+
+    def __iter__(self) -> Iterator[str]:
+        first = self.__prefix + self.__file.readline()
+        self.__prefix = ''
+        if first:
+            yield first
+        yield from self.__file
+
+
+class MissionSource(object):
+    """
+    A lazy source of missions that are read from a file on disk. A background
+    thread reads and decodes missions ahead of their consumption, but never
+    holds more than a bounded number of decoded missions in memory.
+
+    Mission sources may be passed as the source of a mission runner pool,
+    which will pull missions from the source as workers become available.
+    """
+    def __init__(self,
+                 filename: str,
+                 *,
+                 prefetch: int = 16
+                 ) -> None:
+        """
+        Parameters:
+            filename: the name of the file of missions.
+            prefetch: the maximum number of missions that may be decoded ahead
+                of their consumption. If zero, missions are decoded upon
+                request by the consumer.
+        """
+        assert prefetch >= 0
+        self.__filename = filename
+        self.__file = open(filename, 'r')
+        self.__missions = map(Mission.from_dict,
+                              iter_mission_dicts(self.__file))
+        self.__lock = threading.Lock()
+        self.__closed = threading.Event()
+        self.__done = False
+        self.__thread = None  # type: Optional[threading.Thread]
+        if prefetch > 0:
+            self.__queue = queue.Queue(prefetch)  # type: queue.Queue
+            self.__thread = threading.Thread(target=self._prefetch)
+            self.__thread.daemon = True
+            self.__thread.start()
+
+    @property
+    def filename(self) -> str:
+        return self.__filename
+
+    def _prefetch(self) -> None:
+        try:
+            for mission in self.__missions:
+                if not self._put(mission):
+                    return
+            self._put(_END)
+        except Exception as err:
+            self._put(err)
+
+    def _put(self, item: Any) -> bool:
+        """
+        Blocks until a given item has been added to the prefetch queue.
+
+        Returns:
+            False if the source was closed before the item could be added.
+        """
+        while not self.__closed.is_set():
+            try:
+                self.__queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self) -> Any:
+        """
+        Blocks until an item is available from the prefetch queue.
+
+        Raises:
+            StopIteration: if the source was closed before an item became
+                available.
+        """
+        while not self.__closed.is_set():
+            try:
+                return self.__queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        raise StopIteration
+
+    def __iter__(self) -> 'MissionSource':
+        return self
+
+    def __next__(self) -> Mission:
+        """
+        Returns the next mission within the file.
+
+        Raises:
+            StopIteration: if there are no missions left.
+            InvalidMissionFile: if the file could not be parsed.
+        """
+        with self.__lock:
+            if self.__done or self.__closed.is_set():
+                raise StopIteration
+            if self.__thread is None:
+                try:
+                    return next(self.__missions)
+                except StopIteration:
+                    self.__done = True
+                    raise
+            item = self._get()
+            if item is _END:
+                self.__done = True
+                raise StopIteration
+            if isinstance(item, Exception):
+                self.__done = True
+                raise item
+            return item
+
+    def close(self) -> None:
+        """
+        Stops reading missions and closes the underlying file.
+        """
+        self.__closed.set()
+        if self.__thread is not None:
+            self.__thread.join()
+        self.__file.close()
+
+    def __enter__(self) -> 'MissionSource':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+class MissionResultWriter(object):
+    """
+    Appends the outcome of each mission to a JSON Lines results file as soon
+    as it is reported. Each line holds the description of a mission and its
+    outcome, and is flushed to the file before the next result is written.
+
+    Writers may be used directly as the callback of a mission runner pool.
+    """
+    def __init__(self, filename: str) -> None:
+        self.__filename = filename
+        self.__file = open(filename, 'a')
+        self.__lock = threading.Lock()
+        self.__num_written = 0
+        self.__num_failed = 0
+
+    @property
+    def filename(self) -> str:
+        return self.__filename
+
+    @property
+    def num_written(self) -> int:
+        """
+        The number of results that have been written by this writer.
+        """
+        return self.__num_written
+
+    @property
+    def num_failed(self) -> int:
+        """
+        The number of failed missions that have been written by this writer.
+        """
+        return self.__num_failed
+
+    def write(self,
+              mission: Mission,
+              outcome: MissionOutcome,
+              coverage=None
+              ) -> None:
+        """
+        Appends the outcome of a given mission to the results file.
+        """
+        result = {'mission': mission.to_dict(),
+                  'outcome': outcome.to_dict()}
+        if coverage is not None:
+            result['coverage'] = coverage.to_dict()
+        line = json.dumps(result) + '\n'
+        with self.__lock:
+            self.__file.write(line)
+            self.__file.flush()
+            self.__num_written += 1
+            if not outcome.passed:
+                self.__num_failed += 1
+
+    __call__ = write
+
+    def close(self) -> None:
+        with self.__lock:
+            self.__file.close()
+
+    def __enter__(self) -> 'MissionResultWriter':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def iter_results(filename: str,
+                 system: Optional[Type[System]] = None
+                 ) -> Iterator[Tuple[Mission, MissionOutcome]]:
+    """
+    Lazily reads each mission and its outcome from a given results file.
+    If no system is given, the system of each mission is used to decode its
+    outcome.
+    """
+    with open(filename, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                result = json.loads(line)
+            except ValueError:
+                # the last result may be incomplete if the run was killed
+                logger.warning("skipping unreadable result in file: %s",
+                               filename)
+                continue
+            mission = Mission.from_dict(result['mission'])
+            outcome = MissionOutcome.from_dict(result['outcome'],
+                                               system or mission.system)
+            yield mission, outcome
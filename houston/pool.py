@@ -0,0 +1,240 @@
+__all__ = ['SandboxPool']
+
+from typing import Iterator, List, Optional, Type, Union, Dict
+from contextlib import contextmanager
+import threading
+import logging
+
+from bugzoo import Bug as Snapshot
+from bugzoo.client import Client as BugZooClient
+from bugzoo.core.container import Container
+
+from .configuration import Configuration
+from .environment import Environment
+from .state import State
+from .exceptions import HoustonException
+
+logger = logging.getLogger(__name__)  # type: logging.Logger
+logger.setLevel(logging.DEBUG)
+
+
+class SandboxPool(object):
+    """
+    Maintains a pool of warm BugZoo containers for a given snapshot, allowing
+    containers to be reused across missions rather than being provisioned
+    and destroyed for each mission.
+
+    Each mission obtains a fresh sandbox within one of the pooled containers.
+    Between missions, only the simulation inside the container is restarted:
+    the sandbox is stopped, the container is reset via
+    :meth:`houston.sandbox.Sandbox.reset_container`, and a new sandbox is
+    launched when the container is next acquired.
+
+    Containers are evicted (i.e., destroyed and lazily replaced) whenever
+    they fail a health check: if an error occurred while the sandbox was in
+    use, if the container is no longer alive, or if the container has been
+    used for a given maximum number of missions.
+    """
+    def __init__(self,
+                 client_bugzoo: BugZooClient,
+                 snapshot_or_name: Union[str, Snapshot],
+                 size: int,
+                 *,
+                 max_uses: Optional[int] = None,
+                 instrument: bool = False
+                 ) -> None:
+        """
+        Parameters:
+            client_bugzoo: the BugZoo client used to manage containers.
+            snapshot_or_name: the snapshot (or the name of the snapshot) from
+                which containers should be provisioned.
+            size: the maximum number of containers kept by the pool.
+            max_uses: the maximum number of missions that may be executed by
+                a single container before it is replaced. If None, containers
+                are reused for as long as they remain healthy.
+            instrument: if True, containers are instrumented for coverage
+                collection upon being provisioned.
+        """
+        assert size > 0
+        assert max_uses is None or max_uses > 0
+        if isinstance(snapshot_or_name, str):
+            snapshot = client_bugzoo.bugs[snapshot_or_name]
+        else:
+            snapshot = snapshot_or_name
+
+        self.__bugzoo = client_bugzoo
+        self.__snapshot = snapshot
+        self.__size = size
+        self.__max_uses = max_uses
+        self.__instrument = instrument
+        self.__idle = []  # type: List[Container]
+        self.__uses = {}  # type: Dict[str, int]
+        self.__num_provisioned = 0
+        self.__closed = False
+        self.__lock = threading.Lock()
+        self.__available = threading.Condition(self.__lock)
+
+    @property
+    def size(self) -> int:
+        """
+        The maximum number of containers that are kept by this pool.
+        """
+        return self.__size
+
+    @property
+    def snapshot(self) -> Snapshot:
+        """
+        The snapshot used to provision containers for this pool.
+        """
+        return self.__snapshot
+
+    def __enter__(self) -> 'SandboxPool':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def warm(self) -> None:
+        """
+        Provisions containers until the pool is full.
+        """
+        while True:
+            with self.__lock:
+                if self.__closed or self.__num_provisioned >= self.__size:
+                    return
+                self.__num_provisioned += 1
+            try:
+                container = self._provision()
+            except Exception:
+                with self.__available:
+                    self.__num_provisioned -= 1
+                    self.__available.notify()
+                raise
+            self._release(container, healthy=True, used=False)
+
+    def _provision(self) -> Container:
+        bzc = self.__bugzoo.containers
+        logger.debug("provisioning container for pool: %s",
+                     self.__snapshot.name)
+        container = bzc.provision(self.__snapshot)
+        try:
+            if self.__instrument:
+                bzc.instrument(container)
+        except Exception:
+            del bzc[container.uid]
+            raise
+        self.__uses[container.uid] = 0
+        logger.debug("provisioned container for pool: %s", container.uid)
+        return container
+
+    def _destroy(self, container: Container) -> None:
+        logger.debug("destroying pooled container: %s", container.uid)
+        self.__uses.pop(container.uid, None)
+        try:
+            del self.__bugzoo.containers[container.uid]
+        except Exception:
+            logger.exception("failed to destroy container: %s",
+                             container.uid)
+
+    def _acquire(self) -> Container:
+        """
+        Obtains a container from the pool, blocking until one is available.
+        A new container is provisioned if there are no idle containers and
+        the pool is not yet full.
+        """
+        with self.__available:
+            while True:
+                if self.__closed:
+                    raise HoustonException("sandbox pool has been closed.")
+                if self.__idle:
+                    return self.__idle.pop()
+                if self.__num_provisioned < self.__size:
+                    self.__num_provisioned += 1
+                    break
+                self.__available.wait()
+        try:
+            return self._provision()
+        except Exception:
+            with self.__available:
+                self.__num_provisioned -= 1
+                self.__available.notify()
+            raise
+
+    def _is_healthy(self, container: Container) -> bool:
+        if self.__max_uses is not None and \
+                self.__uses.get(container.uid, 0) >= self.__max_uses:
+            logger.debug("container reached maximum number of uses: %s",
+                         container.uid)
+            return False
+        try:
+            return self.__bugzoo.containers.is_alive(container)
+        except Exception:
+            logger.exception("failed to check health of container: %s",
+                             container.uid)
+            return False
+
+    def _release(self,
+                 container: Container,
+                 healthy: bool,
+                 used: bool = True
+                 ) -> None:
+        """
+        Returns a container to the pool, or evicts it from the pool if it is
+        no longer healthy.
+        """
+        if used:
+            self.__uses[container.uid] = self.__uses.get(container.uid, 0) + 1
+        healthy = healthy and not self.__closed and \
+            self._is_healthy(container)
+        if not healthy:
+            logger.info("evicting container from pool: %s", container.uid)
+            self._destroy(container)
+        with self.__available:
+            if healthy:
+                self.__idle.append(container)
+            else:
+                self.__num_provisioned -= 1
+            self.__available.notify()
+
+    @contextmanager
+    def sandbox(self,
+                sandbox_class: Type['Sandbox'],
+                state_initial: State,
+                environment: Environment,
+                configuration: Configuration,
+                **kwargs
+                ) -> Iterator['Sandbox']:
+        """
+        Launches an interactive sandbox inside a pooled container. The
+        container is returned to the pool (or evicted) upon leaving the
+        context.
+        """
+        container = self._acquire()
+        healthy = False
+        try:
+            with sandbox_class.for_container(self.__bugzoo,
+                                             container,
+                                             state_initial,
+                                             environment,
+                                             configuration,
+                                             **kwargs) as sandbox:
+                yield sandbox
+            sandbox_class.reset_container(self.__bugzoo, container)
+            healthy = True
+        finally:
+            self._release(container, healthy)
+
+    def close(self) -> None:
+        """
+        Destroys all idle containers and prevents further containers from
+        being acquired. Containers that are in use are destroyed upon being
+        released.
+        """
+        with self.__available:
+            self.__closed = True
+            idle = self.__idle
+            self.__idle = []
+            self.__num_provisioned -= len(idle)
+            self.__available.notify_all()
+        for container in idle:
+            self._destroy(container)
@@ -7,6 +7,7 @@ from ..state import State
 from ..environment import Environment
 from ..mission import Mission
 from ..configuration import Configuration
+from ..pool import SandboxPool
 
 
 class DeltaDebugging(RootCauseFinder):
@@ -27,6 +28,7 @@ class DeltaDebugging(RootCauseFinder):
             initial_failing_missions[0], discrete_params=True)
         self.__bz = bz
         self.__snapshot = snapshot
+        self.__pool = None  # type: Optional[SandboxPool]
 
         super(DeltaDebugging, self).__init__(system, initial_state,
                                              environment, config,
@@ -41,7 +43,11 @@ class DeltaDebugging(RootCauseFinder):
 
     def find_root_cause(self, time_limit: float = 0.0) -> MissionDomain:
         empty_domain = MissionDomain(self.system)
-        final_domain = self._dd2(self.domain, empty_domain)
+        # missions are executed one at a time, reusing a single container
+        with SandboxPool(self.__bz, self.__snapshot, 1) as pool:
+            self.__pool = pool
+            final_domain = self._dd2(self.domain, empty_domain)
+        self.__pool = None
         print("FINISHED: {}".format(str(final_domain)))
 
         return final_domain
@@ -77,7 +83,7 @@ class DeltaDebugging(RootCauseFinder):
                                                   self.initial_state,
                                                   self.configuration,
                                                   self.rng)
-        res = mission.run(self.__bz, self.__snapshot)
+        res = mission.run(self.__bz, self.__snapshot, pool=self.__pool)
 
         return res.passed
 
@@ -1,13 +1,21 @@
-from typing import Optional, Tuple
+from typing import Optional, Tuple, Dict, Any, List
+from timeit import default_timer as timer
 import logging
 
+import multiprocessing
+import queue
 import threading
 import time
 import signal
 from bugzoo.client import Client as BugZooClient
 
 from .util import TimeoutError, printflush
-from .mission import Mission
+from .mission import Mission, MissionOutcome, CrashedMissionOutcome
+from .pool import SandboxPool
+from .journal import CampaignJournal
+from .cache import ResultCache
+from .timeouts import TimeoutModel
+from .tracefile import dump_traces, load_traces
 
 logger = logging.getLogger(__name__)   # type: logging.Logger
 logger.setLevel(logging.DEBUG)
@@ -56,14 +64,16 @@ class MissionRunner(threading.Thread):
                 start_time = time.time()
                 outcome = mission.run(self.__bz,
                                       self.__snapshot_name,
-                                      recorder_filename)
+                                      pool=self.__pool.sandboxes,
+                                      cache=self.__pool.cache,
+                                      timeout_model=self.__pool.timeout_model)
                 logger.info("Finished running mission %d in %f seconds."
                             " Passed: %s",
                             index,
                             time.time() - start_time,
                             outcome.passed)
                 coverage = None
-            self.__pool.report(mission, outcome, coverage)
+            self.__pool.report(mission, outcome, coverage, index=index)
 
     def shutdown(self):
         return
@@ -74,6 +84,17 @@ class MissionRunnerPool(object):
     Mission runner pools are used to distribute the execution of a stream
     of missions across a given number of workers, each running on a separate
     thread.
+
+    If a campaign journal is provided, the completion of each mission is
+    durably recorded in the journal once it has been reported, and missions
+    that the journal records as complete are skipped, allowing an interrupted
+    campaign to be resumed. If the callback returns a string, it is recorded
+    as the location of the trace for the mission.
+
+    If a result cache is provided, missions whose outcomes are already
+    within the cache are not executed, and the outcomes of all other
+    missions are added to the cache. If a timeout model is provided, it is
+    used by each sandbox to determine the timeout for each command.
     """
     def __init__(self,
                  bz: BugZooClient,
@@ -83,7 +104,11 @@ class MissionRunnerPool(object):
                  source,  # FIXME
                  callback,  # FIXMe
                  with_coverage=False,
-                 record=False):
+                 record=False,
+                 *,
+                 journal: Optional[CampaignJournal] = None,
+                 cache: Optional[ResultCache] = None,
+                 timeout_model: Optional[TimeoutModel] = None):
         assert callable(callback)
         assert size > 0
 
@@ -94,9 +119,16 @@ class MissionRunnerPool(object):
         self.__system = system
         self.__source = source
         self.__callback = callback
+        self.__journal = journal
+        self.__cache = cache
+        self.__timeout_model = timeout_model
         self.__index = -1
         self._lock = threading.Lock()
 
+        # each runner draws its sandboxes from a shared pool of containers
+        self.__sandboxes = SandboxPool(bz, snapshot_name, size,
+                                       instrument=with_coverage)
+
         # provision desired number of runners
         self.__runners = \
             [MissionRunner(self, bz, snapshot_name, with_coverage, record)
@@ -132,6 +164,7 @@ class MissionRunnerPool(object):
             if runner is not None:
                 runner.shutdown()
         self.__runners = []
+        self.__sandboxes.close()
 
     @property
     def system(self) -> 'System':
@@ -140,6 +173,27 @@ class MissionRunnerPool(object):
         """
         return self.__system
 
+    @property
+    def sandboxes(self) -> SandboxPool:
+        """
+        The pool of warm containers from which runners obtain sandboxes.
+        """
+        return self.__sandboxes
+
+    @property
+    def cache(self) -> Optional[ResultCache]:
+        """
+        The cache of mission results used by this pool, if any.
+        """
+        return self.__cache
+
+    @property
+    def timeout_model(self) -> Optional[TimeoutModel]:
+        """
+        The model of command timeouts used by this pool, if any.
+        """
+        return self.__timeout_model
+
     @property
     def size(self) -> int:
         """
@@ -148,14 +202,15 @@ class MissionRunnerPool(object):
         """
         return self.__runners.length()
 
-    def report(self, mission, outcome, coverage=None) -> None:
+    def report(self, mission, outcome, coverage=None, *, index=None) -> None:
         """
         Used to report the outcome of a mission.
 
         WARNING: It is the responsibility of the callback to guarantee
             thread safety (if necessary).
         """
-        self.__callback(mission, outcome, coverage)
+        trace = self.__callback(mission, outcome, coverage)
+        _journal(self.__journal, index, mission, outcome, trace)
 
     def fetch(self) -> Tuple[int, Optional[Mission]]:
         """
@@ -168,11 +223,339 @@ class MissionRunnerPool(object):
         # acquire fetch lock
         self._lock.acquire()
         try:
-            self.__index += 1
-            return self.__index, self.__source.__next__()
+            # skip any missions that were completed by a previous run
+            while True:
+                self.__index += 1
+                mission = self.__source.__next__()
+                if not _is_complete(self.__journal, self.__index, mission):
+                    return self.__index, mission
 
         except StopIteration:
             return self.__index, None
 
         finally:
             self._lock.release()
+
+
+def _is_complete(journal: Optional[CampaignJournal],
+                 index: int,
+                 mission: Mission
+                 ) -> bool:
+    """
+    Determines whether a given journal, if any, records a mission as
+    complete.
+    """
+    if journal is None or not journal.is_complete(index, mission):
+        return False
+    logger.info("skipping mission #%d: already completed", index)
+    return True
+
+
+def _journal(journal: Optional[CampaignJournal],
+             index: Optional[int],
+             mission: Mission,
+             outcome: Any,
+             trace: Any
+             ) -> None:
+    """
+    Records the completion of a mission in a given journal, if any.
+    """
+    if journal is None or index is None:
+        return
+    if not isinstance(outcome, MissionOutcome):
+        outcome = None
+    if not isinstance(trace, str):
+        trace = None
+    journal.record(index, mission, outcome, trace)
+
+
+def _run_missions_in_process(bz: BugZooClient,
+                             snapshot_name: str,
+                             trace: bool,
+                             with_coverage: bool,
+                             cache: Optional[ResultCache],
+                             timeout_model: Optional[TimeoutModel],
+                             tasks: multiprocessing.Queue,
+                             results: multiprocessing.Queue
+                             ) -> None:
+    """
+    Executes missions, received as JSON descriptions from a given queue of
+    tasks, inside a worker process until a None task is received. The
+    outcome (or trace) of each mission is placed on a queue of results as a
+    tuple of the form (index, kind, payload), where the kind is one of
+    'outcome', 'trace', or 'crashed'.
+
+    Each worker process owns its sandboxes: missions are executed within a
+    single container that is reused for all missions assigned to the worker.
+    If coverage is requested, that container is instrumented, and the
+    coverage of each command is recorded within its trace. If a result
+    cache is given, missions whose results are within the cache
+    are not executed. If a timeout model is given, it is used to determine
+    the timeout of each command.
+    """
+    with SandboxPool(bz, snapshot_name, 1,
+                     instrument=with_coverage) as sandboxes:
+        while True:
+            task = tasks.get()
+            if task is None:
+                return
+            index, jsn_mission = task
+            mission = Mission.from_dict(jsn_mission)
+            logger.info("Running mission #%d", index)
+            time_start = timer()
+            try:
+                if trace:
+                    mission_trace = None
+                    if cache is not None:
+                        mission_trace = cache.get_trace(
+                            snapshot_name,
+                            mission,
+                            coverage=with_coverage,
+                            columnar=True)
+                    if mission_trace is None:
+                        with sandboxes.sandbox(mission.system.sandbox,
+                                               mission.initial_state,
+                                               mission.environment,
+                                               mission.configuration,
+                                               timeout_model=timeout_model
+                                               ) as sandbox:
+                            mission_trace = sandbox.run_and_trace(
+                                mission.commands,
+                                collect_coverage=with_coverage,
+                                columnar=True)
+                        if cache is not None:
+                            cache.put_trace(snapshot_name,
+                                            mission,
+                                            mission_trace,
+                                            coverage=with_coverage)
+                    kind = 'trace'
+                    payload = dump_traces([mission_trace],
+                                          mission.system,
+                                          compress=True)
+                else:
+                    outcome = mission.run(bz,
+                                          snapshot_name,
+                                          pool=sandboxes,
+                                          cache=cache,
+                                          timeout_model=timeout_model)
+                    kind = 'outcome'
+                    payload = outcome.to_dict()
+            except Exception:
+                logger.exception("mission #%d crashed", index)
+                kind = 'crashed'
+                payload = CrashedMissionOutcome(timer() - time_start).to_dict()
+            logger.info("Finished running mission %d in %f seconds.",
+                        index, timer() - time_start)
+            results.put((index, kind, payload))
+
+
+class MissionProcessPool(object):
+    """
+    A variant of the mission runner pool that distributes the execution of a
+    stream of missions across a given number of worker processes rather than
+    threads, avoiding contention for the GIL between concurrently running
+    sandboxes.
+
+    Each worker process owns its own sandboxes. Missions are sent to workers
+    as JSON descriptions, and results are streamed back in a compact form:
+    mission outcomes as JSON, and mission traces using the binary trace
+    format. Results are reported via the callback from the thread that
+    called :meth:`run`, using the same contract as
+    :meth:`MissionRunnerPool.report`. If traces are requested, the callback
+    is given the trace of the mission in place of its outcome, and if
+    coverage is also requested, that trace records the coverage of each
+    command.
+
+    Missions are only fetched from the source once a worker is ready to
+    execute them, allowing the source to be generated lazily. Campaign
+    journals, result caches and timeout models are supported in the same way
+    as :class:`MissionRunnerPool`; the cache is shared by all workers, and
+    each worker inherits a copy of the timeout model.
+    """
+    def __init__(self,
+                 bz: BugZooClient,
+                 snapshot_name: str,
+                 system: 'System',
+                 size: int,
+                 source,  # FIXME
+                 callback,  # FIXME
+                 with_coverage: bool = False,
+                 *,
+                 trace: bool = False,
+                 journal: Optional[CampaignJournal] = None,
+                 cache: Optional[ResultCache] = None,
+                 timeout_model: Optional[TimeoutModel] = None
+                 ) -> None:
+        assert callable(callback)
+        assert size > 0
+        # coverage is only reported as part of the trace of each mission
+        assert trace or not with_coverage
+
+        # if a list is provided, use an iterator for that list
+        if isinstance(source, list):
+            source = iter(source)
+
+        self.__bz = bz
+        self.__snapshot_name = snapshot_name
+        self.__system = system
+        self.__size = size
+        self.__source = source
+        self.__callback = callback
+        self.__trace = trace
+        self.__with_coverage = with_coverage
+        self.__journal = journal
+        self.__cache = cache
+        self.__timeout_model = timeout_model
+        self.__index = -1
+        self.__workers = []  # type: List[multiprocessing.Process]
+
+        # workers are forked to inherit the BugZoo client and the registry
+        # of command types
+        self.__context = multiprocessing.get_context('fork')
+
+    @property
+    def system(self) -> 'System':
+        """
+        The system under test.
+        """
+        return self.__system
+
+    @property
+    def size(self) -> int:
+        """
+        The number of worker processes used by the pool to run missions.
+        """
+        return self.__size
+
+    @property
+    def timeout_model(self) -> Optional[TimeoutModel]:
+        """
+        The model of command timeouts used by the workers of this pool, if
+        any.
+        """
+        return self.__timeout_model
+
+    def report(self, mission, outcome, coverage=None, *, index=None) -> None:
+        """
+        Used to report the outcome of a mission.
+        """
+        trace = self.__callback(mission, outcome, coverage)
+        _journal(self.__journal, index, mission, outcome, trace)
+
+    def fetch(self) -> Tuple[int, Optional[Mission]]:
+        """
+        Returns the next mission from the (lazily-generated) source, or None
+        if there are no missions left to run.
+        """
+        try:
+            while True:
+                self.__index += 1
+                mission = self.__source.__next__()
+                if not _is_complete(self.__journal, self.__index, mission):
+                    return self.__index, mission
+        except StopIteration:
+            return self.__index, None
+
+    def _decode(self, kind: str, payload: Any) -> Any:
+        if kind == 'trace':
+            _, traces = load_traces(payload, self.__system)
+            return traces[0]
+        return MissionOutcome.from_dict(payload, self.__system)
+
+    def _spawn(self,
+               results: multiprocessing.Queue
+               ) -> Tuple[multiprocessing.Process, multiprocessing.Queue]:
+        """
+        Starts a worker process, and returns that process together with the
+        queue from which it receives its tasks.
+        """
+        tasks = self.__context.Queue()  # type: multiprocessing.Queue
+        args = (self.__bz, self.__snapshot_name, self.__trace,
+                self.__with_coverage, self.__cache, self.__timeout_model,
+                tasks, results)
+        worker = self.__context.Process(target=_run_missions_in_process,
+                                        args=args)
+        worker.daemon = True
+        worker.start()
+        self.__workers.append(worker)
+        return worker, tasks
+
+    def run(self) -> None:
+        """
+        Executes all missions provided by the source of this pool, blocking
+        until their results have been reported. If a worker process dies,
+        the mission that it was executing is reported as having crashed and
+        the worker is replaced.
+        """
+        results = self.__context.Queue()  # type: multiprocessing.Queue
+        slots = []  # type: List[Tuple[multiprocessing.Process, multiprocessing.Queue]]  # noqa: pycodestyle
+        # maps each busy worker slot to its (index, mission, start time)
+        assigned = {}  # type: Dict[int, Tuple[int, Mission, float]]
+        try:
+            for _ in range(self.__size):
+                slots.append(self._spawn(results))
+
+            # keep each worker busy with one mission at a time
+            exhausted = False
+            while True:
+                for slot in range(len(slots)):
+                    if exhausted:
+                        break
+                    if slot in assigned:
+                        continue
+                    index, mission = self.fetch()
+                    if mission is None:
+                        exhausted = True
+                        break
+                    assigned[slot] = (index, mission, timer())
+                    slots[slot][1].put((index, mission.to_dict()))
+                if not assigned:
+                    break
+                try:
+                    index, kind, payload = results.get(timeout=1.0)
+                except queue.Empty:
+                    pass
+                else:
+                    for slot, (index_slot, mission, _) in assigned.items():
+                        if index_slot == index:
+                            del assigned[slot]
+                            outcome = self._decode(kind, payload)
+                            self.report(mission, outcome, index=index)
+                            break
+                self._replace_dead_workers(slots, assigned, results)
+        finally:
+            for _, tasks in slots:
+                tasks.put(None)
+            self.shutdown()
+
+    def _replace_dead_workers(self,
+                              slots: List[Tuple[multiprocessing.Process, multiprocessing.Queue]],  # noqa: pycodestyle
+                              assigned: Dict[int, Tuple[int, Mission, float]],
+                              results: multiprocessing.Queue
+                              ) -> None:
+        """
+        Reports the missions held by any dead workers as having crashed, and
+        replaces those workers with new ones.
+        """
+        for slot, (worker, _) in enumerate(slots):
+            if worker.is_alive():
+                continue
+            logger.error("worker process died (exit code: %s)",
+                         worker.exitcode)
+            if slot in assigned:
+                index, mission, time_start = assigned.pop(slot)
+                logger.error("mission #%d crashed", index)
+                outcome = CrashedMissionOutcome(timer() - time_start)
+                self.report(mission, outcome, index=index)
+            slots[slot] = self._spawn(results)
+
+    def shutdown(self) -> None:
+        """
+        Waits for all workers that belong to this pool to exit, terminating
+        any that fail to do so.
+        """
+        for worker in self.__workers:
+            worker.join(timeout=30.0)
+            if worker.is_alive():
+                worker.terminate()
+        self.__workers = []
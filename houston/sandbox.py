@@ -1,8 +1,9 @@
 from typing import Set, Optional, Tuple, Dict, Sequence, Iterator, Union
 from timeit import default_timer as timer
 from contextlib import contextmanager
+import asyncio
+import functools
 import math
-import time
 import threading
 import signal
 import logging
@@ -19,12 +20,94 @@ from .environment import Environment
 from .configuration import Configuration
 from .state import State
 from .command import Command, CommandOutcome
-from .trace import MissionTrace, CommandTrace, TraceRecorder
+from .trace import MissionTrace, CommandTrace, TraceRecorder, \
+    ColumnarTraceRecorder
 
 logger = logging.getLogger(__name__)  # type: logging.Logger
 logger.setLevel(logging.DEBUG)
 
 
+def cached_trace(run_and_trace):
+    """
+    Decorates the :meth:`Sandbox.run_and_trace` method of a sandbox class,
+    such that the trace of a mission is taken from the result cache of the
+    sandbox, if it has one, rather than executing the mission. Traces for
+    missions that are not in the cache are added to it. Coroutines, such as
+    :meth:`Sandbox.run_and_trace_async`, may be decorated in the same way.
+    """
+    def lookup(self: 'Sandbox',
+               commands: Sequence[Command],
+               collect_coverage: bool,
+               columnar: bool
+               ) -> Optional[MissionTrace]:
+        snapshot = self.container.bug
+        mission = self._mission(commands)
+        trace = self.cache.get_trace(snapshot,
+                                     mission,
+                                     coverage=collect_coverage,
+                                     columnar=columnar)
+        if trace is not None:
+            logger.debug("using cached trace for mission")
+        return trace
+
+    def store(self: 'Sandbox',
+              commands: Sequence[Command],
+              collect_coverage: bool,
+              trace: MissionTrace
+              ) -> None:
+        self.cache.put_trace(self.container.bug,
+                             self._mission(commands),
+                             trace,
+                             coverage=collect_coverage)
+
+    if asyncio.iscoroutinefunction(run_and_trace):
+        @functools.wraps(run_and_trace)
+        async def wrapped_async(self: 'Sandbox',
+                                commands: Sequence[Command],
+                                collect_coverage: bool = False,
+                                *,
+                                columnar: bool = False
+                                ) -> MissionTrace:
+            if self.cache is None:
+                return await run_and_trace(self,
+                                           commands,
+                                           collect_coverage,
+                                           columnar=columnar)
+            trace = lookup(self, commands, collect_coverage, columnar)
+            if trace is not None:
+                return trace
+            trace = await run_and_trace(self,
+                                        commands,
+                                        collect_coverage,
+                                        columnar=columnar)
+            store(self, commands, collect_coverage, trace)
+            return trace
+        return wrapped_async
+
+    @functools.wraps(run_and_trace)
+    def wrapped(self: 'Sandbox',
+                commands: Sequence[Command],
+                collect_coverage: bool = False,
+                *,
+                columnar: bool = False
+                ) -> MissionTrace:
+        if self.cache is None:
+            return run_and_trace(self,
+                                 commands,
+                                 collect_coverage,
+                                 columnar=columnar)
+        trace = lookup(self, commands, collect_coverage, columnar)
+        if trace is not None:
+            return trace
+        trace = run_and_trace(self,
+                              commands,
+                              collect_coverage,
+                              columnar=columnar)
+        store(self, commands, collect_coverage, trace)
+        return trace
+    return wrapped
+
+
 class Sandbox(object):
     """
     Sandboxes are used to provide an isolated, idempotent environment for
@@ -37,13 +120,15 @@ class Sandbox(object):
                      snapshot_or_name: Union[str, Snapshot],
                      state_initial: State,
                      environment: Environment,
-                     configuration: Configuration
+                     configuration: Configuration,
+                     **kwargs
                      ) -> Iterator['Sandbox']:
         """
         Creates an ephemeral BugZoo container using a provided image before
         launching an interactive sandbox instance inside that container. The
         Docker container (and all of its associated resources) is automatically
-        created and destroyed upon entering and leaving the context.
+        created and destroyed upon entering and leaving the context. Any
+        additional keyword arguments are passed to the sandbox constructor.
         """
         if isinstance(snapshot_or_name, str):
             snapshot = client_bugzoo.bugs[snapshot_or_name]
@@ -52,8 +137,11 @@ class Sandbox(object):
 
         container = None  # type: Optional[Container]
         try:
+            time_start = timer()
             container = client_bugzoo.containers.provision(snapshot)
-            with cls.for_container(client_bugzoo, container, state_initial, environment, configuration) as sandbox:  # noqa: pycodestyle
+            time_provision = timer() - time_start
+            with cls.for_container(client_bugzoo, container, state_initial, environment, configuration, **kwargs) as sandbox:  # noqa: pycodestyle
+                sandbox._record_startup_phase('container', time_provision)
                 yield sandbox
         finally:
             if container:
@@ -94,6 +182,19 @@ class Sandbox(object):
         finally:
             sandbox.stop()
 
+    @classmethod
+    def reset_container(cls,
+                        client_bugzoo: BugZooClient,
+                        container: Container
+                        ) -> None:
+        """
+        Restores a given container, after a sandbox inside it has been
+        stopped, to a condition where it can be reused to launch a new
+        sandbox (e.g., by removing any persistent state written by the
+        system under test).
+        """
+        pass
+
     def __init__(self,
                  client_bugzoo: BugZooClient,
                  container: Container,
@@ -101,10 +202,23 @@ class Sandbox(object):
                  environment: Environment,
                  configuration: Configuration,
                  *,
-                 prefix: str = ''
+                 prefix: str = '',
+                 cache: 'Optional[ResultCache]' = None,
+                 timeout_model: 'Optional[TimeoutModel]' = None
                  ) -> None:
+        """
+        Parameters:
+            cache: an optional cache of mission results. If provided, the
+                traces produced by :meth:`run_and_trace` are taken from, and
+                added to, the cache.
+            timeout_model: an optional model of command timeouts. If
+                provided, the time allowed for each command is learned from
+                previous executions rather than given by its specification.
+        """
         self.__lock = threading.Lock()
         self.__state_lock = threading.Lock()
+        # notified whenever a new state is observed
+        self.__state_changed = threading.Condition(self.__state_lock)
         self._bugzoo = client_bugzoo
         self.__container = container
         self.__state = state_initial
@@ -115,6 +229,9 @@ class Sandbox(object):
         self.__recorder = None
         self.__lock_recorder = threading.Lock()
         self.__prefix = prefix
+        self.__cache = cache
+        self.__timeout_model = timeout_model
+        self.__startup_timings = {}  # type: Dict[str, float]
 
     def read_logs(self) -> str:
         raise NotImplementedError
@@ -123,6 +240,22 @@ class Sandbox(object):
     def prefix(self) -> str:
         return self.__prefix
 
+    @property
+    def startup_timings(self) -> Dict[str, float]:
+        """
+        A breakdown of the time taken to start this sandbox. Maps the name of
+        each startup phase to the number of seconds, measured from the start
+        of the launch, at which that phase completed. The 'container' phase,
+        if present, instead gives the time that was taken to provision the
+        container prior to the launch.
+        """
+        return dict(self.__startup_timings)
+
+    def _record_startup_phase(self, phase: str, time_taken: float) -> None:
+        logger.debug("startup phase [%s] completed at %.3f seconds",
+                     phase, time_taken)
+        self.__startup_timings[phase] = time_taken
+
     @property
     def running_time(self) -> float:
         """
@@ -173,6 +306,53 @@ class Sandbox(object):
         """
         return self.__recorder
 
+    @property
+    def cache(self) -> 'Optional[ResultCache]':
+        """
+        The cache of mission results used by this sandbox, if any.
+        """
+        return self.__cache
+
+    @property
+    def timeout_model(self) -> 'Optional[TimeoutModel]':
+        """
+        The model of command timeouts used by this sandbox, if any.
+        """
+        return self.__timeout_model
+
+    def _command_timeout(self,
+                         command: Command,
+                         state: State,
+                         default: float
+                         ) -> float:
+        """
+        Determines the maximum length of time that a given command, executed
+        from a given state, may take to complete. If this sandbox has a
+        timeout model, the learned timeout is used, up to a given default;
+        otherwise, the default is used.
+        """
+        if self.__timeout_model is None:
+            return default
+        timeout = self.__timeout_model.timeout(command,
+                                               state,
+                                               self.environment,
+                                               self.configuration)
+        return min(timeout, default)
+
+    def _mission(self, commands: Sequence[Command]) -> 'Mission':
+        """
+        Describes the mission given by a sequence of commands when executed
+        by this sandbox.
+        """
+        from .mission import Mission
+        from .system import System
+        system = System.get_by_state(self.state_initial.__class__)
+        return Mission(self.configuration,
+                       self.environment,
+                       self.state_initial,
+                       commands,
+                       system)
+
     def start(self) -> None:
         """
         Starts the SITL instance for this sandbox.
@@ -185,6 +365,21 @@ class Sandbox(object):
         """
         raise NotImplementedError
 
+    async def start_async(self) -> None:
+        """
+        Starts the SITL instance for this sandbox from within an asyncio
+        event loop. By default, :meth:`start` is run in the default executor
+        of the loop.
+        """
+        await asyncio.get_event_loop().run_in_executor(None, self.start)
+
+    async def stop_async(self) -> None:
+        """
+        Stops the SITL instance for this sandbox from within an asyncio
+        event loop.
+        """
+        await asyncio.get_event_loop().run_in_executor(None, self.stop)
+
     def issue(self, command: Command) -> None:
         """
         Non-blocking for now.
@@ -211,6 +406,11 @@ class Sandbox(object):
         spec = command.resolve(state_before, env, config)
         postcondition = spec.postcondition
 
+        # the postcondition only needs to be re-evaluated when one of the
+        # variables that it refers to (in the state after) has changed
+        watched = [s[2:] for s in postcondition.symbols
+                   if s.startswith('__') and s[2:] in state_before.variables]
+
         def is_sat() -> bool:
             return postcondition.is_satisfied(command,
                                               state_before,
@@ -224,20 +424,25 @@ class Sandbox(object):
         # is provided
         if timeout is None:
             timeout = command.timeout(state_before, env, config)
+            timeout = self._command_timeout(command, state_before, timeout)
         logger.debug("enforcing timeout: %.3f seconds", timeout)
 
         self.issue(command)
 
-        # FIXME block until completion message or timeout occurs
-        time_elapsed = 0.0
+        # block until the postcondition is satisfied or a timeout occurs
         time_start = timer()
-        while not is_sat() and time_elapsed < timeout:
-            self.observe()
-            state_after = self.state
-            time.sleep(0.1)
+        state_after = self.state
+        passed = is_sat()
+        state_checked = state_after
+        time_elapsed = timer() - time_start
+        while not passed and time_elapsed < timeout:
+            state_after = self.wait_for_state(state_after,
+                                              timeout - time_elapsed)
+            if any(state_after[v] != state_checked[v] for v in watched):
+                passed = is_sat()
+                state_checked = state_after
             time_elapsed = timer() - time_start
 
-        passed = is_sat()
         outcome = CommandOutcome(command,
                                  passed,
                                  state_before,
@@ -246,24 +451,39 @@ class Sandbox(object):
         return outcome
 
     @contextmanager
-    def record(self) -> Iterator[TraceRecorder]:
+    def record(self,
+               columnar: bool = False
+               ) -> Iterator[Union[TraceRecorder, ColumnarTraceRecorder]]:
         """
         Attaches a recorder to this sandbox.
+
+        Parameters:
+            columnar: if True, states are recorded into typed columns rather
+                than being retained as individual state objects.
         """
         with self.__lock_recorder:
-            self.__recorder = TraceRecorder()
+            if columnar:
+                state_class = self.state_initial.__class__
+                self.__recorder = ColumnarTraceRecorder(state_class)
+            else:
+                self.__recorder = TraceRecorder()
             yield self.__recorder
             self.__recorder = None
 
+    @cached_trace
     def run_and_trace(self,
                       commands: Sequence[Command],
-                      collect_coverage: bool = False
+                      collect_coverage: bool = False,
+                      *,
+                      columnar: bool = False
                       ) -> MissionTrace:
         """
         Runs a given sequence of commands and records its execution trace.
+        If columnar recording is enabled, the states of each command trace
+        are provided as a columnar view.
         """
         traces = []  # type: List[CommandTrace]
-        with self.record() as recorder:
+        with self.record(columnar) as recorder:
             for cmd in commands:
                 outcome = self.run_command(cmd)
                 if collect_coverage:
@@ -271,7 +491,24 @@ class Sandbox(object):
                     pass
                 states, messages = recorder.flush()
                 traces.append(CommandTrace(cmd, states))
-        return MissionTrace(tuple(command_traces))
+        return MissionTrace(tuple(traces))
+
+    async def run_and_trace_async(self,
+                                  commands: Sequence[Command],
+                                  collect_coverage: bool = False,
+                                  *,
+                                  columnar: bool = False
+                                  ) -> MissionTrace:
+        """
+        Runs a given sequence of commands from within an asyncio event loop
+        and records its execution trace. By default, :meth:`run_and_trace` is
+        run in the default executor of the loop.
+        """
+        run = functools.partial(self.run_and_trace,
+                                commands,
+                                collect_coverage,
+                                columnar=columnar)
+        return await asyncio.get_event_loop().run_in_executor(None, run)
 
     def run(self, commands: Sequence[Command]) -> 'MissionOutcome':
         """
@@ -293,6 +530,28 @@ class Sandbox(object):
             time_elapsed = timer() - time_start
             return MissionOutcome(passed, outcomes, time_elapsed)
 
+    def wait_for_state(self,
+                       state: State,
+                       timeout: Optional[float] = None
+                       ) -> State:
+        """
+        Blocks until a state other than a given state has been observed, or
+        until a timeout occurs.
+
+        Parameters:
+            state: the last state that was seen by the caller.
+            timeout: the maximum number of seconds to wait, or None if there
+                is no time limit.
+
+        Returns:
+            the last observed state of the system under test, which will be
+            identical to the given state if the timeout was reached.
+        """
+        with self.__state_changed:
+            self.__state_changed.wait_for(lambda: self.__state is not state,
+                                          timeout)
+            return self.__state
+
     def observe(self) -> None:
         """
         Triggers an observation of the current state of the system under test.
@@ -304,11 +563,13 @@ class Sandbox(object):
         state_new = state_class(**values)
         with self.__state_lock:
             self.__state = state_new
+            self.__state_changed.notify_all()
 
     def update(self, message: Message) -> None:
         with self.__state_lock:
             state = self.__state.evolve(message, self.running_time)
             self.__state = state
+            self.__state_changed.notify_all()
             if self.__recorder:
                 self.__recorder.record_state(state)
                 self.__recorder.record_message(message)
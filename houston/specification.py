@@ -1,12 +1,14 @@
 __all__ = ['Specification', 'Expression', 'Idle']
 
 from typing import List, Dict, Any, Tuple, Type, \
-    Optional, Callable, Union
+    Optional, Callable, Union, Sequence, FrozenSet, Iterator
 import logging
 import random
 import math
+import threading
 
 import attr
+import numpy as np
 import sexpdata
 import z3
 
@@ -14,6 +16,8 @@ from . import exceptions
 from .configuration import Configuration
 from .state import State
 from .environment import Environment
+from .columnar import StateColumns
+from .evaluator import CompiledExpression
 
 logger = logging.getLogger(__name__)  # type: logging.Logger
 logger.setLevel(logging.DEBUG)
@@ -22,17 +26,111 @@ Timeout = \
     Callable[['Command', State, Environment, Configuration], float]
 
 
+class _CachedQuery(object):
+    """
+    Holds the Z3 context, declarations and noise-tolerant form of an
+    expression for a particular command type and state class, allowing them
+    to be reused across checks. Only the concrete values of each check are
+    bound, via substitution, before the formula is simplified; a solver is
+    only used when the formula contains free variables after substitution.
+
+    Z3 contexts are not thread safe, so each check is performed under lock.
+    """
+    def __init__(self,
+                 expression: 'Expression',
+                 command: 'Command',
+                 state: State
+                 ) -> None:
+        self.__lock = threading.Lock()
+        self.__ctx = ctx = z3.Context()
+        self.__decls = expression.get_declarations(ctx, command, state)
+        expr = expression.get_expression(self.__decls, state)
+        self.__expr = z3.And(*expr, ctx)
+
+    @staticmethod
+    def _to_value(decl: z3.ExprRef, val: Any) -> z3.ExprRef:
+        """
+        Creates a Z3 constant for a given value of a declared variable.
+        """
+        ctx = decl.ctx
+        if z3.is_string(decl):
+            return z3.StringVal(val, ctx=ctx)
+        if z3.is_bool(decl):
+            return z3.BoolVal(val, ctx=ctx)
+        if z3.is_int(decl):
+            return z3.IntVal(val, ctx=ctx)
+        return z3.RealVal(val, ctx=ctx)
+
+    def _bindings(self,
+                  prefix: str,
+                  state_or_command: Union[State, 'Command']
+                  ) -> List[Tuple[z3.ExprRef, z3.ExprRef]]:
+        bindings = []
+        for param_or_variable in state_or_command:
+            name = param_or_variable.name
+            decl = self.__decls['{}{}'.format(prefix, name)]
+            val = state_or_command[name]
+            bindings.append((decl, self._to_value(decl, val)))
+        return bindings
+
+    def check(self,
+              command: Optional['Command'],
+              state_before: State,
+              state_after: Optional[State]
+              ) -> bool:
+        """
+        Determines whether the expression is satisfiable once the values of
+        the given command and states have been bound.
+        """
+        with self.__lock:
+            bindings = self._bindings('_', state_before)
+            if command is not None:
+                bindings += self._bindings('$', command)
+            if state_after is not None:
+                bindings += self._bindings('__', state_after)
+            expr = z3.substitute(self.__expr, *bindings)
+            expr = z3.simplify(expr)
+            if z3.is_true(expr):
+                return True
+            if z3.is_false(expr):
+                return False
+            logger.debug("checking non-ground expression: %s", expr)
+            solver = z3.SolverFor("QF_NRA", ctx=self.__ctx)
+            solver.add(expr)
+            return solver.check() == z3.sat
+
+
 class Expression(object):
     def __init__(self, s_expression: str) -> None:
         if not Expression.is_valid(s_expression):
             raise exceptions.InvalidExpression
 
         self.__expression = s_expression
+        self.__lock = threading.Lock()
+        self.__queries = \
+            {}  # type: Dict[Tuple[Type[Command], Type[State]], _CachedQuery]
+        self.__compiled = \
+            {}  # type: Dict[Tuple[Type[Command], Type[State]], Optional[CompiledExpression]]  # noqa: pycodestyle
 
     @property
     def expression(self) -> str:
         return self.__expression
 
+    @property
+    def symbols(self) -> FrozenSet[str]:
+        """
+        The names of the symbols (e.g., _altitude, __mode, $arm) that are
+        used within this expression.
+        """
+        def collect(tree: Any) -> Iterator[str]:
+            if isinstance(tree, list):
+                for child in tree[1:]:
+                    yield from collect(child)
+            elif isinstance(tree, sexpdata.Symbol):
+                yield tree.value()
+        tree = sexpdata.loads(self.__expression, true=None, nil=None)
+        return frozenset(collect(tree))
+
     @staticmethod
     def is_valid(string: str) -> bool:
         """
@@ -58,18 +156,107 @@ class Expression(object):
         arguments, configuration and environment).
         """
         logger.debug("Checking for command: %s", command.name)  # FIXME
-        ctx = z3.Context()
-        solver = z3.SolverFor("QF_NRA", ctx=ctx)
-        smt, decls = self._prepare_query(ctx,
-                                         command,
-                                         state_before,
-                                         state_after)
-        expr = self.get_expression(decls, state_before)
-        smt.extend(expr)
-        logger.info("SMT: {}".format(smt))
-        solver.add(smt)
-        logger.debug("Z3 result: {}".format(str(solver.check())))
-        return solver.check() == z3.sat
+        compiled = self._compiled(command, state_before)
+        if compiled and compiled.is_ground(command, state_after):
+            return compiled(command, state_before, state_after)
+        query = self._query(command, state_before)
+        return query.check(command, state_before, state_after)
+
+    def _query(self, command: 'Command', state: State) -> _CachedQuery:
+        """
+        Returns the cached query for this expression that is used by a given
+        type of command and state.
+        """
+        key = (command.__class__, state.__class__)
+        try:
+            return self.__queries[key]
+        except KeyError:
+            pass
+        with self.__lock:
+            if key not in self.__queries:
+                logger.debug("building query for expression [%s]: %s",
+                             self.expression, key)
+                self.__queries[key] = _CachedQuery(self, command, state)
+            return self.__queries[key]
+
+    def satisfied_mask(self,
+                       command: 'Command',
+                       state_before: State,
+                       states_after: Union[StateColumns, Sequence[State]],
+                       environment: Environment,
+                       config: Configuration
+                       ) -> np.ndarray:
+        """
+        Determines, for each of a sequence of states after the execution of
+        a given command (e.g., the states recorded in a command trace),
+        whether that state satisfies this specification. Whenever possible,
+        the expression is evaluated over all states at once using NumPy.
+
+        Parameters:
+            command: the command that was executed.
+            state_before: the state immediately prior to the execution of the
+                command.
+            states_after: the states observed after the command was issued,
+                given either as columns or as a sequence of states.
+            environment: the environment in which the command was executed.
+            config: the configuration of the system.
+
+        Returns:
+            a boolean array that indicates which of the given states satisfy
+            this expression.
+        """
+        compiled = self._compiled(command, state_before)
+        if compiled is None:
+            sat = [self.is_satisfied(command, state_before, s,
+                                     environment, config)
+                   for s in states_after]
+            return np.array(sat, dtype=bool)
+        if not isinstance(states_after, StateColumns):
+            states_after = StateColumns.from_states(state_before.__class__,
+                                                    states_after)
+        return compiled.evaluate_columns(command, state_before, states_after)
+
+    def first_satisfied(self,
+                        command: 'Command',
+                        state_before: State,
+                        states_after: Union[StateColumns, Sequence[State]],
+                        environment: Environment,
+                        config: Configuration
+                        ) -> Optional[int]:
+        """
+        Returns the index of the first of a sequence of states after the
+        execution of a given command that satisfies this expression, or None
+        if no such state exists. See :meth:`satisfied_mask`.
+        """
+        mask = self.satisfied_mask(command, state_before, states_after,
+                                   environment, config)
+        indices = np.flatnonzero(mask)
+        return int(indices[0]) if indices.size else None
+
+    def _compiled(self,
+                  command: 'Command',
+                  state: State
+                  ) -> Optional[CompiledExpression]:
+        """
+        Returns the compiled form of this expression for a given type of
+        command and state, or None if the expression cannot be compiled and
+        must be checked using Z3.
+        """
+        key = (command.__class__, state.__class__)
+        try:
+            return self.__compiled[key]
+        except KeyError:
+            pass
+        try:
+            compiled = CompiledExpression(self.expression,
+                                          command.__class__,
+                                          state.__class__)
+        except exceptions.UnsupportedExpression as e:
+            logger.debug("falling back to Z3 for expression [%s]: %s",
+                         self.expression, e)
+            compiled = None
+        self.__compiled[key] = compiled
+        return compiled
 
     def _prepare_query(self,
                        ctx: z3.Context,
@@ -218,13 +405,12 @@ class Expression(object):
         Returns:
             True if satisfiable, false if not.
         """
-        ctx = z3.Context()
-        s = z3.SolverFor("QF_NRA", ctx=ctx)
-        decls = self.get_declarations(ctx, command, state)
-        smt = Expression.values_to_smt('_', state, decls)
-        smt.extend(self.get_expression(decls, state))
-        s.add(smt)
-        return s.check() == z3.sat
+        # the parameters of the command are left free
+        compiled = self._compiled(command, state)
+        if compiled and compiled.is_ground(None, None):
+            return compiled(None, state, None)
+        query = self._query(command, state)
+        return query.check(None, state, None)
 
     def get_expression(self,
                        decls: Dict[str, Any],
@@ -240,6 +426,9 @@ class Expression(object):
             ctx = list(decls.values())[0].ctx
         s_expr = '(assert {})'.format(self.expression)
         expr = z3.parse_smt2_string(s_expr, decls=decls, ctx=ctx)
+        # recent versions of Z3 return a vector of assertions
+        if isinstance(expr, z3.AstVector):
+            expr = expr[0] if len(expr) == 1 else z3.And(*expr)
         logger.debug('generated (non-noisy) expression: %s', expr)
         variables = {}
         logger.debug('computing variable noise')
@@ -344,6 +533,25 @@ class Specification(object):
         """
         return self.__timeout(command, state, environment, config)
 
+    def first_satisfied(self,
+                        command: 'Command',
+                        state_before: State,
+                        states_after: Union[StateColumns, Sequence[State]],
+                        environment: Environment,
+                        config: Configuration
+                        ) -> Optional[int]:
+        """
+        Returns the index of the first of a sequence of states, recorded
+        after the execution of a given command, at which the postcondition
+        of this specification is satisfied, or None if the postcondition is
+        never satisfied.
+        """
+        return self.postcondition.first_satisfied(command,
+                                                  state_before,
+                                                  states_after,
+                                                  environment,
+                                                  config)
+
     def get_constraint(self,
                        ctx: z3.Context,
                        command: 'Command',
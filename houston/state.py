@@ -58,13 +58,6 @@ class Variable(object):
         """
         return self.__noise
 
-    @property
-    def _field(self) -> str:
-        """
-        The name of the field used to store the value of this variable.
-        """
-        return "__{}".format(self.__name)
-
     @property
     def name(self) -> str:
         return self.__name
@@ -146,11 +139,16 @@ class StateMeta(type):
         ns['variables'] = variables
         logger.debug("stored variables in variables property")
 
+        # the values of each state are stored in a fixed-layout tuple, in
+        # which each variable is located at the position of its definition
+        ns['_positions'] = {name: i for (i, name) in enumerate(variables)}
+        if '__slots__' not in ns:
+            ns['__slots__'] = ()
+
         logger.debug("constructing properties")
-        for name, variable in variables.items():
-            field = variable._field
-            getter = lambda self, f=field: getattr(self, f)
-            ns[variable.name] = property(getter)
+        for name, position in ns['_positions'].items():
+            getter = lambda self, i=position: self._State__values[i]
+            ns[name] = property(getter)
         logger.debug("constructed properties")
 
         return super().__new__(mcl, cls_name, bases, ns)
@@ -161,6 +159,12 @@ class State(object, metaclass=StateMeta):
     Describes the state of the system at a given moment in time, in terms of
     its internal and external variables.
     """
+    __slots__ = ('__time_offset', '__values')
+
+    # the names of the messages that may affect the state, or None if any
+    # message may affect the state
+    message_names = None  # type: Optional[FrozenSet[str]]
+
     @classmethod
     def from_file(cls: Type['State'], fn: str) -> 'State':
         """
@@ -194,18 +198,15 @@ class State(object, metaclass=StateMeta):
                              len(args))
             raise TypeError(msg)
 
-        # set values for each variable
-        for name, v in variables.items():
-            try:
-                val = kwargs[name]
-            except KeyError:
-                msg = "missing keyword argument [{}] to constructor [{}]"
-                msg = msg.format(name, cls_name)
-                raise TypeError(msg)
-
-            # TODO perform run-time type checking?
+        # store the value of each variable in order of definition
+        try:
+            self.__values = tuple([kwargs[name] for name in variables])
+        except KeyError as err:
+            msg = "missing keyword argument [{}] to constructor [{}]"
+            msg = msg.format(err.args[0], cls_name)
+            raise TypeError(msg)
 
-            setattr(self, v._field, val)
+        # TODO perform run-time type checking?
 
         # did we pass any unexpected keyword arguments?
         if len(kwargs) > len(variables) + 1:
@@ -224,12 +225,9 @@ class State(object, metaclass=StateMeta):
     def equiv(self, other: 'State') -> bool:
         if type(self) != type(other):
             msg = "illegal comparison of states: [{}] vs. [{}]"
-            msg = msg.format(self.__class__.__name__, state.__class__.__name__)
+            msg = msg.format(self.__class__.__name__, other.__class__.__name__)
             raise exceptions.HoustonException(msg)
-        for n, v in self.__class__.variables.items():
-            if self.__dict__[v._field] != other.__dict__[v._field]:
-                return False
-        return True
+        return self.__values == other.__values
 
     def exact(self, other: 'State') -> bool:
         return self.equiv(other) and self.time_offset == other.time_offset
@@ -237,24 +235,21 @@ class State(object, metaclass=StateMeta):
     __eq__ = exact
 
     def __hash__(self) -> int:
-        all_vars = (self.time_offset,)
-        all_vars += tuple(self[v] for v in self.__class__.variables)
-        return hash(all_vars)
+        return hash((self.__time_offset,) + self.__values)
 
     def __getitem__(self, name: str) -> Any:
         try:
-            var = self.__class__.variables[name]
-        except StopIteration:
+            position = self.__class__._positions[name]
+        except KeyError:
             msg = "no variable [{}] in state [{}]"
-            msg.format(name, self.__class__.__name__)
+            msg = msg.format(name, self.__class__.__name__)
             raise KeyError(msg)
-        return getattr(self, var._field)
+        return self.__values[position]
 
     def to_dict(self) -> Dict[str, Any]:
         fields = {}  # type: Dict[str, Any]
         fields['time_offset'] = self.__time_offset
-        for name, var in self.__class__.variables.items():
-            fields[name] = getattr(self, var._field)
+        fields.update(zip(self.__class__.variables, self.__values))
         return fields
 
     def __repr__(self) -> str:
@@ -127,3 +127,17 @@ class System(object, metaclass=SystemMeta):
             KeyError: if no system type is registered under the given name.
         """
         return _NAME_TO_SYSTEM_TYPE[name]
+
+    @staticmethod
+    def get_by_state(state_class: Type[State]) -> 'Type[System]':
+        """
+        Attempts to find the type definition for the system that uses a given
+        class of state.
+
+        Raises:
+            KeyError: if no system type uses the given class of state.
+        """
+        for system in _NAME_TO_SYSTEM_TYPE.values():
+            if system.state is state_class:
+                return system
+        raise KeyError(state_class.__name__)
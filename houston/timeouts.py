@@ -0,0 +1,265 @@
+"""
+Provides a model of the time taken by commands to complete their execution,
+learned from historical traces, that can be used in place of the
+conservative timeouts given by command specifications.
+
+For each type of command and each of its specifications, the model records
+the duration of each observed execution as a fraction of the timeout given
+by that specification. Since specifications do not account for the speedup
+of the simulation, durations are first scaled by the speedup of the
+configuration under which they were observed, so that executions at
+different speedups are comparable. The timeout for a new execution is
+obtained by scaling the specification's timeout by a given quantile of those
+fractions (plus a safety margin), divided by the speedup of the execution.
+Learned timeouts are never longer than those given by the specification,
+and the specification's timeout is used until enough executions have been
+observed.
+"""
+__all__ = ['TimeoutModel']
+
+from typing import Any, Dict, Optional, Tuple, Type
+import json
+import logging
+import threading
+
+import numpy as np
+
+from .command import Command
+from .configuration import Configuration
+from .environment import Environment
+from .state import State
+from .trace import MissionTrace
+
+logger = logging.getLogger(__name__)  # type: logging.Logger
+logger.setLevel(logging.DEBUG)
+
+
+def _speedup(config: Configuration) -> float:
+    """
+    Returns the speedup of the simulation under a given configuration, or 1
+    if the configuration does not specify a speedup.
+    """
+    try:
+        speedup = float(config.speedup)
+    except AttributeError:
+        return 1.0
+    return speedup if speedup > 0.0 else 1.0
+
+
+class TimeoutModel(object):
+    """
+    A model of command timeouts for a given system, learned from the
+    durations of recorded command executions.
+    """
+    def __init__(self,
+                 system: 'Type[System]',
+                 *,
+                 quantile: float = 0.99,
+                 margin: float = 1.5,
+                 min_samples: int = 10
+                 ) -> None:
+        """
+        Parameters:
+            system: the system whose commands are modelled.
+            quantile: the quantile of observed durations at which timeouts
+                should be set.
+            margin: the factor by which learned timeouts are scaled to allow
+                for variance that has not yet been observed.
+            min_samples: the minimum number of executions of a command under
+                a given specification that must be observed before a timeout
+                is learned for that command and specification.
+        """
+        assert 0.0 < quantile <= 1.0
+        assert margin >= 1.0
+        assert min_samples > 0
+        self.__system = system
+        self.__quantile = quantile
+        self.__margin = margin
+        self.__min_samples = min_samples
+        self.__lock = threading.Lock()
+        # maps each (command, specification) to its observed durations,
+        # given as a fraction of the specification's timeout
+        self.__samples = {}  # type: Dict[Tuple[str, str], List[float]]
+        # caches the learned fraction for each (command, specification)
+        self.__fractions = {}  # type: Dict[Tuple[str, str], float]
+
+    @property
+    def system(self) -> 'Type[System]':
+        return self.__system
+
+    @property
+    def quantile(self) -> float:
+        return self.__quantile
+
+    @property
+    def margin(self) -> float:
+        return self.__margin
+
+    @property
+    def min_samples(self) -> int:
+        return self.__min_samples
+
+    def num_samples(self, command_name: str, spec_name: str) -> int:
+        """
+        Returns the number of executions of a given type of command under a
+        given specification that have been observed by this model.
+        """
+        with self.__lock:
+            return len(self.__samples.get((command_name, spec_name), []))
+
+    def observe(self,
+                command: Command,
+                state: State,
+                environment: Environment,
+                config: Configuration,
+                duration: float
+                ) -> None:
+        """
+        Records the time taken by a given command to complete its execution.
+
+        Parameters:
+            command: the command that was executed.
+            state: the state of the system prior to the execution of the
+                command.
+            environment: the environment in which the command was executed.
+            config: the configuration of the system under test.
+            duration: the number of (wall-clock) seconds that the command
+                took to complete its execution.
+        """
+        spec = command.resolve(state, environment, config)
+        budget = spec.timeout(command, state, environment, config)
+        if budget <= 0.0:
+            return
+        key = (command.__class__.name, spec.name)
+        fraction = duration * _speedup(config) / budget
+        with self.__lock:
+            self.__samples.setdefault(key, []).append(fraction)
+            self.__fractions.pop(key, None)
+
+    def observe_trace(self,
+                      mission: 'Mission',
+                      trace: MissionTrace
+                      ) -> None:
+        """
+        Records the duration of each command within the trace of a given
+        mission. Each command is assumed to start with the last state that
+        was recorded for the preceding command (or the initial state of the
+        mission), and to finish with its own last recorded state. Commands
+        for which no states were recorded are ignored.
+        """
+        env = mission.environment
+        config = mission.configuration
+        state_before = mission.initial_state
+        time_start = None  # type: Optional[float]
+        for cmd_trace in trace.commands:
+            states = cmd_trace.states
+            if len(states) == 0:
+                continue
+            state_after = states[len(states) - 1]
+            if time_start is None:
+                time_start = states[0].time_offset
+            duration = state_after.time_offset - time_start
+            self.observe(cmd_trace.command, state_before, env, config,
+                         duration)
+            state_before = state_after
+            time_start = state_after.time_offset
+
+    def observe_outcome(self,
+                        mission: 'Mission',
+                        outcome: 'MissionOutcome'
+                        ) -> None:
+        """
+        Records the duration of each command that was successfully executed
+        as part of a given mission outcome.
+        """
+        for cmd_outcome in outcome.outcomes:
+            if not cmd_outcome.successful:
+                continue
+            self.observe(cmd_outcome.command,
+                         cmd_outcome.start_state,
+                         mission.environment,
+                         mission.configuration,
+                         cmd_outcome.time_elapsed)
+
+    def _fraction(self, key: Tuple[str, str]) -> Optional[float]:
+        """
+        Returns the learned fraction of the specification's timeout for a
+        given command and specification, or None if too few executions have
+        been observed.
+        """
+        with self.__lock:
+            if key in self.__fractions:
+                return self.__fractions[key]
+            samples = self.__samples.get(key, [])
+            if len(samples) < self.__min_samples:
+                return None
+            fraction = float(np.percentile(samples, self.__quantile * 100.0))
+            fraction *= self.__margin
+            self.__fractions[key] = fraction
+            return fraction
+
+    def timeout(self,
+                command: Command,
+                state: State,
+                environment: Environment,
+                config: Configuration
+                ) -> float:
+        """
+        Computes the maximum length of time (in seconds) that a given command
+        should take to complete its execution.
+
+        Parameters:
+            command: the command.
+            state: the state of the system prior to the execution of the
+                command.
+            environment: the state of the environment prior to the execution
+                of the command.
+            config: the configuration of the system under test.
+        """
+        spec = command.resolve(state, environment, config)
+        budget = spec.timeout(command, state, environment, config)
+        fraction = self._fraction((command.__class__.name, spec.name))
+        if fraction is None:
+            return budget
+        fraction /= _speedup(config)
+        if fraction >= 1.0:
+            return budget
+        return budget * fraction
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self.__lock:
+            samples = [{'command': cmd, 'spec': spec, 'fractions': list(s)}
+                       for ((cmd, spec), s) in sorted(self.__samples.items())]
+        return {'system': self.__system.name,
+                'quantile': self.__quantile,
+                'margin': self.__margin,
+                'min_samples': self.__min_samples,
+                'samples': samples}
+
+    @staticmethod
+    def from_dict(dkt: Dict[str, Any]) -> 'TimeoutModel':
+        from .system import System
+        system = System.get_by_name(dkt['system'])
+        model = TimeoutModel(system,
+                             quantile=dkt['quantile'],
+                             margin=dkt['margin'],
+                             min_samples=dkt['min_samples'])
+        for entry in dkt['samples']:
+            key = (entry['command'], entry['spec'])
+            model.__samples[key] = list(entry['fractions'])
+        return model
+
+    def save(self, filename: str) -> None:
+        """
+        Writes this model to a given JSON file.
+        """
+        with open(filename, 'w') as f:
+            json.dump(self.to_dict(), f)
+
+    @staticmethod
+    def load(filename: str) -> 'TimeoutModel':
+        """
+        Reads a model from a given JSON file.
+        """
+        with open(filename, 'r') as f:
+            return TimeoutModel.from_dict(json.load(f))
@@ -1,6 +1,7 @@
-__all__ = ['MissionTrace', 'CommandTrace', 'TraceRecorder']
+__all__ = ['MissionTrace', 'CommandTrace', 'TraceRecorder',
+           'ColumnarTraceRecorder']
 
-from typing import Tuple, Iterator, Dict, Any, Optional, Type
+from typing import Tuple, Iterator, Dict, Any, Optional, Type, Union, List
 import attr
 import json
 import threading
@@ -10,6 +11,8 @@ from bugzoo.core.fileline import FileLineSet
 from .command import Command
 from .state import State
 from .connection import Message
+from .columnar import ColumnBuffer, StateColumns, dtype_for
+from .coverage import CoverageBitmap
 
 
 class TraceRecorder(object):
@@ -35,12 +38,69 @@ class TraceRecorder(object):
         return (states, messages)
 
 
+class ColumnarTraceRecorder(object):
+    """
+    Records states by appending the value of each of their variables to a
+    growable, typed column, rather than by retaining the states themselves.
+    String variables (e.g., mode) are dictionary-encoded. Each flush returns
+    a zero-copy view of the states recorded since the previous flush.
+    """
+    def __init__(self,
+                 state_class: Type[State],
+                 capacity: int = 1024
+                 ) -> None:
+        self.__lock = threading.Lock()
+        self.__state_class = state_class
+        self.__messages = []  # type: List[Message]
+        self.__time_offset = ColumnBuffer(dtype_for(float), capacity)
+        self.__columns = {}  # type: Dict[str, ColumnBuffer]
+        self.__codes = {}  # type: Dict[str, Dict[str, int]]
+        for name, variable in state_class.variables.items():
+            dtype = dtype_for(variable.typ)
+            self.__columns[name] = ColumnBuffer(dtype, capacity)
+            if variable.typ is str:
+                self.__codes[name] = {}
+        self.__start = 0
+
+    def record_message(self, message: Message) -> None:
+        with self.__lock:
+            self.__messages.append(message)
+
+    def record_state(self, state: State) -> None:
+        codes = self.__codes
+        with self.__lock:
+            self.__time_offset.append(state.time_offset)
+            for name, column in self.__columns.items():
+                value = state[name]
+                if name in codes:
+                    value = codes[name].setdefault(value, len(codes[name]))
+                column.append(value)
+
+    def flush(self) -> Tuple[StateColumns, Tuple[Message, ...]]:
+        with self.__lock:
+            start = self.__start
+            stop = len(self.__time_offset)
+            time_offset = self.__time_offset.view(start, stop)
+            columns = {n: c.view(start, stop)
+                       for (n, c) in self.__columns.items()}
+            categories = {n: list(c) for (n, c) in self.__codes.items()}
+            messages = tuple(self.__messages)
+            self.__start = stop
+            self.__messages = []
+        states = StateColumns(self.__state_class,
+                              time_offset,
+                              columns,
+                              categories)
+        return (states, messages)
+
+
 @attr.s  # (frozen=True)
 class CommandTrace(object):
     command = attr.ib(type=Command)
-    states = attr.ib(type=Tuple[State, ...])
+    states = attr.ib(type=Union[Tuple[State, ...], StateColumns])
     # messages = attr.ib(type=Tuple[Message, ...])
-    coverage = attr.ib(type=Optional[FileLineSet], default=None)
+    coverage = attr.ib(type=Optional[Union[FileLineSet, CoverageBitmap]],
+                       default=None)
 
     # TODO coverage
     # TODO messages
@@ -64,7 +124,9 @@ class CommandTrace(object):
             cmd['coverage'] = self.coverage.to_dict()
         return cmd
 
-    def add_coverage(self, coverage: FileLineSet) -> None:
+    def add_coverage(self,
+                     coverage: Union[FileLineSet, CoverageBitmap]
+                     ) -> None:
         self.coverage = coverage
 
 
@@ -76,11 +138,39 @@ class MissionTrace(object):
     def from_file(filename: str,
                   system: 'Type[System]'
                   ) -> 'MissionTrace':
+        """
+        Reads a mission trace from a given file. The format of the file
+        (JSON or binary) is detected automatically.
+        """
+        from .tracefile import is_trace_file, read_traces
+        if is_trace_file(filename):
+            _, traces = read_traces(filename, system)
+            return traces[0]
         with open(filename, 'r') as f:
             jsn = json.load(f)
         return MissionTrace.from_dict(jsn, system)
 
-    def to_file(self, filename: str) -> None:
+    def to_file(self,
+                filename: str,
+                system: 'Optional[Type[System]]' = None,
+                *,
+                compress: bool = False
+                ) -> None:
+        """
+        Writes this trace to a given file. If a system is provided, the
+        trace is written using the binary columnar trace format, whose
+        schema is derived from the state class of that system; otherwise,
+        it is written as JSON.
+
+        Parameters:
+            filename: the name of the file.
+            system: the system that produced this trace.
+            compress: if True, the columns of a binary trace are compressed.
+        """
+        if system is not None:
+            from .tracefile import write_traces
+            write_traces(filename, [self], system, compress=compress)
+            return
         with open(filename, 'w') as f:
             json.dump(self.to_dict(), f)
 
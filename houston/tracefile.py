@@ -0,0 +1,643 @@
+"""
+Provides a compact, binary, columnar file format for mission traces.
+
+A trace file consists of a fixed magic string, followed by the length of a
+JSON header, the header itself, and a data section. The header describes
+the schema of the states within the file (derived from the state class of
+the system), any metadata attached to the file (e.g., the mission), and,
+for each command trace within each mission trace, the command, its coverage
+and the location of each of its column blocks within the data section. Each
+column block holds the raw little-endian values of a single variable for a
+single command, and may optionally be compressed using zlib.
+
+If the header describes a line universe, the coverage of each command is
+stored within the data section as a compressed bitmap over that universe,
+given as the difference from the coverage of the preceding command, rather
+than as a JSON list of lines.
+"""
+__all__ = ['is_trace_file', 'write_traces', 'read_traces', 'dump_traces',
+           'load_traces', 'open_traces', 'convert_json_traces',
+           'TraceReader', 'LazyMissionTrace', 'LazyCommandTrace']
+
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, \
+    Type, Union
+import json
+import mmap
+import struct
+import zlib
+
+import numpy as np
+from bugzoo.core.fileline import FileLineSet
+
+from .columnar import StateColumns, dtype_for
+from .coverage import CoverageBitmap, LineUniverse, decode_deltas, \
+    encode_deltas
+from .command import Command
+from .exceptions import InvalidTraceFile
+from .state import State
+from .trace import CommandTrace, MissionTrace
+
+MAGIC = b'\x89HTRACE\n'
+VERSION = 1
+
+# the alignment (in bytes) of each column block within the data section
+_ALIGNMENT = 8
+
+_TYPE_TO_NAME = {float: 'float', int: 'int', bool: 'bool', str: 'str'}
+
+
+def schema_for(state_class: Type[State]) -> List[Tuple[str, str]]:
+    """
+    Returns the schema (i.e., the name and type of each variable) used to
+    describe states of a given class.
+    """
+    return [(name, _TYPE_TO_NAME[v.typ])
+            for (name, v) in state_class.variables.items()]
+
+
+def is_trace_file(filename: str) -> bool:
+    """
+    Determines whether a given file uses the binary trace format.
+    """
+    with open(filename, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def _encode_command(trace: CommandTrace,
+                    state_class: Type[State],
+                    compress: bool,
+                    blocks: List[bytes],
+                    offset: int,
+                    delta: Optional[bytes] = None
+                    ) -> Tuple[Dict[str, Any], int]:
+    states = trace.states
+    if not isinstance(states, StateColumns):
+        states = StateColumns.from_states(state_class, states)
+
+    columns = {}  # type: Dict[str, Tuple[int, int]]
+    names = ['time_offset'] + list(state_class.variables)
+    for name in names:
+        column = states.column(name)
+        if name == 'time_offset':
+            dtype = dtype_for(float)
+        else:
+            dtype = dtype_for(state_class.variables[name].typ)
+        data = np.ascontiguousarray(column, dtype=dtype.newbyteorder('<'))
+        data = data.tobytes()
+        if compress:
+            data = zlib.compress(data)
+        padding = -len(data) % _ALIGNMENT
+        blocks.append(data + b'\x00' * padding)
+        columns[name] = (offset, len(data))
+        offset += len(data) + padding
+
+    categories = {n: list(states.categories(n))
+                  for (n, v) in state_class.variables.items()
+                  if v.typ is str}
+    entry = {'command': trace.command.to_dict(),
+             'size': len(states),
+             'categories': categories,
+             'columns': columns}
+    if delta is not None:
+        padding = -len(delta) % _ALIGNMENT
+        blocks.append(delta + b'\x00' * padding)
+        entry['coverage_delta'] = (offset, len(delta))
+        offset += len(delta) + padding
+    elif trace.coverage:
+        entry['coverage'] = trace.coverage.to_dict()
+    return entry, offset
+
+
+def _find_universe(traces: Sequence[MissionTrace]) -> Optional[LineUniverse]:
+    """
+    Returns the universe of the first coverage bitmap within a sequence of
+    traces, or None if none of their coverage is given as a bitmap.
+    """
+    for trace in traces:
+        for command_trace in trace.commands:
+            if isinstance(command_trace.coverage, CoverageBitmap):
+                return command_trace.coverage.universe
+    return None
+
+
+def _coverage_deltas(trace: MissionTrace,
+                     universe: LineUniverse
+                     ) -> List[Optional[bytes]]:
+    bitmaps = []  # type: List[Optional[CoverageBitmap]]
+    for command_trace in trace.commands:
+        coverage = command_trace.coverage
+        if coverage is None:
+            bitmaps.append(None)
+        elif isinstance(coverage, CoverageBitmap) and \
+                coverage.universe == universe:
+            bitmaps.append(coverage)
+        else:
+            bitmap = CoverageBitmap.from_filelines(universe, coverage)
+            if len(bitmap) < len(coverage):
+                m = "coverage of command {} contains lines outside of the universe"  # noqa: pycodestyle
+                raise ValueError(m.format(len(bitmaps)))
+            bitmaps.append(bitmap)
+    return encode_deltas(bitmaps)
+
+
+def write_traces(filename: str,
+                 traces: Sequence[MissionTrace],
+                 system: 'Type[System]',
+                 metadata: Optional[Dict[str, Any]] = None,
+                 compress: bool = False,
+                 universe: Optional[LineUniverse] = None
+                 ) -> None:
+    """
+    Writes a sequence of mission traces to a given file using the binary
+    trace format.
+
+    Parameters:
+        filename: the name of the file to which the traces should be written.
+        traces: the mission traces that should be written to the file.
+        system: the system that produced the traces.
+        metadata: optional JSON-ready data that should be stored alongside
+            the traces (e.g., a description of the mission).
+        compress: if True, each column block is compressed using zlib.
+        universe: the line universe over which coverage should be stored
+            as bitmaps. If None, the universe of any coverage bitmaps within
+            the traces is used; if there are none, coverage is stored as
+            JSON.
+
+    Raises:
+        ValueError: if the coverage of any command contains lines that lie
+            outside of the universe.
+    """
+    with open(filename, 'wb') as f:
+        f.write(dump_traces(traces, system, metadata, compress, universe))
+
+
+def dump_traces(traces: Sequence[MissionTrace],
+                system: 'Type[System]',
+                metadata: Optional[Dict[str, Any]] = None,
+                compress: bool = False,
+                universe: Optional[LineUniverse] = None
+                ) -> bytes:
+    """
+    Encodes a sequence of mission traces using the binary trace format.
+    See :func:`write_traces`.
+    """
+    state_class = system.state
+    if universe is None:
+        universe = _find_universe(traces)
+    blocks = []  # type: List[bytes]
+    offset = 0
+    jsn_traces = []  # type: List[Dict[str, Any]]
+    for trace in traces:
+        jsn_commands = []  # type: List[Dict[str, Any]]
+        if universe is not None:
+            deltas = _coverage_deltas(trace, universe)
+        else:
+            deltas = [None] * len(trace.commands)
+        for command_trace, delta in zip(trace.commands, deltas):
+            entry, offset = _encode_command(command_trace,
+                                            state_class,
+                                            compress,
+                                            blocks,
+                                            offset,
+                                            delta)
+            jsn_commands.append(entry)
+        jsn_traces.append({'commands': jsn_commands})
+
+    header = {'version': VERSION,
+              'system': system.name,
+              'schema': schema_for(state_class),
+              'compression': 'zlib' if compress else None,
+              'metadata': metadata or {},
+              'traces': jsn_traces}
+    if universe is not None:
+        header['universe'] = universe.to_dict()
+    header_bytes = json.dumps(header).encode('utf-8')
+    prefix_size = len(MAGIC) + 4 + len(header_bytes)
+    padding = -prefix_size % _ALIGNMENT
+
+    parts = [MAGIC,
+             struct.pack('<I', len(header_bytes)),
+             header_bytes,
+             b'\x00' * padding]
+    return b''.join(parts + blocks)
+
+
+def read_header(buff: Any) -> Tuple[Dict[str, Any], int]:
+    """
+    Reads the header of a trace file from a given buffer.
+
+    Returns:
+        a tuple of the form (header, start), where start gives the position
+        of the data section within the buffer.
+
+    Raises:
+        InvalidTraceFile: if the buffer does not contain a trace file.
+    """
+    if bytes(buff[:len(MAGIC)]) != MAGIC:
+        raise InvalidTraceFile("missing magic string.")
+    pos = len(MAGIC)
+    size_header, = struct.unpack('<I', bytes(buff[pos:pos + 4]))
+    pos += 4
+    header = json.loads(bytes(buff[pos:pos + size_header]).decode('utf-8'))
+    if header.get('version') != VERSION:
+        msg = "unsupported version: {}".format(header.get('version'))
+        raise InvalidTraceFile(msg)
+    pos += size_header
+    pos += -pos % _ALIGNMENT
+    return header, pos
+
+
+def check_schema(header: Dict[str, Any], state_class: Type[State]) -> None:
+    """
+    Ensures that the schema of a trace file is compatible with a given state
+    class.
+
+    Raises:
+        InvalidTraceFile: if the schema is incompatible.
+    """
+    expected = [list(v) for v in schema_for(state_class)]
+    actual = [list(v) for v in header['schema']]
+    if expected != actual:
+        msg = "schema does not match state class [{}]"
+        msg = msg.format(state_class.__name__)
+        raise InvalidTraceFile(msg)
+
+
+def decode_column(buff: Any,
+                  start: int,
+                  entry: Dict[str, Any],
+                  name: str,
+                  typ: Type,
+                  compressed: bool
+                  ) -> np.ndarray:
+    """
+    Decodes the column block for a given variable of a command trace. If
+    the block is uncompressed, the returned array is a view of the buffer.
+    """
+    offset, size = entry['columns'][name]
+    dtype = dtype_for(typ).newbyteorder('<')
+    if compressed:
+        data = zlib.decompress(buff[start + offset:start + offset + size])
+        return np.frombuffer(data, dtype=dtype, count=entry['size'])
+    return np.frombuffer(buff,
+                         dtype=dtype,
+                         count=entry['size'],
+                         offset=start + offset)
+
+
+def decode_command(buff: Any,
+                   start: int,
+                   entry: Dict[str, Any],
+                   state_class: Type[State],
+                   compressed: bool,
+                   coverage: Optional[CoverageBitmap] = None
+                   ) -> CommandTrace:
+    """
+    Decodes a command trace from its header entry and column blocks. If the
+    coverage of the command is stored as a bitmap, it must be decoded by the
+    caller and provided.
+    """
+    time_offset = decode_column(buff, start, entry, 'time_offset', float,
+                                compressed)
+    columns = {name: decode_column(buff, start, entry, name, v.typ,
+                                   compressed)
+               for (name, v) in state_class.variables.items()}
+    states = StateColumns(state_class,
+                          time_offset,
+                          columns,
+                          entry['categories'])
+    command = Command.from_dict(entry['command'])
+    if 'coverage' in entry:
+        coverage = FileLineSet.from_dict(entry['coverage'])
+    return CommandTrace(command, states, coverage)
+
+
+def read_coverage_delta(buff: Any,
+                        start: int,
+                        entry: Dict[str, Any]
+                        ) -> Optional[bytes]:
+    """
+    Reads the encoded coverage delta of a command trace, if it has one.
+    """
+    if 'coverage_delta' not in entry:
+        return None
+    offset, size = entry['coverage_delta']
+    return bytes(buff[start + offset:start + offset + size])
+
+
+def read_traces(filename: str,
+                system: 'Type[System]'
+                ) -> Tuple[Dict[str, Any], List[MissionTrace]]:
+    """
+    Reads the contents of a binary trace file.
+
+    Returns:
+        a tuple of the form (metadata, traces).
+
+    Raises:
+        InvalidTraceFile: if the file is not a valid trace file for the
+            given system.
+    """
+    with open(filename, 'rb') as f:
+        buff = f.read()
+    return load_traces(buff, system)
+
+
+def load_traces(buff: bytes,
+                system: 'Type[System]'
+                ) -> Tuple[Dict[str, Any], List[MissionTrace]]:
+    """
+    Decodes mission traces that were encoded using the binary trace format.
+    See :func:`read_traces`.
+    """
+    header, start = read_header(buff)
+    state_class = system.state
+    check_schema(header, state_class)
+    compressed = header['compression'] == 'zlib'
+    universe = None  # type: Optional[LineUniverse]
+    if 'universe' in header:
+        universe = LineUniverse.from_dict(header['universe'])
+
+    traces = []  # type: List[MissionTrace]
+    for jsn_trace in header['traces']:
+        entries = jsn_trace['commands']
+        if universe is not None:
+            deltas = [read_coverage_delta(buff, start, e) for e in entries]
+            coverage = decode_deltas(universe, deltas)
+        else:
+            coverage = [None] * len(entries)
+        commands = tuple(decode_command(buff, start, e, state_class,
+                                        compressed, c)
+                         for e, c in zip(entries, coverage))
+        traces.append(MissionTrace(commands))
+    return header['metadata'], traces
+
+
+class LazyCommandTrace(object):
+    """
+    Provides lazy access to a command trace stored within a trace file.
+    The command, coverage and states of the trace are only decoded when
+    they are first accessed.
+    """
+    def __init__(self,
+                 reader: 'TraceReader',
+                 entry: Dict[str, Any],
+                 previous: 'Optional[LazyCommandTrace]' = None
+                 ) -> None:
+        self.__reader = reader
+        self.__entry = entry
+        self.__previous = previous
+        self.__command = None  # type: Optional[Command]
+        self.__states = None  # type: Optional[StateColumns]
+        self.__bitmap = None  # type: Optional[CoverageBitmap]
+
+    @property
+    def size(self) -> int:
+        """
+        The number of states within this trace.
+        """
+        return self.__entry['size']
+
+    @property
+    def command(self) -> Command:
+        if self.__command is None:
+            self.__command = Command.from_dict(self.__entry['command'])
+        return self.__command
+
+    @property
+    def coverage(self) -> Optional[Union[FileLineSet, CoverageBitmap]]:
+        if 'coverage_delta' in self.__entry:
+            return self._bitmap()
+        if 'coverage' not in self.__entry:
+            return None
+        return FileLineSet.from_dict(self.__entry['coverage'])
+
+    def _bitmap(self) -> CoverageBitmap:
+        """
+        Decodes the coverage bitmap of this trace by applying its delta to
+        the coverage of the closest preceding trace that has coverage.
+        """
+        if self.__bitmap is None:
+            bitmap = self.__reader._decode_coverage_delta(self.__entry)
+            previous = self.__previous
+            while previous is not None and not previous.has_coverage_delta:
+                previous = previous.__previous
+            if previous is not None:
+                bitmap = bitmap ^ previous._bitmap()
+            self.__bitmap = bitmap
+        return self.__bitmap
+
+    @property
+    def has_coverage_delta(self) -> bool:
+        return 'coverage_delta' in self.__entry
+
+    @property
+    def states(self) -> StateColumns:
+        if self.__states is None:
+            self.__states = self.__reader._decode_states(self.__entry)
+        return self.__states
+
+    def column(self, name: str) -> np.ndarray:
+        """
+        Returns the raw column of values for a given variable without
+        decoding the remaining columns of this trace.
+        """
+        if self.__states is not None:
+            return self.__states.column(name)
+        return self.__reader._decode_column(self.__entry, name)
+
+    def last_state(self) -> Optional[State]:
+        """
+        Returns the last state within this trace, or None if the trace is
+        empty. Only the final row of each column is decoded.
+        """
+        if self.size == 0:
+            return None
+        if self.__states is not None:
+            return self.__states[-1]
+        return self.__reader._decode_row(self.__entry, self.size - 1)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return CommandTrace(self.command, self.states, self.coverage).to_dict()
+
+
+class LazyMissionTrace(object):
+    """
+    Provides lazy access to a mission trace stored within a trace file.
+    """
+    def __init__(self, commands: Sequence[LazyCommandTrace]) -> None:
+        self.__commands = tuple(commands)
+
+    @property
+    def commands(self) -> Tuple[LazyCommandTrace, ...]:
+        return self.__commands
+
+    def __iter__(self) -> Iterator[LazyCommandTrace]:
+        yield from self.__commands
+
+    def last_states(self) -> Tuple[Optional[State], ...]:
+        """
+        Returns the last state of each command trace, or None for those
+        command traces that are empty.
+        """
+        return tuple(c.last_state() for c in self.__commands)
+
+    def column(self, index: int, name: str) -> np.ndarray:
+        """
+        Returns the raw column for a given variable of the i-th command.
+        """
+        return self.__commands[index].column(name)
+
+    def materialize(self) -> MissionTrace:
+        """
+        Fully decodes this trace.
+        """
+        commands = tuple(CommandTrace(c.command, c.states, c.coverage)
+                         for c in self.__commands)
+        return MissionTrace(commands)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'commands': [c.to_dict() for c in self.__commands]}
+
+
+class TraceReader(object):
+    """
+    Provides lazy, memory-mapped access to the contents of a binary trace
+    file. Only the header of the file is parsed upon construction;
+    uncompressed columns are exposed as views of the mapped file.
+    """
+    def __init__(self, filename: str, system: 'Type[System]') -> None:
+        with open(filename, 'rb') as f:
+            self.__buff = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header, self.__start = read_header(self.__buff)
+        self.__state_class = system.state
+        check_schema(header, self.__state_class)
+        self.__compressed = header['compression'] == 'zlib'
+        self.__metadata = header['metadata']
+        self.__universe = None  # type: Optional[LineUniverse]
+        if 'universe' in header:
+            self.__universe = LineUniverse.from_dict(header['universe'])
+        traces = []  # type: List[LazyMissionTrace]
+        for jsn_trace in header['traces']:
+            commands = []  # type: List[LazyCommandTrace]
+            previous = None  # type: Optional[LazyCommandTrace]
+            for entry in jsn_trace['commands']:
+                previous = LazyCommandTrace(self, entry, previous)
+                commands.append(previous)
+            traces.append(LazyMissionTrace(commands))
+        self.__traces = tuple(traces)
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        return self.__metadata
+
+    @property
+    def traces(self) -> Tuple[LazyMissionTrace, ...]:
+        return self.__traces
+
+    @property
+    def universe(self) -> Optional[LineUniverse]:
+        """
+        The line universe over which coverage is stored within this file, if
+        any.
+        """
+        return self.__universe
+
+    def close(self) -> None:
+        """
+        Unmaps the trace file. The traces of this reader must not be accessed
+        once it has been closed. Any arrays of states that were decoded as
+        views of the file remain valid, and keep the file mapped until they
+        are released.
+        """
+        try:
+            self.__buff.close()
+        except BufferError:
+            # the map is released along with the last array that views it
+            pass
+
+    def __enter__(self) -> 'TraceReader':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def _decode_coverage_delta(self, entry: Dict[str, Any]) -> CoverageBitmap:
+        data = read_coverage_delta(self.__buff, self.__start, entry)
+        return CoverageBitmap.from_bytes(self.__universe, data)
+
+    def _decode_column(self, entry: Dict[str, Any], name: str) -> np.ndarray:
+        if name == 'time_offset':
+            typ = float
+        else:
+            typ = self.__state_class.variables[name].typ
+        return decode_column(self.__buff, self.__start, entry, name, typ,
+                             self.__compressed)
+
+    def _decode_states(self, entry: Dict[str, Any]) -> StateColumns:
+        return decode_command(self.__buff,
+                              self.__start,
+                              entry,
+                              self.__state_class,
+                              self.__compressed).states
+
+    def _decode_row(self, entry: Dict[str, Any], index: int) -> State:
+        if self.__compressed:
+            return self._decode_states(entry)[index]
+        names = ['time_offset'] + list(self.__state_class.variables)
+        columns = {}  # type: Dict[str, np.ndarray]
+        for name in names:
+            if name == 'time_offset':
+                typ = float
+            else:
+                typ = self.__state_class.variables[name].typ
+            offset, _ = entry['columns'][name]
+            dtype = dtype_for(typ).newbyteorder('<')
+            offset += self.__start + index * dtype.itemsize
+            columns[name] = np.frombuffer(self.__buff, dtype=dtype,
+                                          count=1, offset=offset)
+        time_offset = columns.pop('time_offset')
+        row = StateColumns(self.__state_class,
+                           time_offset,
+                           columns,
+                           entry['categories'])
+        return row[0]
+
+
+def open_traces(filename: str, system: 'Type[System]') -> TraceReader:
+    """
+    Lazily opens a binary trace file via a memory map. The returned reader
+    should be closed once its traces are no longer needed, and may be used
+    as a context manager.
+
+    Raises:
+        InvalidTraceFile: if the file is not a valid trace file for the
+            given system.
+    """
+    return TraceReader(filename, system)
+
+
+def convert_json_traces(fn_json: str,
+                        fn_binary: str,
+                        system: 'Type[System]',
+                        compress: bool = False,
+                        universe: Optional[LineUniverse] = None
+                        ) -> None:
+    """
+    Converts a JSON trace file into the binary trace format. Both the
+    output of MissionTrace.to_file, which describes a single trace, and
+    files of the form {'mission': ..., 'traces': [...]}, produced by the
+    experiment scripts, are supported; in the latter case, the mission is
+    preserved as metadata. If a line universe is given, coverage is stored
+    as bitmaps over that universe.
+    """
+    with open(fn_json, 'r') as f:
+        jsn = json.load(f)
+    if 'traces' in jsn:
+        metadata = {k: v for (k, v) in jsn.items() if k != 'traces'}
+        jsn_traces = jsn['traces']
+    else:
+        metadata = {}
+        jsn_traces = [jsn]
+    traces = [MissionTrace.from_dict(t, system) for t in jsn_traces]
+    write_traces(fn_binary, traces, system, metadata, compress, universe)
@@ -0,0 +1,135 @@
+import asyncio
+
+import dronekit
+from pymavlink import mavutil
+from pymavlink.mavutil import mavlink
+
+from houston.ardu.aio import AsyncMAVLinkConnection
+
+MODES = mavutil.mode_mapping_byname(mavlink.MAV_TYPE_QUADROTOR)
+
+
+class FakeVehicle(object):
+    """
+    Simulates the MAVLink interface of a copter over a TCP stream.
+    """
+    def __init__(self):
+        self.mav = mavlink.MAVLink(None, srcSystem=1, srcComponent=1)
+        self.armed = False
+        self.mode = MODES['STABILIZE']
+        self.mission = []
+        self.mission_size = 0
+        self.streams = []
+        self.num_heartbeats = 0
+        self.writer = None
+
+    def send(self, msg):
+        self.writer.write(msg.pack(self.mav))
+
+    def heartbeat(self):
+        base_mode = mavlink.MAV_MODE_FLAG_CUSTOM_MODE_ENABLED
+        if self.armed:
+            base_mode |= mavlink.MAV_MODE_FLAG_SAFETY_ARMED
+        autopilot = mavlink.MAV_AUTOPILOT_ARDUPILOTMEGA
+        self.send(self.mav.heartbeat_encode(mavlink.MAV_TYPE_QUADROTOR,
+                                            autopilot,
+                                            base_mode,
+                                            self.mode,
+                                            mavlink.MAV_STATE_STANDBY))
+
+    async def serve(self, reader, writer):
+        self.writer = writer
+        self.heartbeat()
+        parser = mavlink.MAVLink(None)
+        while True:
+            data = await reader.read(4096)
+            if not data:
+                break
+            for m in parser.parse_buffer(data) or []:
+                self.handle(m)
+
+    def send_telemetry(self):
+        self.send(self.mav.global_position_int_encode(
+            0, -353632607, 1491652351, 584000, 10000, 150, -20, 0, 0))
+        flags = mavlink.EKF_POS_HORIZ_ABS | mavlink.EKF_PRED_POS_HORIZ_ABS
+        self.send(self.mav.ekf_status_report_encode(flags, 0, 0, 0, 0, 0))
+        self.send(self.mav.gps_raw_int_encode(
+            0, 3, -353632607, 1491652351, 584000, 0, 0, 0, 0, 10))
+
+    def handle(self, m):
+        name = m.get_type()
+        if name == 'HEARTBEAT':
+            self.num_heartbeats += 1
+        elif name == 'REQUEST_DATA_STREAM':
+            # telemetry is only sent once it has been requested
+            self.streams.append((m.target_system, m.target_component,
+                                 m.req_stream_id, m.req_message_rate,
+                                 m.start_stop))
+            self.send_telemetry()
+        elif name == 'COMMAND_LONG' and \
+                m.command == mavlink.MAV_CMD_COMPONENT_ARM_DISARM:
+            self.armed = m.param1 == 1
+            self.heartbeat()
+        elif name == 'SET_MODE':
+            self.mode = m.custom_mode
+            self.heartbeat()
+        elif name == 'MISSION_COUNT':
+            self.mission_size = m.count
+            self.send(self.mav.mission_request_encode(255, 0, 0))
+        elif name == 'MISSION_ITEM':
+            self.mission.append((m.seq, m.command, m.x))
+            if m.seq + 1 < self.mission_size:
+                self.send(self.mav.mission_request_encode(255, 0, m.seq + 1))
+            else:
+                self.send(self.mav.mission_ack_encode(
+                    255, 0, mavlink.MAV_MISSION_ACCEPTED))
+
+
+def test_connection():
+    vehicle = FakeVehicle()
+    received = []
+
+    async def main():
+        server = await asyncio.start_server(vehicle.serve, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        hooks = {'record': lambda m: received.append(m.name)}
+        connection = await AsyncMAVLinkConnection.open('127.0.0.1',
+                                                       port,
+                                                       hooks,
+                                                       timeout=5.0)
+        view = connection.conn
+        assert set(connection.timings) == {'tcp', 'heartbeat'}
+        assert await connection.wait_until(
+            lambda: view.gps_0.fix_type == 3, 5.0)
+        assert view.mode.name == 'STABILIZE'
+        assert not view.armed
+        assert view.is_armable and view.ekf_ok
+        frame = view.location.global_relative_frame
+        assert (frame.lat, frame.lon, frame.alt) == \
+            (-35.3632607, 149.1652351, 10.0)
+        assert view.velocity == [1.5, -0.2, 0.0]
+        assert vehicle.streams == [(1, 1, mavlink.MAV_DATA_STREAM_ALL, 4, 1)]
+        assert vehicle.num_heartbeats >= 1
+
+        assert await connection.arm(5.0)
+        assert await connection.set_mode('GUIDED', 5.0)
+        assert not await connection.set_mode('NOT-A-MODE', 5.0)
+        items = [dronekit.Command(0, 0, 0, 3, 16, 0, 0,
+                                  0.0, 0.0, 0.0, 0.0, float(i), 0.0, 10.0)
+                 for i in range(3)]
+        assert await connection.upload_mission(items, 5.0)
+        assert vehicle.mission == [(i, 16, float(i)) for i in range(3)]
+
+        await connection.wait_closed()
+        assert connection.closed
+        assert not await connection.wait_until(lambda: False, 5.0)
+        server.close()
+        await server.wait_closed()
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(asyncio.wait_for(main(), 30.0))
+    finally:
+        loop.close()
+    assert received[0] == 'HEARTBEAT'
+    assert 'MISSION_ACK' in received
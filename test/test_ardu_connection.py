@@ -0,0 +1,45 @@
+from types import SimpleNamespace
+import threading
+import time
+
+from houston.ardu.connection import MAVLinkConnection
+from houston.connection import Connection
+
+
+class StalledConnection(MAVLinkConnection):
+    """
+    A connection to a fake vehicle, whose subscriptions are read slowly by
+    a thread named 'stalled'.
+    """
+    def __init__(self):
+        Connection.__init__(self, None)
+        self.listeners = {}
+        vehicle = SimpleNamespace(
+            add_message_listener=self.listeners.__setitem__,
+            remove_message_listener=lambda name, _: self.listeners.pop(name))
+        self._MAVLinkConnection__conn = vehicle
+        self._MAVLinkConnection__listeners = {}
+        self._MAVLinkConnection__listeners_lock = threading.Lock()
+
+    @property
+    def subscriptions(self):
+        subscriptions = super().subscriptions
+        if threading.current_thread().name == 'stalled':
+            time.sleep(0.2)
+        return subscriptions
+
+
+def test_concurrent_subscription_changes():
+    connection = StalledConnection()
+    connection.add_hooks({'a': lambda m: None}, ['HEARTBEAT'])
+    assert set(connection.listeners) == {'HEARTBEAT'}
+
+    stalled = threading.Thread(target=connection.remove_hook,
+                               args=('a',),
+                               name='stalled')
+    stalled.start()
+    time.sleep(0.05)
+    connection.add_hooks({'b': lambda m: None}, ['MISSION_ITEM_REACHED'])
+    stalled.join()
+    # the most recent subscriptions must win
+    assert set(connection.listeners) == {'MISSION_ITEM_REACHED'}
@@ -0,0 +1,69 @@
+from houston.ardu.coverage import extract_command, parse_coverage, \
+    parse_universe, universe_command, \
+    snapshot_command, NUM_INSTRUMENTATION_LINES
+
+REPORT = """<?xml version="1.0" ?>
+<coverage>
+  <packages>
+    <package name="libraries">
+      <classes>
+        <class filename="{fn}">
+          <lines>
+            <line number="{a}" hits="0"/>
+            <line number="{b}" hits="3"/>
+            <line number="{c}" hits="1"/>
+          </lines>
+        </class>
+      </classes>
+    </package>
+  </packages>
+</coverage>"""
+
+
+def lines(coverage):
+    return {fn: sorted(ls) for fn, ls in coverage.to_dict().items()}
+
+
+def test_parse_coverage():
+    n = NUM_INSTRUMENTATION_LINES
+    output = '\n'.join([
+        '### houston:sources',
+        './ArduCopter/mode.cpp',
+        './libraries/AP_Math/vector3.cpp',
+        '### houston:coverage command0',
+        REPORT.format(fn='build/ArduCopter/mode.cpp', a=1, b=5, c=7),
+        '### houston:coverage command2',
+        REPORT.format(fn='libraries/AP_Math/vector3.cpp',
+                      a=n + 1, b=n + 2, c=n + 10),
+        '### houston:coverage command3',
+        ''])
+    coverage = parse_coverage(output, ['libraries/AP_Math/vector3.cpp'])
+    assert set(coverage) == {'command0', 'command2', 'command3'}
+    assert lines(coverage['command0']) == {'ArduCopter/mode.cpp': [5, 7]}
+    assert lines(coverage['command2']) == \
+        {'libraries/AP_Math/vector3.cpp': [2, 10]}
+    assert len(coverage['command3']) == 0
+
+
+def test_extract_command():
+    cmd = extract_command(['command0', 'command1'])
+    assert cmd.count('gcovr') == 2
+    assert cmd.index('coverage command0') < cmd.index('coverage command1')
+    assert 'rm -rf /tmp/command1' in cmd
+    assert 'mkdir -p /tmp/command4' in snapshot_command('command4')
+
+
+def test_parse_universe():
+    output = '  12 ./ArduCopter/mode.cpp\n   3 ./libraries/a b.h\n  15 total\n'
+    universe = parse_universe(output)
+    assert universe.files == ('ArduCopter/mode.cpp', 'libraries/a b.h')
+    assert universe.num_lines('ArduCopter/mode.cpp') == 13
+    assert 'wc -l' in universe_command()
+
+
+def test_parse_universe_discounts_instrumentation():
+    num_lines = 12 + NUM_INSTRUMENTATION_LINES
+    output = '  {} ./ArduCopter/mode.cpp\n   3 ./libraries/a.h\n'.format(num_lines)  # noqa: pycodestyle
+    universe = parse_universe(output, ['ArduCopter/mode.cpp'])
+    assert universe.num_lines('ArduCopter/mode.cpp') == 13
+    assert universe.num_lines('libraries/a.h') == 4
@@ -0,0 +1,67 @@
+from types import SimpleNamespace
+import threading
+
+import dronekit
+from pymavlink.mavutil import mavlink
+
+from houston.ardu.aio import VehicleView
+from houston.ardu.connection import MAVLinkMessage
+from houston.ardu.sandbox import Sandbox, _ReadinessMonitor
+from houston.util import Stopwatch
+
+
+def message(name, **fields):
+    return MAVLinkMessage(name, SimpleNamespace(**fields))
+
+
+def test_readiness_monitor():
+    stopwatch = Stopwatch()
+    stopwatch.start()
+    monitor = _ReadinessMonitor(stopwatch)
+    vehicle = SimpleNamespace(gps_0=SimpleNamespace(fix_type=1),
+                              ekf_ok=False,
+                              home_location=object())
+    monitor.seed(vehicle)
+    assert set(monitor.times) == {'home'}
+    assert not monitor.wait(0.01)
+
+    monitor.observe(message('GPS_RAW_INT', fix_type=2))
+    flags = mavlink.EKF_ATTITUDE | mavlink.EKF_VELOCITY_HORIZ | \
+        mavlink.EKF_POS_HORIZ_ABS
+    monitor.observe(message('EKF_STATUS_REPORT',
+                            flags=flags | mavlink.EKF_CONST_POS_MODE))
+    assert set(monitor.times) == {'home'}
+
+    def become_ready():
+        monitor.observe(message('GPS_RAW_INT', fix_type=3))
+        monitor.observe(message('EKF_STATUS_REPORT', flags=flags))
+    threading.Timer(0.01, become_ready).start()
+    assert monitor.wait(5.0)
+    assert set(monitor.times) == {'home', 'fix', 'ekf'}
+    assert monitor.times['home'] <= monitor.times['fix']
+
+
+def test_readiness_monitor_seeds_from_view():
+    stopwatch = Stopwatch()
+    stopwatch.start()
+    monitor = _ReadinessMonitor(stopwatch)
+    view = VehicleView()
+    monitor.seed(view)
+    assert not monitor.times
+
+    view.gps_0 = dronekit.GPSInfo(None, None, 3, None)
+    view.home_location = dronekit.LocationGlobal(-35.36, 149.16, 584.0)
+    monitor.seed(view)
+    assert set(monitor.times) == {'fix', 'home'}
+
+
+def test_reset_container_removes_eeprom():
+    issued = []
+
+    def command(container, cmd, context=None):
+        issued.append((container, cmd, context))
+
+    client = SimpleNamespace(containers=SimpleNamespace(command=command))
+    Sandbox.reset_container(client, 'container')
+    assert issued == [('container', 'rm -f /opt/ardupilot/eeprom.bin',
+                       '/opt/ardupilot')]
@@ -0,0 +1,184 @@
+from contextlib import contextmanager
+from types import SimpleNamespace
+import asyncio
+import os
+
+from houston.ardu.copter import ArduCopter
+from houston.cache import ResultCache
+from houston.sandbox import Sandbox, cached_trace
+
+from .test_runner import build_mission, fake_run
+from .test_tracefile import build_trace
+
+
+def test_cache(tmpdir):
+    directory = str(tmpdir.join('cache'))
+    mission = build_mission(0)
+    outcome = fake_run(mission, None, None)
+    trace = build_trace(0)
+
+    cache = ResultCache(directory)
+    assert cache.get_outcome('snap', mission) is None
+    cache.put_outcome('snap', mission, outcome)
+    cache.put_trace('snap', mission, trace)
+    assert cache.get_outcome('other', mission) is None
+    assert cache.get_outcome('snap', mission, coverage=True) is None
+    assert cache.get_outcome('snap', build_mission(1)) is None
+    assert (cache.hits, cache.misses) == (0, 4)
+
+    # results persist across caches
+    cache = ResultCache(directory)
+    assert len(cache) == 2
+    actual = cache.get_outcome('snap', mission)
+    assert actual.to_dict() == outcome.to_dict()
+    for columnar in (False, True):
+        actual = cache.get_trace('snap', mission, columnar=columnar)
+        assert actual.to_dict() == trace.to_dict()
+    assert isinstance(cache.get_trace('snap', mission).commands[0].states,
+                      tuple)
+
+
+def test_eviction(tmpdir):
+    missions = [build_mission(i) for i in range(4)]
+    outcomes = [fake_run(m, None, None) for m in missions]
+    cache = ResultCache(str(tmpdir))
+    cache.put_outcome('snap', missions[0], outcomes[0])
+    size = cache.size
+
+    cache = ResultCache(str(tmpdir), max_size=int(size * 2.5))
+    cache.put_outcome('snap', missions[1], outcomes[1])
+    # using a result protects it from eviction
+    assert cache.get_outcome('snap', missions[0]) is not None
+    cache.put_outcome('snap', missions[2], outcomes[2])
+    assert len(cache) == 2
+    assert cache.size <= cache.max_size
+    assert cache.get_outcome('snap', missions[1]) is None
+    assert cache.get_outcome('snap', missions[0]) is not None
+
+    # evictions are reflected on disk
+    assert len(ResultCache(str(tmpdir))) == 2
+
+
+def test_eviction_across_processes(tmpdir):
+    missions = [build_mission(i) for i in range(3)]
+    outcomes = [fake_run(m, None, None) for m in missions]
+    cache = ResultCache(str(tmpdir.join('probe')))
+    cache.put_outcome('snap', missions[0], outcomes[0])
+    max_size = int(cache.size * 2.5)
+
+    # each worker of a process pool holds its own copy of the cache
+    first = ResultCache(str(tmpdir.join('cache')), max_size=max_size)
+    second = ResultCache(str(tmpdir.join('cache')), max_size=max_size)
+    first.put_outcome('snap', missions[0], outcomes[0])
+    second.put_outcome('snap', missions[1], outcomes[1])
+    first.put_outcome('snap', missions[2], outcomes[2])
+    assert len(first) == 2
+    cache = ResultCache(str(tmpdir.join('cache')))
+    assert len(cache) == 2
+    assert cache.size <= max_size
+
+
+def test_eviction_only_reindexes_when_full(tmpdir, monkeypatch):
+    missions = [build_mission(i) for i in range(4)]
+    outcomes = [fake_run(m, None, None) for m in missions]
+    probe = ResultCache(str(tmpdir.join('probe')))
+    probe.put_outcome('snap', missions[0], outcomes[0])
+
+    directory = str(tmpdir.join('cache'))
+    first = ResultCache(directory, max_size=int(probe.size * 3.5))
+    second = ResultCache(directory, max_size=int(probe.size * 3.5))
+    loads = []
+    load = ResultCache._load
+    monkeypatch.setattr(ResultCache, '_load',
+                        lambda self: loads.append(self) or load(self))
+    first.put_outcome('snap', missions[0], outcomes[0])
+    second.put_outcome('snap', missions[1], outcomes[1])
+    first.put_outcome('snap', missions[2], outcomes[2])
+    assert not loads
+
+    # the total size is shared by all processes
+    second.put_outcome('snap', missions[3], outcomes[3])
+    assert loads == [second]
+    assert len(second) == 3
+
+    monkeypatch.setattr(ResultCache, '_load', load)
+    cache = ResultCache(directory)
+    assert len(cache) == 3
+    with open(os.path.join(directory, '.size')) as f:
+        assert int(f.read()) == cache.size
+
+
+def test_mission_run_uses_cache(tmpdir, monkeypatch):
+    launched = []
+
+    @contextmanager
+    def for_snapshot(bz, snapshot, state, environment, configuration,
+                     **kwargs):
+        launched.append(snapshot)
+        yield SimpleNamespace(run=lambda cmds: fake_run(mission, bz, None))
+
+    monkeypatch.setattr(ArduCopter.sandbox, 'for_snapshot', for_snapshot)
+    cache = ResultCache(str(tmpdir))
+    mission = build_mission(0)
+    expected = fake_run(mission, None, None).to_dict()
+    for _ in range(2):
+        outcome = mission.run(None, 'snap', cache=cache)
+        assert outcome.to_dict() == expected
+    assert launched == ['snap']
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_sandbox_uses_cache(tmpdir):
+    traced = []
+
+    class TracingSandbox(Sandbox):
+        @cached_trace
+        def run_and_trace(self, commands, collect_coverage=False, *,
+                          columnar=False):
+            traced.append(commands)
+            return build_trace(len(traced))
+
+    mission = build_mission(0)
+    cache = ResultCache(str(tmpdir))
+    container = SimpleNamespace(bug='snap')
+    sandbox = TracingSandbox(None, container, mission.initial_state,
+                             mission.environment, mission.configuration,
+                             cache=cache)
+    first = sandbox.run_and_trace(mission.commands)
+    second = sandbox.run_and_trace(mission.commands)
+    assert len(traced) == 1
+    assert first.to_dict() == second.to_dict()
+    assert cache.get_trace('snap', mission) is not None
+
+    # coverage is part of the identity of a trace
+    sandbox.run_and_trace(mission.commands, collect_coverage=True)
+    assert len(traced) == 2
+
+
+def test_sandbox_uses_cache_async(tmpdir):
+    traced = []
+
+    class TracingSandbox(Sandbox):
+        @cached_trace
+        async def run_and_trace_async(self, commands, collect_coverage=False,
+                                      *, columnar=False):
+            traced.append(commands)
+            return build_trace(len(traced))
+
+    mission = build_mission(0)
+    cache = ResultCache(str(tmpdir))
+    container = SimpleNamespace(bug='snap')
+    sandbox = TracingSandbox(None, container, mission.initial_state,
+                             mission.environment, mission.configuration,
+                             cache=cache)
+    loop = asyncio.new_event_loop()
+    try:
+        first = loop.run_until_complete(
+            sandbox.run_and_trace_async(mission.commands))
+        second = loop.run_until_complete(
+            sandbox.run_and_trace_async(mission.commands))
+    finally:
+        loop.close()
+    assert len(traced) == 1
+    assert first.to_dict() == second.to_dict()
+    assert cache.get_trace('snap', mission) is not None
@@ -1,10 +1,12 @@
 import pytest
 import attr
+from sexpdata import Symbol
 
 from houston.connection import Message
-from houston.command import Command, Parameter
+from houston.command import Command, Parameter, ResolutionCache
+from houston.state import State, var
 from houston.valueRange import DiscreteValueRange
-from houston.specification import Idle
+from houston.specification import Idle, Specification
 from houston.connection import Message
 
 
@@ -84,3 +86,94 @@ def test_to_and_from_dict():
 
     y = Command.from_dict(d_actual)
     assert y.to_dict() == d_actual
+
+
+def test_resolution_cache():
+    class S(State):
+        altitude = var(float, lambda c: 0.0, noise=0.1)
+        mode = var(str, lambda c: 'GUIDED')
+        speed = var(float, lambda c: 0.0)
+
+    low = Specification('low', '(< _altitude 5.0)', 'true')
+    high = Specification('high', '(>= _altitude 5.0)', 'true')
+
+    class Climb(Command):
+        uid = 'test:climb'
+        name = 'climb'
+        parameters = [
+            Parameter('foo', DiscreteValueRange([0, 1]))
+        ]
+        specifications = [low, high]
+
+        def to_message(self):
+            raise NotImplementedError
+
+    cache = ResolutionCache(max_size=2)
+    state = lambda alt, speed=0.0: S(altitude=alt, mode='GUIDED',
+                                     speed=speed, time_offset=0.0)
+    command = Climb(foo=0)
+    assert cache.resolve(command, state(1.0), None, None) is low
+    assert (cache.hits, cache.misses) == (0, 1)
+
+    # variables that are not referenced by preconditions are ignored, and
+    # values within the same noise bucket share an entry
+    assert cache.resolve(command, state(1.05, 3.0), None, None) is low
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cache.resolve(command, state(7.0), None, None) is high
+    assert cache.resolve(Climb(foo=1), state(1.0), None, None) is low
+    assert (cache.hits, cache.misses) == (1, 3)
+    assert len(cache) == 2
+    assert cache.hit_rate == 0.25
+
+    # the least recently used entry was evicted
+    assert cache.resolve(command, state(1.0), None, None) is low
+    assert cache.misses == 4
+
+    hits = Command.resolution_cache.hits
+    assert command.resolve(state(9.0), None, None) is high
+    assert command.timeout(state(9.0), None, None) == 1.0
+    assert Command.resolution_cache.hits == hits + 1
+
+
+def test_resolution_cache_thresholds():
+    class S(State):
+        altitude = var(float, lambda c: 0.0, noise=0.1)
+        speed = var(float, lambda c: 0.0, noise=0.5)
+
+    low = Specification('low', '(< _altitude 5.05)', 'true')
+    level = Specification('level', '(= _speed 2.0)', 'true')
+    fast = Specification('fast', '(> _speed $limit)', 'true')
+    other = Specification('other', 'true', 'true')
+
+    class Move(Command):
+        uid = 'test:move'
+        name = 'move'
+        parameters = [
+            Parameter('limit', DiscreteValueRange([10]))
+        ]
+        specifications = [low, level, fast, other]
+
+        def to_message(self):
+            raise NotImplementedError
+
+    cache = ResolutionCache()
+    state = lambda alt, speed=0.0: S(altitude=alt, speed=speed,
+                                     time_offset=0.0)
+    command = Move(limit=10)
+    variables = dict((n, (w, t)) for (n, w, t) in
+                     cache._relevant_variables(command, state(0.0)))
+    # speed is compared against a parameter, and so cannot be quantized
+    assert variables == {'altitude': (0.1, (5.05,)), 'speed': (None, ())}
+
+    # values within a bucket that straddles a threshold are not conflated
+    assert cache.resolve(command, state(5.01), None, None) is low
+    assert cache.resolve(command, state(5.07), None, None) is other
+    assert cache.resolve(command, state(5.07, 11.0), None, None) is fast
+    assert cache.misses == 3
+    assert cache.resolve(command, state(1.01), None, None) is low
+    assert cache.resolve(command, state(1.03), None, None) is low
+    assert cache.hits == 1
+
+    thresholds = ResolutionCache._thresholds
+    assert thresholds([Symbol('='), 2.0, Symbol('_speed')], '_speed', 0.5) \
+        == [1.5, 2.5]
@@ -0,0 +1,64 @@
+import attr
+
+from houston.connection import Connection, Message
+
+
+@attr.s(frozen=True)
+class M(Message):
+    name = attr.ib(type=str)
+
+
+def test_hook_interest():
+    calls = []
+    connection = Connection({'all': lambda m: calls.append(('all', m.name))})
+    connection.add_hooks({'mission': lambda m: calls.append(('mission',
+                                                             m.name))},
+                         ['MISSION_CURRENT'])
+    connection.receive(M('ATTITUDE'))
+    connection.receive(M('MISSION_CURRENT'))
+    assert calls == [('all', 'ATTITUDE'),
+                     ('all', 'MISSION_CURRENT'),
+                     ('mission', 'MISSION_CURRENT')]
+
+    connection.remove_hook('all')
+    del calls[:]
+    connection.receive(M('ATTITUDE'))
+    connection.receive(M('MISSION_CURRENT'))
+    assert calls == [('mission', 'MISSION_CURRENT')]
+
+
+def test_hooks_may_modify_hooks():
+    calls = []
+    connection = Connection({})
+
+    def once(m):
+        calls.append(m.name)
+        connection.remove_hook('once')
+        connection.add_hooks({'later': lambda m: calls.append('later')})
+
+    connection.add_hooks({'once': once})
+    connection.receive(M('HEARTBEAT'))
+    connection.receive(M('HEARTBEAT'))
+    assert calls == ['HEARTBEAT', 'later']
+
+
+def test_subscriptions():
+    changes = []
+
+    class RecordingConnection(Connection):
+        def _subscriptions_changed(self):
+            changes.append(self.subscriptions)
+
+    connection = RecordingConnection({})
+    assert connection.subscriptions == frozenset()
+    connection.add_hooks({'a': print}, ['ATTITUDE'])
+    connection.add_hooks({'b': print}, ['HEARTBEAT', 'ATTITUDE'])
+    connection.add_hooks({'c': print})
+    connection.remove_hook('c')
+    connection.remove_hook('a')
+    connection.remove_hook('missing')
+    assert changes == [frozenset(['ATTITUDE']),
+                       frozenset(['ATTITUDE', 'HEARTBEAT']),
+                       None,
+                       frozenset(['ATTITUDE', 'HEARTBEAT']),
+                       frozenset(['ATTITUDE', 'HEARTBEAT'])]
@@ -0,0 +1,63 @@
+from types import SimpleNamespace
+
+from houston.ardu.connection import MAVLinkMessage
+from houston.ardu.copter.state import State, DEPENDENCIES
+
+
+def build_connection(alt: float = 0.0, pitch: float = 0.0):
+    loc = SimpleNamespace(lat=-35.3632607, lon=149.1652351, alt=alt)
+    vehicle = SimpleNamespace(
+        home_location=loc,
+        location=SimpleNamespace(global_relative_frame=loc),
+        is_armable=True,
+        armed=False,
+        mode=SimpleNamespace(name='GUIDED'),
+        velocity=[0.0, 0.0, 0.0],
+        attitude=SimpleNamespace(pitch=pitch, yaw=0.0, roll=0.0),
+        heading=0.0,
+        airspeed=0.0,
+        groundspeed=0.0,
+        ekf_ok=True)
+    return SimpleNamespace(conn=vehicle)
+
+
+def build_state(connection) -> State:
+    values = {n: v.read(connection) for (n, v) in State.variables.items()}
+    return State(time_offset=0.0, **values)
+
+
+def test_dependencies():
+    for names in DEPENDENCIES.values():
+        assert names
+        assert names <= set(State.variables)
+
+
+def test_evolve_ignores_irrelevant_messages():
+    state = build_state(build_connection())
+    message = MAVLinkMessage('SYS_STATUS', None)
+    assert state.evolve(message, 1.0, build_connection()) is state
+
+
+def test_evolve_only_refreshes_dependents():
+    state = build_state(build_connection())
+    connection = build_connection(alt=10.0, pitch=0.5)
+
+    message = MAVLinkMessage('ATTITUDE', None)
+    evolved = state.evolve(message, 1.0, connection)
+    assert evolved.pitch == 0.5
+    assert evolved.altitude == 0.0
+    assert evolved.time_offset == 1.0
+
+    message = MAVLinkMessage('GLOBAL_POSITION_INT', None)
+    evolved = evolved.evolve(message, 2.0, connection)
+    assert evolved.altitude == 10.0
+    assert evolved.time_offset == 2.0
+
+
+def test_evolve_refreshes_home_on_mission_item():
+    state = build_state(build_connection())
+    connection = build_connection()
+    connection.conn.home_location = SimpleNamespace(lat=-35.0, lon=149.0)
+    message = MAVLinkMessage('MISSION_ITEM', None)
+    evolved = state.evolve(message, 1.0, connection)
+    assert (evolved.home_latitude, evolved.home_longitude) == (-35.0, 149.0)
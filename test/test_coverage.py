@@ -0,0 +1,111 @@
+import random
+
+import pytest
+from bugzoo.core.fileline import FileLine, FileLineSet
+
+from houston.ardu.copter import ArduCopter
+from houston.coverage import CoverageBitmap, LineUniverse, decode_deltas, \
+    encode_deltas
+from houston.trace import CommandTrace, MissionTrace
+from houston.tracefile import dump_traces, load_traces, write_traces, \
+    open_traces
+
+from .test_tracefile import build_trace
+
+
+def lines(coverage):
+    return {fn: sorted(ls) for fn, ls in coverage.to_dict().items()}
+
+
+def random_coverage(rng, universe, base=frozenset()):
+    lines = set(base)
+    for _ in range(50):
+        fn = rng.choice(universe.files)
+        lines.add(FileLine(fn, rng.randint(1, universe.num_lines(fn))))
+    return FileLineSet.from_iter(lines)
+
+
+def test_bitmap():
+    universe = LineUniverse({'a.cpp': 70, 'b.cpp': 3, 'c.h': 10})
+    assert universe.size == 83
+    assert universe.num_words == 2
+    assert universe == LineUniverse.from_dict(universe.to_dict())
+    x = CoverageBitmap.from_filelines(
+        universe, FileLineSet({'a.cpp': {1, 5, 70}, 'b.cpp': {3},
+                               'd.cpp': {1}}))
+    y = CoverageBitmap.from_filelines(
+        universe, FileLineSet({'a.cpp': {5, 66}, 'c.h': {10}}))
+    assert len(x) == 4
+    assert lines(x) == {'a.cpp': [1, 5, 70], 'b.cpp': [3]}
+    assert lines(x & y) == {'a.cpp': [5]}
+    assert lines(x | y) == \
+        {'a.cpp': [1, 5, 66, 70], 'b.cpp': [3], 'c.h': [10]}
+    assert lines(x - y) == {'a.cpp': [1, 70], 'b.cpp': [3]}
+    assert x.intersects(y)
+    assert not (x - y).intersects(y)
+    assert not CoverageBitmap.empty(universe)
+    assert CoverageBitmap.from_bytes(universe, x.to_bytes()) == x
+
+    other = LineUniverse({'a.cpp': 70})
+    with pytest.raises(ValueError):
+        x & CoverageBitmap.empty(other)
+
+
+def test_deltas():
+    rng = random.Random(0)
+    universe = LineUniverse({'f{}.cpp'.format(i): 500 for i in range(40)})
+    base = random_coverage(rng, universe)
+    coverage = [CoverageBitmap.from_filelines(universe,
+                                              random_coverage(rng,
+                                                              universe,
+                                                              base))
+                for _ in range(4)]
+    coverage.insert(2, None)
+    deltas = encode_deltas(coverage)
+    assert deltas[2] is None
+    assert decode_deltas(universe, deltas) == coverage
+
+
+def test_trace_file_with_bitmaps(tmp_path):
+    rng = random.Random(1)
+    trace = build_trace(0, num_commands=4)
+    universe = LineUniverse({'f{}.cpp'.format(i): 2000 for i in range(50)})
+    base = random_coverage(rng, universe)
+    commands = [CommandTrace(c.command, c.states,
+                             random_coverage(rng, universe, base)
+                             if i != 1 else None)
+                for i, c in enumerate(trace.commands)]
+    trace = MissionTrace(tuple(commands))
+
+    plain = dump_traces([trace], ArduCopter, compress=True)
+    compact = dump_traces([trace], ArduCopter, compress=True,
+                          universe=universe)
+    assert len(compact) < len(plain)
+
+    _, (actual,) = load_traces(compact, ArduCopter)
+    for expected, decoded in zip(trace.commands, actual.commands):
+        if expected.coverage is None:
+            assert decoded.coverage is None
+        else:
+            assert isinstance(decoded.coverage, CoverageBitmap)
+            assert lines(decoded.coverage) == lines(expected.coverage)
+    # bitmaps are stored using their own universe by default
+    assert dump_traces([actual], ArduCopter, compress=True) == compact
+
+    fn = str(tmp_path / 'traces.htrace')
+    write_traces(fn, [trace], ArduCopter, universe=universe)
+    with open_traces(fn, ArduCopter) as reader:
+        assert reader.universe == universe
+        lazy = reader.traces[0]
+        assert lines(lazy.commands[3].coverage) == \
+            lines(trace.commands[3].coverage)
+        assert lazy.to_dict() == actual.to_dict()
+
+
+def test_trace_file_rejects_lines_outside_universe():
+    trace = build_trace(0, num_commands=3)
+    universe = LineUniverse({'foo.cpp': 2})
+    # the coverage of the last command contains foo.cpp:3
+    with pytest.raises(ValueError):
+        dump_traces([trace], ArduCopter, universe=universe)
+    dump_traces([trace], ArduCopter, universe=LineUniverse({'foo.cpp': 3}))
@@ -0,0 +1,58 @@
+from bugzoo.core.fileline import FileLine, FileLineSet
+
+from houston.coverage import CoverageBitmap, LineUniverse
+from houston.coverage_index import CoverageIndex
+from houston.trace import CommandTrace, MissionTrace
+
+from .test_tracefile import build_trace
+
+
+def with_coverage(trace, coverage):
+    commands = tuple(CommandTrace(c.command, c.states, cov)
+                     for (c, cov) in zip(trace.commands, coverage))
+    return MissionTrace(commands)
+
+
+def test_lookup(tmp_path):
+    traces = [
+        ('a.json', [with_coverage(build_trace(0), [
+            FileLineSet({'foo.cpp': {1, 2}}),
+            None,
+            FileLineSet({'bar.cpp': {7}})])]),
+        ('b.json', [with_coverage(build_trace(1), [
+            None,
+            FileLineSet({'foo.cpp': {2, 3}}),
+            None])]),
+        ('c.json', [with_coverage(build_trace(2), [None, None, None])])]
+    index = CoverageIndex.build(traces)
+    assert index.missions == ('a.json', 'b.json', 'c.json')
+    assert len(index) == 5
+
+    assert index.missions_covering(FileLineSet({'foo.cpp': {2}})) == \
+        ['a.json', 'b.json']
+    assert index.missions_covering([FileLine('bar.cpp', 7)]) == ['a.json']
+    assert index.missions_covering(FileLineSet({'foo.cpp': {4},
+                                                'baz.cpp': {1}})) == []
+    assert index.commands_covering(FileLineSet({'foo.cpp': {1, 3},
+                                                'bar.cpp': {7}})) == \
+        {'a.json': [0, 2], 'b.json': [1]}
+
+    fn = str(tmp_path / 'index.npz')
+    index.save(fn)
+    loaded = CoverageIndex.load(fn)
+    assert loaded.missions == index.missions
+    assert loaded.universe == index.universe
+    assert loaded.commands_covering(FileLineSet({'foo.cpp': {2}})) == \
+        {'a.json': [0], 'b.json': [1]}
+
+
+def test_bitmaps_use_trace_universe():
+    universe = LineUniverse({'foo.cpp': 100, 'bar.cpp': 10})
+    bitmap = CoverageBitmap.from_filelines(universe,
+                                           FileLineSet({'foo.cpp': {50}}))
+    trace = with_coverage(build_trace(0), [None, bitmap, None])
+    index = CoverageIndex.build([('a.htrace', [trace])])
+    assert index.universe == universe
+    assert index.missions_covering(FileLineSet({'foo.cpp': {50}})) == \
+        ['a.htrace']
+    assert index.missions_covering(FileLineSet({'bar.cpp': {1}})) == []
@@ -0,0 +1,84 @@
+from types import SimpleNamespace
+import json
+
+from houston.ardu.copter import ArduCopter
+from houston.journal import CampaignJournal, JournalEntry, mission_hash
+from houston.mission import Mission
+from houston.runner import MissionRunnerPool
+
+from .test_runner import build_mission, fake_run
+
+
+def test_journal(tmpdir):
+    fn = str(tmpdir.join('journal.jsonl'))
+    missions = [build_mission(i) for i in range(4)]
+    assert mission_hash(missions[0]) == mission_hash(build_mission(0))
+    assert mission_hash(missions[0]) != mission_hash(missions[1])
+
+    with CampaignJournal(fn) as journal:
+        assert len(journal) == 0
+        outcome = fake_run(missions[0], None, None)
+        journal.record(0, missions[0], outcome, 'traces/0.json')
+        journal.record(2, missions[2])
+    # simulate a crash part-way through writing an entry
+    with open(fn, 'a') as f:
+        f.write('{"index": 3, "ha')
+
+    with CampaignJournal(fn) as journal:
+        assert len(journal) == 2
+        entry = journal.find(0, missions[0])
+        assert entry.trace == 'traces/0.json'
+        assert entry.decode_outcome(ArduCopter).to_dict() == outcome.to_dict()
+        assert journal.find(2, missions[2]).outcome is None
+        # missions are identified by both their index and their contents
+        assert not journal.is_complete(1, missions[0])
+        pending = [i for i, _ in journal.pending(iter(missions))]
+        assert pending == [1, 3]
+        journal.record(3, missions[3])
+
+    with CampaignJournal(fn) as journal:
+        assert len(journal) == 3
+
+
+def test_journal_skips_corrupt_entries(tmpdir):
+    fn = str(tmpdir.join('journal.jsonl'))
+    missions = [build_mission(i) for i in range(3)]
+    with CampaignJournal(fn) as journal:
+        journal.record(0, missions[0])
+    entry = JournalEntry(2, mission_hash(missions[2]))
+    with open(fn, 'a') as f:
+        f.write('{"index": 1, "ha\n')
+        f.write(json.dumps(entry.to_dict()) + '\n')
+
+    # entries that follow a corrupt entry must not be discarded
+    with CampaignJournal(fn) as journal:
+        assert len(journal) == 2
+        assert journal.is_complete(2, missions[2])
+        journal.record(1, missions[1])
+    with CampaignJournal(fn) as journal:
+        assert len(journal) == 3
+
+
+def test_resume_campaign(tmpdir, monkeypatch):
+    monkeypatch.setattr(Mission, 'run', fake_run)
+    fn = str(tmpdir.join('journal.jsonl'))
+    bz = SimpleNamespace(bugs={'snap': SimpleNamespace(name='snap')})
+    missions = [build_mission(i) for i in range(6)]
+    with CampaignJournal(fn) as journal:
+        for i in (0, 1, 4):
+            journal.record(i, missions[i])
+
+    reported = []
+
+    def callback(mission, outcome, coverage):
+        reported.append(missions.index(mission))
+        return 'trace-{}'.format(missions.index(mission))
+
+    with CampaignJournal(fn) as journal:
+        pool = MissionRunnerPool(bz, 'snap', ArduCopter, 2, missions,
+                                 callback, journal=journal)
+        pool.run()
+        assert sorted(reported) == [2, 3, 5]
+        assert len(journal) == 6
+        assert journal.find(3, missions[3]).trace == 'trace-3'
+        assert journal.find(3, missions[3]).outcome['passed']
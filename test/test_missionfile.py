@@ -0,0 +1,128 @@
+from types import SimpleNamespace
+import io
+import json
+import threading
+import time
+
+import pytest
+
+import houston.missionfile
+from houston.ardu.copter import ArduCopter
+from houston.exceptions import InvalidMissionFile
+from houston.mission import Mission
+from houston.missionfile import MissionSource, MissionResultWriter, \
+    iter_results
+from houston.runner import MissionRunnerPool
+
+from .test_runner import build_mission, fake_run
+
+
+@pytest.fixture
+def missions():
+    return [build_mission(i, crash=(i == 2)) for i in range(5)]
+
+
+@pytest.mark.parametrize('json_lines', [True, False])
+@pytest.mark.parametrize('prefetch', [0, 2])
+def test_mission_source(tmpdir, monkeypatch, missions, json_lines, prefetch):
+    # use a tiny chunk size to exercise the incremental parser
+    monkeypatch.setattr(houston.missionfile, '_CHUNK_SIZE', 7)
+    fn = str(tmpdir.join('missions.json'))
+    with open(fn, 'w') as f:
+        if json_lines:
+            for m in missions:
+                f.write(json.dumps(m.to_dict()) + '\n\n')
+        else:
+            f.write('\n  ' + json.dumps([m.to_dict() for m in missions],
+                                        indent=2))
+    with MissionSource(fn, prefetch=prefetch) as source:
+        actual = [m.to_dict() for m in source]
+        assert actual == [m.to_dict() for m in missions]
+        with pytest.raises(StopIteration):
+            next(source)
+
+
+def test_invalid_mission_file(tmpdir, missions):
+    fn = str(tmpdir.join('missions.json'))
+    with open(fn, 'w') as f:
+        f.write(json.dumps([m.to_dict() for m in missions])[:-40])
+    with MissionSource(fn) as source:
+        with pytest.raises(InvalidMissionFile):
+            list(source)
+
+
+def test_syntax_error_stops_parsing(monkeypatch, missions):
+    monkeypatch.setattr(houston.missionfile, '_CHUNK_SIZE', 7)
+    contents = '[{"foo": [1,, 2]}, ' + \
+        json.dumps([m.to_dict() for m in missions])[1:]
+
+    class CountingReader(io.StringIO):
+        num_reads = 0
+
+        def read(self, *args):
+            self.num_reads += 1
+            return super().read(*args)
+
+    f = CountingReader(contents)
+    with pytest.raises(InvalidMissionFile):
+        list(houston.missionfile.iter_mission_dicts(f))
+    # the parser should give up without reading the rest of the file
+    assert f.num_reads < 10
+
+
+def test_close_wakes_blocked_consumer(tmpdir, monkeypatch, missions):
+    released = threading.Event()
+
+    def stalled(f):
+        released.wait()
+        yield missions[0].to_dict()
+
+    monkeypatch.setattr(houston.missionfile, 'iter_mission_dicts', stalled)
+    fn = str(tmpdir.join('missions.jsonl'))
+    open(fn, 'w').close()
+    source = MissionSource(fn, prefetch=2)
+    result = []
+
+    def consume():
+        try:
+            result.append(next(source))
+        except StopIteration as err:
+            result.append(err)
+
+    consumer = threading.Thread(target=consume)
+    consumer.start()
+    time.sleep(0.1)
+    closer = threading.Thread(target=source.close)
+    closer.start()
+    time.sleep(0.1)
+    released.set()
+    closer.join(1.0)
+    consumer.join(1.0)
+    assert not closer.is_alive() and not consumer.is_alive()
+    assert isinstance(result[0], StopIteration)
+
+
+def test_stream_missions_through_pool(tmpdir, monkeypatch):
+    monkeypatch.setattr(Mission, 'run', fake_run)
+    missions = [build_mission(i) for i in range(5)]
+    fn_missions = str(tmpdir.join('missions.jsonl'))
+    fn_results = str(tmpdir.join('results.jsonl'))
+    with open(fn_missions, 'w') as f:
+        for m in missions:
+            f.write(json.dumps(m.to_dict()) + '\n')
+
+    bz = SimpleNamespace(bugs={'snap': SimpleNamespace(name='snap')})
+    with MissionSource(fn_missions, prefetch=1) as source, \
+            MissionResultWriter(fn_results) as writer:
+        pool = MissionRunnerPool(bz, 'snap', ArduCopter, 2, source, writer)
+        pool.run()
+        assert writer.num_written == 5
+        assert writer.num_failed == 0
+
+    results = list(iter_results(fn_results))
+    expected = [m.to_dict() for m in missions]
+    assert sorted(json.dumps(m.to_dict(), sort_keys=True)
+                  for m, _ in results) == \
+        sorted(json.dumps(m, sort_keys=True) for m in expected)
+    for mission, outcome in results:
+        assert outcome.to_dict() == fake_run(mission, None, None).to_dict()
@@ -0,0 +1,164 @@
+from types import SimpleNamespace
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'experiments'))  # noqa: pycodestyle
+from mutant_scheduler import FailedToCreateMutantSnapshot, MutantScheduler, \
+    SnapshotBuilder, shift_diff, translation_units
+
+DIFF = '\n'.join([
+    '--- foo.cpp\t2019-01-01 00:00:00',
+    '+++ foo.cpp\t2019-01-01 00:00:00',
+    '@@ -10,3 +10,3 @@ int main() {',
+    ' a',
+    '-b',
+    '+c',
+    ' d',
+    '--- bar.cpp',
+    '+++ bar.cpp',
+    '@@ -5 +5 @@',
+    '-x',
+    '+y',
+    ''])
+
+
+def test_shift_diff():
+    shifted = shift_diff(DIFF, ['foo.cpp'], 48).split('\n')
+    assert shifted[2] == '@@ -58,3 +58,3 @@ int main() {'
+    assert shifted[9] == '@@ -5 +5 @@'
+    assert [line for line in shifted if not line.startswith('@@')] == \
+        [line for line in DIFF.split('\n') if not line.startswith('@@')]
+    assert shift_diff(DIFF, [], 48) == DIFF
+
+
+def test_translation_units():
+    assert translation_units(DIFF) == ('bar.cpp', 'foo.cpp')
+
+
+class FakeBuilder(object):
+    def __init__(self, failures=()):
+        self.failures = set(failures)
+        self.lock = threading.Lock()
+        self.alive = []
+        self.max_alive = 0
+        self.released = []
+
+    def build(self, diff):
+        time.sleep(0.02)
+        if diff in self.failures:
+            raise FailedToCreateMutantSnapshot(diff)
+        with self.lock:
+            self.alive.append(diff)
+            self.max_alive = max(self.max_alive, len(self.alive))
+        return SimpleNamespace(name=diff)
+
+    def release(self, snapshot):
+        with self.lock:
+            self.alive.remove(snapshot.name)
+            self.released.append(snapshot.name)
+
+
+def test_scheduler():
+    builder = FakeBuilder(failures=['bad'])
+    done = {}
+
+    def evaluate(snapshot, diff, job):
+        # a snapshot must not be released before all of its jobs finish
+        assert diff in builder.alive
+        time.sleep(0.01)
+        if job < 0:
+            raise ValueError
+        done.setdefault(diff, []).append(job)
+        return job * 2
+
+    mutants = [('a', [1, 2, 3]), ('bad', [1]), ('b', []), ('c', [4, -1]),
+               ('d', [5]), ('e', [6, 7])]
+    scheduler = MutantScheduler(builder,
+                                num_builds=2,
+                                num_sandboxes=3,
+                                max_snapshots=2)
+    results = dict(scheduler.run(mutants, evaluate))
+    assert results == {'a': [2, 4, 6], 'bad': None, 'b': [], 'c': [8, None],
+                       'd': [10], 'e': [12, 14]}
+    assert builder.max_alive <= 2
+    assert not builder.alive
+    assert sorted(builder.released) == ['a', 'c', 'd', 'e']
+
+
+def test_scheduler_duplicate_diffs():
+    builder = FakeBuilder()
+    scheduler = MutantScheduler(builder, num_builds=2, num_sandboxes=2)
+    mutants = [('a', [1, 2]), ('a', [3]), ('b', [4])]
+    results = list(scheduler.run(mutants, lambda s, d, j: j))
+    assert sorted(results) == [('a', [1, 2]), ('a', [3]), ('b', [4])]
+    assert sorted(builder.released) == ['a', 'a', 'b']
+
+
+def test_scheduler_releases_snapshots_when_closed():
+    builder = FakeBuilder()
+
+    def evaluate(snapshot, diff, job):
+        time.sleep(0.05 if diff == 'a' else 0.5)
+        return job
+
+    mutants = [('a', [1]), ('b', [2]), ('c', [3]), ('d', [4])]
+    scheduler = MutantScheduler(builder,
+                                num_builds=2,
+                                num_sandboxes=4,
+                                max_snapshots=3)
+    results = scheduler.run(mutants, evaluate)
+    assert next(results) == ('a', [1])
+    results.close()
+    time.sleep(0.1)
+    assert not builder.alive
+    assert sorted(builder.released) == ['a', 'b', 'c']
+
+
+def build_snapshot_builder(max_containers):
+    deleted = []
+
+    class Containers(object):
+        def __delitem__(self, uid):
+            deleted.append(uid)
+
+    bz = SimpleNamespace(containers=Containers())
+    snapshot = SimpleNamespace(instructions_coverage=None)
+    builder = SnapshotBuilder(bz, snapshot, False,
+                              max_containers=max_containers)
+    return builder, deleted
+
+
+def test_builder_eviction():
+    builder, deleted = build_snapshot_builder(2)
+    get = builder._SnapshotBuilder__builder
+    builders = builder._SnapshotBuilder__builders
+
+    a = get(('a.cpp',))
+    a.container = SimpleNamespace(uid='a')
+    b = get(('b.cpp',))
+    b.container = SimpleNamespace(uid='b')
+    assert get(('a.cpp',)) is a
+
+    # the least recently used idle builder is evicted
+    c = get(('c.cpp',))
+    assert len(builders) == 2
+    assert b.retired and not a.retired
+    assert deleted == ['b']
+
+    # busy builders are never evicted
+    with a.lock, c.lock:
+        result = []
+        thread = threading.Thread(target=lambda: result.append(get(('d.cpp',))))  # noqa: pycodestyle
+        thread.start()
+        time.sleep(0.1)
+        assert thread.is_alive()
+        assert len(builders) == 2
+        assert not a.retired and not c.retired
+    thread.join(1.0)
+    assert not thread.is_alive()
+    assert len(builders) == 2
+    assert a.retired
+    assert deleted == ['b', 'a']
+    assert ('d.cpp',) in builders
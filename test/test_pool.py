@@ -0,0 +1,102 @@
+from contextlib import contextmanager
+from types import SimpleNamespace
+import threading
+
+import pytest
+
+from houston.exceptions import HoustonException
+from houston.pool import SandboxPool
+
+
+class FakeContainers(object):
+    def __init__(self):
+        self.provisioned = []
+        self.destroyed = []
+        self.dead = set()
+
+    def provision(self, snapshot):
+        container = SimpleNamespace(uid='c{}'.format(len(self.provisioned)))
+        self.provisioned.append(container.uid)
+        return container
+
+    def is_alive(self, container):
+        return container.uid not in self.dead
+
+    def __delitem__(self, uid):
+        self.destroyed.append(uid)
+
+
+class FakeSandbox(object):
+    resets = []
+
+    def __init__(self, container):
+        self.container = container
+
+    @classmethod
+    @contextmanager
+    def for_container(cls, client, container, state, env, config):
+        yield FakeSandbox(container)
+
+    @classmethod
+    def reset_container(cls, client, container):
+        cls.resets.append(container.uid)
+
+
+def build_pool(size, **kwargs):
+    client = SimpleNamespace(bugs={'snap': SimpleNamespace(name='snap')},
+                             containers=FakeContainers())
+    return client, SandboxPool(client, 'snap', size, **kwargs)
+
+
+def test_reuse():
+    client, pool = build_pool(2)
+    uids = []
+    for _ in range(5):
+        with pool.sandbox(FakeSandbox, None, None, None) as sandbox:
+            uids.append(sandbox.container.uid)
+    assert uids == ['c0'] * 5
+    assert client.containers.provisioned == ['c0']
+    assert FakeSandbox.resets[-5:] == ['c0'] * 5
+
+    pool.warm()
+    assert client.containers.provisioned == ['c0', 'c1']
+    pool.close()
+    assert sorted(client.containers.destroyed) == ['c0', 'c1']
+    with pytest.raises(HoustonException):
+        with pool.sandbox(FakeSandbox, None, None, None):
+            pass
+
+
+def test_eviction():
+    client, pool = build_pool(1, max_uses=3)
+    with pytest.raises(ValueError):
+        with pool.sandbox(FakeSandbox, None, None, None):
+            raise ValueError
+    assert client.containers.destroyed == ['c0']
+
+    for _ in range(3):
+        with pool.sandbox(FakeSandbox, None, None, None) as sandbox:
+            pass
+    assert client.containers.destroyed == ['c0', 'c1']
+
+    with pool.sandbox(FakeSandbox, None, None, None) as sandbox:
+        client.containers.dead.add(sandbox.container.uid)
+    assert client.containers.destroyed == ['c0', 'c1', 'c2']
+    assert client.containers.provisioned == ['c0', 'c1', 'c2']
+
+
+def test_blocks_when_full():
+    client, pool = build_pool(1)
+    acquired = threading.Event()
+
+    def use():
+        with pool.sandbox(FakeSandbox, None, None, None):
+            acquired.set()
+
+    with pool.sandbox(FakeSandbox, None, None, None):
+        thread = threading.Thread(target=use)
+        thread.start()
+        assert not acquired.wait(0.05)
+    thread.join(5.0)
+    assert acquired.is_set()
+    assert client.containers.provisioned == ['c0']
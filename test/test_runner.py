@@ -0,0 +1,152 @@
+import os
+import random
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import houston.runner
+from houston.ardu.copter import ArduCopter
+from houston.command import CommandOutcome
+from houston.environment import Environment
+from houston.mission import Mission, MissionOutcome
+from houston.runner import MissionProcessPool
+from houston.timeouts import TimeoutModel
+
+from .test_tracefile import build_trace
+
+
+def build_mission(seed, crash=False):
+    rng = random.Random(seed)
+    values = {}
+    for name, v in ArduCopter.state.variables.items():
+        if v.typ is bool:
+            values[name] = False
+        elif v.typ is str:
+            values[name] = 'GUIDED'
+        else:
+            values[name] = rng.uniform(-10.0, 10.0)
+    state = ArduCopter.state(time_offset=0.0, **values)
+    config = ArduCopter.configuration(speedup=1,
+                                      min_parachute_alt=10.0,
+                                      constant_timeout_offset=1,
+                                      time_per_metre_travelled=1.0)
+    commands = [ArduCopter.commands['MAV_CMD_NAV_WAYPOINT'].generate(rng)
+                for _ in range(3)]
+    return Mission(config, Environment({'crash': crash}), state, commands,
+                   ArduCopter)
+
+
+def fake_run(self, bz, snapshot, *, pool=None, cache=None,
+             timeout_model=None):
+    if self.environment['crash']:
+        raise Exception("simulated crash")
+    outcomes = [CommandOutcome(c, True, self.initial_state,
+                               self.initial_state, 1.0)
+                for c in self.commands]
+    return MissionOutcome(True, outcomes, 3.0)
+
+
+def test_process_pool(monkeypatch):
+    # worker processes are forked, and so inherit the simulated run
+    monkeypatch.setattr(Mission, 'run', fake_run)
+    bz = SimpleNamespace(bugs={'snap': SimpleNamespace(name='snap')})
+    missions = [build_mission(i, crash=(i == 4)) for i in range(6)]
+    reported = []
+    pool = MissionProcessPool(bz, 'snap', ArduCopter, 3, missions,
+                              lambda m, o, c: reported.append((m, o)))
+    pool.run()
+
+    assert len(reported) == len(missions)
+    assert {id(m) for m, _ in reported} == {id(m) for m in missions}
+    for mission, outcome in reported:
+        if mission.environment['crash']:
+            assert outcome.to_dict()['crashed']
+        else:
+            expected = fake_run(mission, None, None).to_dict()
+            assert outcome.to_dict() == expected
+
+
+def test_outcome_round_trip():
+    mission = build_mission(0)
+    outcome = fake_run(mission, None, None)
+    dkt = outcome.to_dict()
+    assert MissionOutcome.from_dict(dkt, ArduCopter).to_dict() == dkt
+
+
+def dying_run(self, bz, snapshot, *, pool=None, cache=None,
+              timeout_model=None):
+    if self.environment['crash']:
+        os._exit(1)
+    return fake_run(self, bz, snapshot)
+
+
+def test_process_pool_replaces_dead_workers(monkeypatch):
+    monkeypatch.setattr(Mission, 'run', dying_run)
+    bz = SimpleNamespace(bugs={'snap': SimpleNamespace(name='snap')})
+    missions = [build_mission(i, crash=(i in (1, 4))) for i in range(6)]
+    reported = []
+    pool = MissionProcessPool(bz, 'snap', ArduCopter, 2, missions,
+                              lambda m, o, c: reported.append((m, o)))
+    pool.run()
+
+    assert len(reported) == len(missions)
+    assert {id(m) for m, _ in reported} == {id(m) for m in missions}
+    for mission, outcome in reported:
+        crashed = outcome.to_dict().get('crashed', False)
+        assert crashed == mission.environment['crash']
+
+
+def test_process_pool_timeout_model(monkeypatch):
+    def run(self, bz, snapshot, *, pool=None, cache=None,
+            timeout_model=None):
+        if timeout_model is None or timeout_model.margin != 2.0:
+            raise Exception("timeout model was not given to the worker")
+        return fake_run(self, bz, snapshot)
+
+    monkeypatch.setattr(Mission, 'run', run)
+    bz = SimpleNamespace(bugs={'snap': SimpleNamespace(name='snap')})
+    model = TimeoutModel(ArduCopter, margin=2.0)
+    missions = [build_mission(i) for i in range(3)]
+    reported = []
+    pool = MissionProcessPool(bz, 'snap', ArduCopter, 2, missions,
+                              lambda m, o, c: reported.append(o),
+                              timeout_model=model)
+    assert pool.timeout_model is model
+    pool.run()
+    assert len(reported) == 3
+    assert all(o.passed for o in reported)
+
+
+def test_process_pool_collects_coverage(monkeypatch):
+    class FakeSandboxPool(object):
+        def __init__(self, bz, snapshot, size, *, instrument=False):
+            self.instrument = instrument
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            pass
+
+        @contextmanager
+        def sandbox(self, *args, **kwargs):
+            pool = self
+
+            def run_and_trace(commands, collect_coverage=False, *,
+                              columnar=False):
+                assert pool.instrument and collect_coverage
+                return build_trace(len(commands))
+            yield SimpleNamespace(run_and_trace=run_and_trace)
+
+    monkeypatch.setattr(houston.runner, 'SandboxPool', FakeSandboxPool)
+    missions = [build_mission(i) for i in range(2)]
+    reported = []
+    pool = MissionProcessPool(None, 'snap', ArduCopter, 2, missions,
+                              lambda m, t, c: reported.append(t),
+                              with_coverage=True,
+                              trace=True)
+    pool.run()
+    assert len(reported) == 2
+    for trace in reported:
+        coverage = trace.commands[1].coverage
+        assert {(line.filename, line.num) for line in coverage} == \
+            {('foo.cpp', 1), ('foo.cpp', 2)}
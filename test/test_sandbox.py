@@ -0,0 +1,99 @@
+import threading
+import time
+
+import attr
+
+from houston.command import Command, Parameter
+from houston.connection import Message
+from houston.sandbox import Sandbox
+from houston.specification import Specification
+from houston.state import State, var
+from houston.valueRange import ContinuousValueRange
+
+
+@attr.s(frozen=True)
+class M(Message):
+    name = attr.ib(type=str)
+    value = attr.ib(type=float)
+
+
+class S(State):
+    altitude = var(float, lambda s: 0.0, noise=0.1)
+    battery = var(float, lambda s: 100.0)
+
+    def evolve(self, message, time_offset):
+        values = self.to_dict()
+        values[message.name] = message.value
+        values['time_offset'] = time_offset
+        return S(**values)
+
+
+Climb = Specification('climb',
+                      'true',
+                      '(= __altitude $altitude)',
+                      lambda c, s, e, o: 5.0)
+
+
+class GoUp(Command):
+    uid = 'test:sandbox:go-up'
+    name = 'go-up'
+    parameters = [
+        Parameter('altitude', ContinuousValueRange(0.0, 100.0))
+    ]
+    specifications = [Climb]
+
+    def to_message(self):
+        raise NotImplementedError
+
+    def dispatch(self, sandbox, state, environment, configuration):
+        # simulate the vehicle by feeding messages to the sandbox
+        def climb():
+            for i in range(1, 11):
+                time.sleep(0.01)
+                sandbox.update(M('battery', 100.0 - i))
+                sandbox.update(M('altitude', self.altitude * i / 10))
+        threading.Thread(target=climb, daemon=True).start()
+
+
+def build_sandbox():
+    initial = S(altitude=0.0, battery=100.0, time_offset=0.0)
+    return Sandbox(None, None, initial, None, None)
+
+
+def test_run_command_is_event_driven(monkeypatch):
+    checks = []
+    is_satisfied = Climb.postcondition.is_satisfied
+
+    def counting_is_satisfied(command, before, after, env, config):
+        checks.append(after)
+        return is_satisfied(command, before, after, env, config)
+
+    monkeypatch.setattr(Climb.postcondition, 'is_satisfied',
+                        counting_is_satisfied)
+    sandbox = build_sandbox()
+    outcome = sandbox.run_command(GoUp(altitude=10.0))
+    assert outcome.successful
+    assert outcome.end_state.altitude == 10.0
+    # reached without waiting out a polling interval
+    assert outcome.time_elapsed < 1.0
+    # changes to the battery alone do not trigger a re-evaluation
+    altitudes = [s.altitude for s in checks]
+    assert len(altitudes) <= 11
+    assert len(set(altitudes)) == len(altitudes)
+
+
+def test_run_command_timeout():
+    sandbox = build_sandbox()
+    outcome = sandbox.run_command(GoUp(altitude=10.0), timeout=0.05)
+    assert not outcome.successful
+    assert 0.05 <= outcome.time_elapsed < 1.0
+
+
+def test_wait_for_state():
+    sandbox = build_sandbox()
+    state = sandbox.state
+    assert sandbox.wait_for_state(state, 0.01) is state
+    threading.Timer(0.01, sandbox.update, [M('battery', 50.0)]).start()
+    state_new = sandbox.wait_for_state(state, 5.0)
+    assert state_new is not state
+    assert state_new.battery == 50.0
@@ -1,8 +1,16 @@
+import random
+
 import pytest
 import z3
 
-from houston.exceptions import InvalidExpression, UnsupportedVariableType
+from houston.columnar import StateColumns
+from houston.command import Command, Parameter
+from houston.evaluator import CompiledExpression
+from houston.exceptions import InvalidExpression, UnsupportedVariableType, \
+    UnsupportedExpression
 from houston.specification import Specification, Expression
+from houston.state import State, var
+from houston.valueRange import ContinuousValueRange, DiscreteValueRange
 
 import z3
 
@@ -37,3 +45,130 @@ def test_specification():
         assert Specification("s2", "(= a true))", "(= b false)")
         pytest.fail("expected InvalidExpression")
 
+
+def check_with_fresh_solver(expr, command, state_before, state_after=None):
+    ctx = z3.Context()
+    solver = z3.SolverFor("QF_NRA", ctx=ctx)
+    smt, decls = expr._prepare_query(ctx, command, state_before, state_after)
+    smt.extend(expr.get_expression(decls, state_before))
+    solver.add(smt)
+    return solver.check() == z3.sat
+
+
+class S(State):
+    x = var(float, lambda c: 0.0, noise=0.5)
+    y = var(float, lambda c: 0.0, noise=0.1)
+    armed = var(bool, lambda c: False)
+    mode = var(str, lambda c: 'GUIDED')
+
+
+class C(Command):
+    uid = 'test:cached-queries'
+    name = 'cached-queries'
+    parameters = [
+        Parameter('x', ContinuousValueRange(-5.0, 5.0)),
+        Parameter('arm', DiscreteValueRange([True, False]))
+    ]
+    specifications = []
+
+    def to_message(self):
+        raise NotImplementedError
+
+
+def generate_states(rng, command):
+    before, after = [
+        S(x=rng.uniform(-5.0, 5.0),
+          y=rng.uniform(-5.0, 5.0),
+          armed=rng.random() > 0.5,
+          mode=rng.choice(['GUIDED', 'AUTO']),
+          time_offset=0.0) for _ in range(2)]
+    if rng.random() > 0.5:
+        values = after.to_dict()
+        values['x'] = command.x + rng.uniform(-0.6, 0.6)
+        values['y'] = before.y + rng.uniform(-0.8, 0.8)
+        after = S(**values)
+    return before, after
+
+
+def test_cached_queries():
+    pre = Expression(
+        '(and (= _armed $arm) (or (= _mode "GUIDED") (> _x 1.0)))')
+    post = Expression('(and (= __x $x) (= __mode _mode) (= __armed true))')
+
+    rng = random.Random(0)
+    for _ in range(50):
+        command = C.generate(rng)
+        before, after = generate_states(rng, command)
+        query = pre._query(command, before)
+        expected = check_with_fresh_solver(pre, command, before)
+        assert query.check(command, before, None) == expected
+        query = post._query(command, before)
+        expected = check_with_fresh_solver(post, command, before, after)
+        assert query.check(command, before, after) == expected
+
+
+@pytest.mark.parametrize('s_expression', [
+    '(and (= _armed $arm) (or (= _mode "GUIDED") (> _x 1.0)))',
+    '(and (= __x $x) (= __mode _mode) (= __armed true))',
+    '(not (= _mode "AUTO"))',
+    '(=> (= _armed true) (<= (- __x _x) 1.0))',
+    '(ite (< _x 0.3) (= _armed __armed) (= _armed false))',
+    '(= (+ __x __y) (+ $x _y))',
+    '(= (* 2 __y) (- _y (- 0.5)))',
+    '(= (ite (> _x 0) __x __y) $x)',
+    '(>= (* __x __y) (* _x _y))'
+])
+def test_compiled_expression(s_expression):
+    expr = Expression(s_expression)
+    rng = random.Random(1)
+    for _ in range(100):
+        command = C.generate(rng)
+        before, after = generate_states(rng, command)
+        compiled = CompiledExpression(s_expression, C, S)
+        expected = check_with_fresh_solver(expr, command, before, after)
+        assert compiled(command, before, after) == expected
+        assert expr.is_satisfied(command, before, after, None, None) \
+            == expected
+
+
+def test_compiled_expression_is_ground():
+    compiled = CompiledExpression('(= __x $x)', C, S)
+    assert compiled.uses_command and compiled.uses_state_after
+    assert not compiled.is_ground(None, S(x=0.0, y=0.0, armed=False,
+                                          mode='AUTO', time_offset=0.0))
+    compiled = CompiledExpression('(> _x 0.0)', C, S)
+    assert compiled.is_ground(None, None)
+    with pytest.raises(UnsupportedExpression):
+        CompiledExpression('(= __z $x)', C, S)
+    with pytest.raises(UnsupportedExpression):
+        CompiledExpression('(= (^ _x 2) 4.0)', C, S)
+
+
+@pytest.mark.parametrize('s_expression', [
+    '(and (= __x $x) (= __mode _mode) (= __armed true))',
+    '(or (not (= __mode "AUTO")) (< __y 0.0))',
+    '(=> (= __armed true) (<= (- __x _x) 1.0))',
+    '(ite (< __x 0.3) (= _armed __armed) (= __mode "LOITER"))',
+    '(= (ite (> __x 0) __x __y) $x)',
+    '(> _x 0.0)',
+    '(= (^ __x 2) 4.0)'
+])
+def test_satisfied_mask(s_expression):
+    expr = Expression(s_expression)
+    rng = random.Random(2)
+    command = C.generate(rng)
+    before = generate_states(rng, command)[0]
+    states = [generate_states(rng, command)[1] for _ in range(60)]
+    expected = [expr.is_satisfied(command, before, s, None, None)
+                for s in states]
+    columns = StateColumns.from_states(S, states)
+    mask = expr.satisfied_mask(command, before, columns, None, None)
+    assert mask.dtype == bool
+    assert mask.tolist() == expected
+    mask = expr.satisfied_mask(command, before, states, None, None)
+    assert mask.tolist() == expected
+    first = expected.index(True) if True in expected else None
+    assert expr.first_satisfied(command, before, columns, None, None) \
+        == first
+    assert expr.satisfied_mask(command, before, columns[:0],
+                               None, None).tolist() == []
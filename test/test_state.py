@@ -104,3 +104,27 @@ def test_to_and_from_dict():
     d = {'foo': 1, 'bar': 2, 'time_offset': 0.0}
     assert state.to_dict() == d
     assert S.from_dict(d) == state
+
+
+def test_getitem():
+    class S(State):
+        foo = var(int, lambda c: 0)
+        bar = var(int, lambda c: 0)
+
+    state = S(foo=1, bar=2, time_offset=0.0)
+    assert state['foo'] == 1
+    assert state['bar'] == 2
+    with pytest.raises(KeyError):
+        state['baz']
+        pytest.fail("expected KeyError (no variable 'baz')")
+
+
+def test_is_slotted():
+    class S(State):
+        foo = var(int, lambda c: 0)
+
+    state = S(foo=0, time_offset=0.0)
+    assert not hasattr(state, '__dict__')
+    with pytest.raises(AttributeError):
+        state.bar = 10
+        pytest.fail("expected AttributeError (can't add attribute 'bar')")
@@ -0,0 +1,114 @@
+from types import SimpleNamespace
+
+import pytest
+
+from houston.mission import Mission
+from houston.sandbox import Sandbox
+from houston.timeouts import TimeoutModel
+from houston.trace import CommandTrace, MissionTrace
+
+from .test_runner import build_mission, fake_run
+
+
+def fake_trace(mission, fraction):
+    """
+    Builds a trace for a given mission in which each command takes a given
+    fraction of the timeout given by its specification.
+    """
+    env = mission.environment
+    config = mission.configuration
+    time = 0.0
+    state = mission.initial_state
+    traces = []
+    for cmd in mission.commands:
+        time += fraction * cmd.timeout(state, env, config)
+        values = state.to_dict()
+        values['time_offset'] = time
+        state = state.__class__(**values)
+        traces.append(CommandTrace(cmd, (state,)))
+    return MissionTrace(tuple(traces))
+
+
+def test_timeout_model(tmpdir):
+    missions = [build_mission(i) for i in range(8)]
+    system = missions[0].system
+    model = TimeoutModel(system, quantile=0.9, margin=1.5, min_samples=10)
+    mission = missions[0]
+    cmd = mission.commands[0]
+    state = mission.initial_state
+    env, config = mission.environment, mission.configuration
+    budget = cmd.timeout(state, env, config)
+
+    # the specification is used until enough executions are observed
+    model.observe_trace(missions[0], fake_trace(missions[0], 0.1))
+    assert model.timeout(cmd, state, env, config) == budget
+
+    for m in missions[1:]:
+        model.observe_trace(m, fake_trace(m, 0.2))
+    spec = cmd.resolve(state, env, config)
+    assert model.num_samples(cmd.__class__.name, spec.name) == 3 * 8
+    assert model.timeout(cmd, state, env, config) == \
+        pytest.approx(budget * 0.2 * 1.5)
+
+    fn = str(tmpdir.join('timeouts.json'))
+    model.save(fn)
+    loaded = TimeoutModel.load(fn)
+    assert loaded.system is system
+    assert loaded.to_dict() == model.to_dict()
+    assert loaded.timeout(cmd, state, env, config) == \
+        model.timeout(cmd, state, env, config)
+
+
+def test_observe_outcome():
+    mission = build_mission(0)
+    model = TimeoutModel(mission.system, min_samples=1)
+    model.observe_outcome(mission, fake_run(mission, None, None))
+    cmd = mission.commands[0]
+    spec = cmd.resolve(mission.initial_state, mission.environment,
+                       mission.configuration)
+    assert model.num_samples(cmd.__class__.name, spec.name) == 3
+
+
+def test_sandbox_uses_timeout_model():
+    mission = build_mission(0)
+    cmd = mission.commands[0]
+    state = mission.initial_state
+    model = TimeoutModel(mission.system, margin=1.0, min_samples=1)
+    model.observe_trace(mission, fake_trace(mission, 0.5))
+    container = SimpleNamespace(bug='snap')
+    args = (None, container, state, mission.environment,
+            mission.configuration)
+    budget = cmd.timeout(state, mission.environment, mission.configuration)
+
+    sandbox = Sandbox(*args)
+    assert sandbox._command_timeout(cmd, state, 300.0) == 300.0
+    sandbox = Sandbox(*args, timeout_model=model)
+    assert sandbox._command_timeout(cmd, state, 300.0) == \
+        pytest.approx(min(300.0, budget * 0.5))
+
+
+def with_speedup(mission, speedup):
+    config = mission.configuration.to_dict()
+    config['speedup'] = speedup
+    config = mission.system.configuration.from_dict(config)
+    return Mission(config, mission.environment, mission.initial_state,
+                   mission.commands, mission.system)
+
+
+def test_timeout_model_speedup():
+    # wall-clock durations at speedup 10 are a tenth of those at speedup 1
+    missions = [with_speedup(build_mission(i), 10) for i in range(10)]
+    system = missions[0].system
+    model = TimeoutModel(system, quantile=1.0, margin=1.5, min_samples=10)
+    for m in missions:
+        model.observe_trace(m, fake_trace(m, 0.02))
+
+    fast = missions[0]
+    slow = with_speedup(fast, 1)
+    cmd = fast.commands[0]
+    state, env = fast.initial_state, fast.environment
+    budget = cmd.timeout(state, env, slow.configuration)
+    assert model.timeout(cmd, state, env, slow.configuration) == \
+        pytest.approx(budget * 0.2 * 1.5)
+    assert model.timeout(cmd, state, env, fast.configuration) == \
+        pytest.approx(budget * 0.02 * 1.5)
@@ -0,0 +1,56 @@
+import numpy as np
+
+from houston.state import State, var
+from houston.columnar import StateColumns
+from houston.trace import ColumnarTraceRecorder
+
+
+class S(State):
+    foo = var(float, lambda c: 0.0)
+    bar = var(bool, lambda c: False)
+    mode = var(str, lambda c: 'GUIDED')
+
+
+def build_states(num: int, start: int = 0):
+    modes = ['GUIDED', 'AUTO', 'LOITER']
+    return [S(foo=float(i),
+              bar=(i % 2 == 0),
+              mode=modes[i % 3],
+              time_offset=i * 0.1) for i in range(start, start + num)]
+
+
+def test_columnar_recorder():
+    recorder = ColumnarTraceRecorder(S, capacity=2)
+    states_first = build_states(5)
+    for state in states_first:
+        recorder.record_state(state)
+    columns_first, messages = recorder.flush()
+    assert messages == ()
+    assert len(columns_first) == 5
+    assert tuple(columns_first) == tuple(states_first)
+
+    # earlier views must survive buffer growth
+    states_second = build_states(7, start=5)
+    for state in states_second:
+        recorder.record_state(state)
+    columns_second, _ = recorder.flush()
+    assert tuple(columns_first) == tuple(states_first)
+    assert tuple(columns_second) == tuple(states_second)
+    assert columns_second[-1] == states_second[-1]
+
+    empty, _ = recorder.flush()
+    assert len(empty) == 0
+
+
+def test_columns():
+    states = build_states(4)
+    columns = StateColumns.from_states(S, states)
+    assert columns.column('foo').dtype == np.float64
+    assert columns.column('bar').dtype == np.uint8
+    assert columns.column('mode').dtype == np.int32
+    assert columns.values('mode') == ['GUIDED', 'AUTO', 'LOITER', 'GUIDED']
+    assert columns.values('bar') == [True, False, True, False]
+    assert columns.encode('mode', 'AUTO') == 1
+    assert columns.encode('mode', 'LAND') == -1
+    assert tuple(columns[1:3]) == tuple(states[1:3])
+    assert columns[-1].to_dict() == states[-1].to_dict()
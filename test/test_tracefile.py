@@ -0,0 +1,110 @@
+import json
+import random
+
+import pytest
+from bugzoo.core.fileline import FileLineSet
+
+from houston.ardu.copter import ArduCopter
+from houston.exceptions import InvalidTraceFile
+from houston.trace import CommandTrace, MissionTrace
+from houston.tracefile import is_trace_file, read_traces, write_traces, \
+    open_traces, convert_json_traces, dump_traces, load_traces
+
+
+def build_trace(seed: int = 0, num_commands: int = 3) -> MissionTrace:
+    rng = random.Random(seed)
+    cls_state = ArduCopter.state
+    cls_command = ArduCopter.commands['MAV_CMD_NAV_WAYPOINT']
+    commands = []
+    for i in range(num_commands):
+        states = []
+        for j in range(rng.randint(0, 20)):
+            values = {'time_offset': i * 10.0 + j}
+            for name, v in cls_state.variables.items():
+                if v.typ is bool:
+                    values[name] = rng.random() > 0.5
+                elif v.typ is str:
+                    values[name] = rng.choice(['GUIDED', 'AUTO'])
+                else:
+                    values[name] = rng.uniform(-10.0, 10.0)
+            states.append(cls_state(**values))
+        command = cls_command.generate(rng)
+        coverage = FileLineSet({'foo.cpp': {i, i + 1}}) if i else None
+        commands.append(CommandTrace(command, tuple(states), coverage))
+    return MissionTrace(tuple(commands))
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_round_trip(tmp_path, compress):
+    traces = [build_trace(0), build_trace(1)]
+    fn = str(tmp_path / 'traces.htrace')
+    write_traces(fn, traces, ArduCopter, {'mission': 'foo'}, compress)
+    assert is_trace_file(fn)
+
+    metadata, actual = read_traces(fn, ArduCopter)
+    assert metadata == {'mission': 'foo'}
+    assert [t.to_dict() for t in actual] == [t.to_dict() for t in traces]
+
+
+def test_from_file_detects_format(tmp_path):
+    trace = build_trace()
+    fn_json = str(tmp_path / 'trace.json')
+    fn_binary = str(tmp_path / 'trace.htrace')
+    trace.to_file(fn_json)
+    trace.to_file(fn_binary, ArduCopter, compress=True)
+    assert not is_trace_file(fn_json)
+    assert is_trace_file(fn_binary)
+    expected = trace.to_dict()
+    assert MissionTrace.from_file(fn_json, ArduCopter).to_dict() == expected
+    assert MissionTrace.from_file(fn_binary, ArduCopter).to_dict() == expected
+
+
+def test_convert(tmp_path):
+    traces = [build_trace(2), build_trace(3)]
+    fn_json = str(tmp_path / 'traces.json')
+    fn_binary = str(tmp_path / 'traces.htrace')
+    with open(fn_json, 'w') as f:
+        json.dump({'mission': {'foo': 'bar'},
+                   'traces': [t.to_dict() for t in traces]}, f)
+    convert_json_traces(fn_json, fn_binary, ArduCopter)
+    metadata, actual = read_traces(fn_binary, ArduCopter)
+    assert metadata == {'mission': {'foo': 'bar'}}
+    assert [t.to_dict() for t in actual] == [t.to_dict() for t in traces]
+
+    with pytest.raises(InvalidTraceFile):
+        read_traces(fn_json, ArduCopter)
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_lazy_reader(tmp_path, compress):
+    traces = [build_trace(4), build_trace(5)]
+    fn = str(tmp_path / 'traces.htrace')
+    write_traces(fn, traces, ArduCopter, {'mission': 'foo'}, compress)
+
+    with open_traces(fn, ArduCopter) as reader:
+        assert reader.metadata == {'mission': 'foo'}
+        assert len(reader.traces) == 2
+        for expected, actual in zip(traces, reader.traces):
+            last = tuple(c.states[-1] if c.states else None
+                         for c in expected.commands)
+            assert actual.last_states() == last
+            for i, command in enumerate(expected.commands):
+                altitudes = [s.altitude for s in command.states]
+                assert actual.column(i, 'altitude').tolist() == altitudes
+                assert actual.commands[i].command == command.command
+            assert actual.to_dict() == expected.to_dict()
+            assert actual.materialize().to_dict() == expected.to_dict()
+
+    # the traces of a closed reader can no longer be decoded
+    with open_traces(fn, ArduCopter) as reader:
+        lazy = reader.traces[0]
+    with pytest.raises(ValueError):
+        lazy.column(0, 'altitude')
+
+
+def test_dump_and_load():
+    traces = [build_trace(6)]
+    data = dump_traces(traces, ArduCopter, compress=True)
+    metadata, actual = load_traces(data, ArduCopter)
+    assert metadata == {}
+    assert [t.to_dict() for t in actual] == [t.to_dict() for t in traces]